@@ -30,6 +30,7 @@ export const UploadMarksTab = ({ facultyUsername }: UploadMarksTabProps) => {
   const [branch, setBranch] = useState('');
   const [section, setSection] = useState('');
   const [subject, setSubject] = useState('');
+  const [assessment, setAssessment] = useState('');
   const [file, setFile] = useState<File | null>(null);
   const [isUploading, setIsUploading] = useState(false);
 
@@ -106,6 +107,8 @@ export const UploadMarksTab = ({ facultyUsername }: UploadMarksTabProps) => {
       formData.append('section', section.trim());
       formData.append('subject', subject.trim());
       formData.append('uploadedBy', facultyUsername);
+      // Re-uploading under the same name corrects the earlier sheet instead of adding a second copy
+      formData.append('batch', assessment.trim() || file.name.replace(/\.[^.]+$/, ''));
 
       const response = await fetch(`${API_BASE_URL}/api/upload-marks`, {
         method: "POST",
@@ -143,6 +146,7 @@ export const UploadMarksTab = ({ facultyUsername }: UploadMarksTabProps) => {
     setBranch("");
     setSection("");
     setSubject("");
+    setAssessment("");
   };
 
   return (
@@ -154,7 +158,7 @@ export const UploadMarksTab = ({ facultyUsername }: UploadMarksTabProps) => {
         </CardHeader>
         <CardContent className="space-y-8">
           {/* Metadata Fields */}
-          <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-4">
+          <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-5 gap-4">
             <div className="space-y-2">
               <Label>Year <span className="text-destructive">*</span></Label>
               <Select value={year} onValueChange={setYear}>
@@ -197,6 +201,16 @@ export const UploadMarksTab = ({ facultyUsername }: UploadMarksTabProps) => {
                 placeholder="e.g. Data Structures"
               />
             </div>
+
+            <div className="space-y-2">
+              <Label>Assessment</Label>
+              <Input
+                value={assessment}
+                onChange={(e) => setAssessment(e.target.value)}
+                placeholder="e.g. Mid 1 (defaults to file name)"
+              />
+              <p className="text-xs text-muted-foreground">Use the same name to upload a corrected sheet.</p>
+            </div>
           </div>
 
           {/* Drag & Drop Upload Area */}
@@ -0,0 +1,1467 @@
+"""
+Local benchmarks for the Performance Analyzer backend.
+Every benchmark runs against a throwaway SQLite database in a temp directory, so the
+real database.sqlite is never touched. Usage:
+
+    python benchmark.py ingest
+    python benchmark.py ingest --sizes 1000 10000
+    python benchmark.py stream --format xlsx
+    python benchmark.py reupload --sizes 10000 100000 --changed 1
+    python benchmark.py rollback --sizes 10000 100000
+    python benchmark.py queries          # exits non-zero on a query-count regression
+    python benchmark.py plans            # exits non-zero if an endpoint query full-scans a table
+    python benchmark.py load --clients 200   # needs httpx (pip install httpx)
+    python benchmark.py stress --sheets 3000 # exits non-zero on lock errors or lost submissions
+    python benchmark.py submissions --questions 20 50 100
+    python benchmark.py exam-start --students 500
+    python benchmark.py generate --questions 100   # uses the offline generator
+    python benchmark.py generate-batch --sections 20
+    python benchmark.py generation-check   # exits non-zero if chunking, retries or streaming regress
+    python benchmark.py paginate --rows 100000
+    python benchmark.py poll --students 2000   # needs httpx
+    python benchmark.py serialize --students 2000
+    python benchmark.py compress --students 2000 --link-mbps 2   # needs httpx
+    python benchmark.py statistics --students 2000
+    python benchmark.py trends --students 200 --years 4
+    python benchmark.py rescore --prior-tests 10 100 500
+    python benchmark.py scoring --students 50000
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+_tmpdir = tempfile.mkdtemp(prefix="pa-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'benchmark.sqlite')}"
+os.environ["UPLOAD_JOBS_DB"] = os.path.join(_tmpdir, "upload_jobs.sqlite")
+os.environ["UPLOAD_SPOOL_DIR"] = os.path.join(_tmpdir, "upload_spool")
+
+import pandas as pd  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from sqlalchemy import event, func, insert, select  # noqa: E402
+import class_statistics  # noqa: E402
+import compression  # noqa: E402
+import ingestion  # noqa: E402
+import main  # noqa: E402
+import pagination  # noqa: E402
+import question_generation  # noqa: E402
+import trends  # noqa: E402
+
+
+def _call(endpoint, *args):
+    """Runs an async endpoint with its own AsyncSession, as the get_db dependency would."""
+    async def run():
+        try:
+            async with main.AsyncSessionLocal() as db:
+                return await endpoint(*args, db=db)
+        finally:
+            await main.async_engine.dispose()
+    return asyncio.run(run())
+
+
+def _report(label, count, elapsed, unit="rows"):
+    rate = count / elapsed if elapsed > 0 else float("inf")
+    print(f"{label:>28}: {count:>8} {unit} in {elapsed:8.3f}s  ->  {rate:12,.0f} {unit}/s")
+
+
+def _reset_tables(*models):
+    db = main.SessionLocal()
+    try:
+        for model in models:
+            db.query(model).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+@contextmanager
+def count_queries():
+    """Collects the (statement, parameters) pairs issued on the sync and async engines inside the block."""
+    statements = []
+    engines = (main.engine, main.async_engine.sync_engine)
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _record)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", _record)
+
+
+def make_marks_sheet(rows, seed=0):
+    """Builds a synthetic marks sheet shaped like a faculty upload."""
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "Roll Number": [f"21A91A{i:05d}" for i in range(rows)],
+        "Student Name": [f"Student {i}" for i in range(rows)],
+        "Total Marks": [rng.randint(0, 100) for _ in range(rows)],
+    })
+
+
+def seed_test_results(subject, students, tests=5, seed=0):
+    """Creates AI tests for a subject and results for roughly half the students."""
+    rng = random.Random(seed)
+    db = main.SessionLocal()
+    try:
+        test_ids = []
+        for n in range(tests):
+            test = main.Test(testName=f"Bench {n}", subject=subject, year="First Year",
+                             branch="CSE", section="A", numberOfQuestions=20)
+            db.add(test)
+            db.flush()
+            test_ids.append(test.id)
+        db.execute(insert(main.StudentTestResult), [
+            {"student_roll": f"21A91A{i:05d}", "test_id": test_id,
+             "score": rng.randint(0, 20), "total_questions": 20}
+            for i in range(0, students, 2) for test_id in test_ids
+        ])
+        main.rebuild_assessment_aggregates(db)
+        db.commit()
+    finally:
+        db.close()
+
+
+def bench_ingest(args):
+    """Rows per second through the vectorized upload pipeline (score + bulk insert)."""
+    subject = "Data Structures"
+    for size in args.sizes:
+        _reset_tables(main.StudentPerformance, main.StudentTestResult, main.Test)
+        seed_test_results(subject, size)
+        sheet = make_marks_sheet(size)
+
+        db = main.SessionLocal()
+        try:
+            start = time.perf_counter()
+            scored = main.ingest_marks(db, sheet, "First Year", "CSE", "A", subject, "bench")
+            db.commit()
+            elapsed = time.perf_counter() - start
+        finally:
+            db.close()
+        _report(f"ingest {size:,} rows", len(scored), elapsed)
+
+
+def _write_sheet(sheet, fmt):
+    path = os.path.join(_tmpdir, f"sheet.{fmt}")
+    if fmt == "csv":
+        sheet.to_csv(path, index=False)
+    else:
+        sheet.to_excel(path, index=False)
+    return path
+
+
+def _measure(fn):
+    """Runs fn and returns (result, elapsed seconds, peak traced MiB)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+
+def bench_stream(args):
+    """Peak memory and throughput of whole-file vs streaming (batched) ingestion."""
+    subject = "Data Structures"
+    read = pd.read_csv if args.format == "csv" else pd.read_excel
+    for size in args.sizes:
+        path = _write_sheet(make_marks_sheet(size), args.format)
+
+        for mode in ("whole-file", "streaming"):
+            _reset_tables(main.StudentPerformance)
+            db = main.SessionLocal()
+            try:
+                if mode == "whole-file":
+                    run = lambda: len(main.ingest_marks(db, read(path), "First Year", "CSE", "A", subject, "bench"))
+                else:
+                    run = lambda: main.ingest_marks_file(db, path, "First Year", "CSE", "A", subject, "bench")["rows"]
+                rows, elapsed, peak_mib = _measure(run)
+                db.commit()
+            finally:
+                db.close()
+            _report(f"{mode} {size:,} {args.format}", rows, elapsed)
+            print(f"{'':>28}  peak traced memory {peak_mib:8.1f} MiB")
+        os.remove(path)
+
+
+def bench_reupload(args):
+    """Upserting a sheet into its upload batch: first upload, identical re-upload and a corrected re-upload."""
+    subject = "Data Structures"
+    rng = random.Random(0)
+    for size in args.sizes:
+        _reset_tables(main.StudentPerformance, main.ClassPerformance, main.DailyScoreRollup, main.ClassDailyRollup)
+        sheet = make_marks_sheet(size)
+        # Corrections stay below the top mark, so the normalization base and every other row are unchanged
+        corrected = sheet.copy()
+        candidates = corrected.index[corrected["Total Marks"] < corrected["Total Marks"].max() - 1].tolist()
+        fixed = rng.sample(candidates, min(len(candidates), max(1, size * args.changed // 100)))
+        corrected.loc[fixed, "Total Marks"] += 1
+
+        for label, frame in (("first upload", sheet), ("identical re-upload", sheet),
+                             (f"{args.changed}% corrected", corrected)):
+            db = main.SessionLocal()
+            try:
+                start = time.perf_counter()
+                scored = main.ingest_marks(db, frame, "First Year", "CSE", "A", subject, "bench",
+                                           upload_batch="bench")
+                db.commit()
+                elapsed = time.perf_counter() - start
+                stored = db.query(main.StudentPerformance).count()
+            finally:
+                db.close()
+            _report(f"{label} {size:,}", len(scored), elapsed)
+            diff = ingestion.diff_summary(scored)
+            print(f"{'':>28}  {diff['inserted']} inserted, {diff['updated']} updated, "
+                  f"{diff['unchanged']} unchanged; {stored:,} rows stored")
+
+
+
+def bench_rollback(args):
+    """
+    Rolling back and restoring a corrected upload, against the uploads that wrote it, and
+    rolling back a streamed sheet that repeats roll numbers across batches after an
+    identical re-upload of it; exits 1 if that is refused or leaves rows behind.
+    """
+    subject = "Data Structures"
+    failures = 0
+    for size in args.sizes:
+        _reset_tables(main.StudentPerformance, main.StudentPerformanceVersion, main.UploadBatch,
+                      main.ClassPerformance, main.DailyScoreRollup, main.ClassDailyRollup)
+        sheet = make_marks_sheet(size)
+        # Every mark changes, so the second upload replaces every row of the first
+        corrected = sheet.assign(**{"Total Marks": sheet["Total Marks"] + 1})
+        batch_ids = []
+        for label, frame in (("first upload", sheet), ("corrected upload", corrected)):
+            def ingest(db, batch_record, frame=frame):
+                batch_ids.append(batch_record.id)
+                return main.ingest_marks(db, frame, "First Year", "CSE", "A", subject, "bench",
+                                         upload_batch="bench", batch_id=batch_record.id)
+            start = time.perf_counter()
+            scored = main.record_upload(ingest, "sheet", label, "bench", year="First Year", branch="CSE",
+                                        section="A", subject=subject, uploaded_by="bench", row_count=len(frame))
+            _report(f"{label} {size:,}", len(scored), time.perf_counter() - start)
+        for label, action in (("rollback", main.rollback_upload_batch), ("restore", main.restore_upload_batch),
+                              ("rollback again", main.rollback_upload_batch)):
+            start = time.perf_counter()
+            result = action(batch_ids[-1])
+            _report(f"{label} {size:,}", result["rowsRemoved"] + result["rowsRestored"], time.perf_counter() - start)
+        db = main.SessionLocal()
+        try:
+            stored = db.query(main.StudentPerformance).count()
+            versions = db.query(main.StudentPerformanceVersion).count()
+        finally:
+            db.close()
+        print(f"{'':>28}  {stored:,} rows stored, {versions:,} versions kept")
+
+        # A streamed sheet repeating roll numbers in later batches is one write per student,
+        # and rolling it back must leave none of its rows behind, even after an identical
+        # re-upload that wrote nothing
+        _reset_tables(main.StudentPerformance, main.StudentPerformanceVersion, main.UploadBatch,
+                      main.ClassPerformance, main.DailyScoreRollup, main.ClassDailyRollup)
+        repeats = sheet.head(max(1, size // 10))
+        repeats = repeats.assign(**{"Total Marks": repeats["Total Marks"] + 1})
+        path = _write_sheet(pd.concat([sheet, repeats]), "csv")
+
+        def ingest(db, batch_record):
+            return main.ingest_marks_file(db, path, "First Year", "CSE", "A", subject, "bench",
+                                          batch_size=args.batch_size, batch_record=batch_record)
+        stats, again = (
+            main.record_upload(ingest, "stream", ingestion.file_content_hash(path), None, year="First Year",
+                               branch="CSE", section="A", subject=subject, uploaded_by="bench")
+            for _ in range(2)
+        )
+        start = time.perf_counter()
+        try:
+            removed = main.rollback_upload_batch(stats["batchId"])["rowsRemoved"]
+        except main.HTTPException as e:
+            removed = 0
+            print(f"{'':>28}  rollback refused: {e.detail}")
+        elapsed = time.perf_counter() - start
+        db = main.SessionLocal()
+        try:
+            stored = db.query(main.StudentPerformance).count()
+        finally:
+            db.close()
+        ok = (stats["diff"] == {"inserted": size, "updated": 0, "unchanged": 0}
+              and again["diff"] == {"inserted": 0, "updated": 0, "unchanged": size}
+              and removed == size and stored == 0)
+        _report(f"rollback repeated rolls {size:,}", removed, elapsed)
+        print(f"{'':>28}  {stats['diff']}, then {again['diff']}; {stored:,} rows left  {'ok' if ok else 'FAIL'}")
+        if not ok:
+            failures += 1
+    return 1 if failures else 0
+
+
+# Maximum SQL statements an endpoint may issue, independent of how much data it returns
+QUERY_BUDGETS = {
+    "student analytics (cold)": 2,
+    "student analytics (cached)": 0,
+    "test questions (cold)": 3,
+    "test questions (cached)": 2,
+}
+
+
+def bench_queries(args):
+    """Query-count regression check for hot endpoints; exits 1 if any budget is exceeded."""
+    roll = "21A91A00000"
+    _reset_tables(main.StudentPerformance)
+    exam_id = seed_exam(1)
+    seed_test_results("Data Structures", 1, tests=args.tests)
+    db = main.SessionLocal()
+    try:
+        main.ingest_marks(db, make_marks_sheet(1), "First Year", "CSE", "A", "Data Structures", "bench")
+        db.commit()
+    finally:
+        db.close()
+    _call(main.get_test_questions, exam_id, "LOAD00000")  # Assign questions up front
+
+    calls = {
+        "student analytics": lambda: _call(main.get_student_analytics, roll),
+        "test questions": lambda: _call(main.get_test_questions, exam_id, "LOAD00000"),
+    }
+    for cache in main.CACHES.values():
+        cache.clear()
+    failures = 0
+    for label, budget in QUERY_BUDGETS.items():
+        with count_queries() as statements:
+            calls[label.split(" (")[0]]()
+        status = "ok" if len(statements) <= budget else "FAIL"
+        failures += status == "FAIL"
+        print(f"{label:>28}: {len(statements):>3} statements (budget {budget}, {args.tests} tests)  {status}")
+    return 1 if failures else 0
+
+
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def _seed_plan_fixtures(roll):
+    """Creates a small but complete dataset so every audited endpoint has rows to plan against."""
+    _reset_tables(main.StudentPerformance, main.StudentTestResult, main.Test, main.Question,
+                  main.StudentAssignedQuestion, main.Student, main.Job, main.ClassPerformance)
+    seed_test_results("Data Structures", 200)
+    db = main.SessionLocal()
+    try:
+        main.ingest_marks(db, make_marks_sheet(200), "First Year", "CSE", "A", "Data Structures", "bench")
+        db.add(main.Student(name="Bench", rollNumber=roll, password="x", section="A", branch="CSE", year="First Year"))
+        for title in ("SDE", "Analyst"):
+            db.add(main.Job(title=title, description="...", company="Acme", year="First Year",
+                            branch="CSE", section="A", posted_by="TPO"))
+        test_id = db.query(main.Test.id).first()[0]
+        db.execute(insert(main.Question), [
+            {"test_id": test_id, "question": f"Q{n}", "option_a": "a", "option_b": "b",
+             "option_c": "c", "option_d": "d", "correct_answer": "a"}
+            for n in range(20)
+        ])
+        db.commit()
+        return test_id
+    finally:
+        db.close()
+
+
+def _explain(statement, parameters):
+    with main.engine.connect() as conn:
+        return [row[3] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+
+
+def bench_plans(args):
+    """EXPLAIN QUERY PLAN audit: every SELECT issued by a hot endpoint must use an index."""
+    roll = "21A91A00000"
+    test_id = _seed_plan_fixtures(roll)
+    main.student_analytics_cache.clear()
+    _call(main.get_test_questions, test_id, roll)  # First call assigns questions
+
+    def assessment_averages():
+        db = main.SessionLocal()
+        try:
+            main.fetch_assessment_averages(db, "Data Structures")
+        finally:
+            db.close()
+
+    def reupload():
+        # A correction of one row, so both the batch lookup and the latest-upload check run
+        db = main.SessionLocal()
+        try:
+            for marks in (50, 60):
+                sheet = pd.DataFrame({"Roll Number": [roll, "21A91A99999"], "Student Name": ["A", "B"],
+                                      "Total Marks": [marks, 100]})
+                main.ingest_marks(db, sheet, "First Year", "CSE", "A", "Data Structures", "bench",
+                                  upload_batch="plans")
+        finally:
+            db.rollback()
+            db.close()
+
+    def rollback():
+        # Two uploads into one batch, so rolling back the second restores the rows it replaced
+        batch_ids = []
+        for marks in (50, 60):
+            sheet = pd.DataFrame({"Roll Number": [roll], "Student Name": ["A"], "Total Marks": [marks]})
+
+            def ingest(db, batch_record, sheet=sheet):
+                batch_ids.append(batch_record.id)
+                return main.ingest_marks(db, sheet, "First Year", "CSE", "A", "Data Structures", "bench",
+                                         upload_batch="plans-rollback", batch_id=batch_record.id)
+            main.record_upload(ingest, "sheet", f"plans-{marks}", "plans-rollback", year="First Year",
+                               branch="CSE", section="A", subject="Data Structures", uploaded_by="bench")
+        main.rollback_upload_batch(batch_ids[-1])
+        main.restore_upload_batch(batch_ids[-1])
+
+    endpoints = {
+        "student tests": lambda: _call(main.get_student_tests, "First Year", "CSE", "A", roll),
+        "faculty tests": lambda: _call(main.get_faculty_tests, "bench"),
+        # limit=1 leaves a next page, so the total is counted too
+        "faculty tests page": lambda: _call(functools.partial(main.get_faculty_tests_page, limit=1), "bench"),
+        "jobs page by year": lambda: _call(functools.partial(main.get_jobs_page, year="First Year", limit=1)),
+        "test questions": lambda: _call(main.get_test_questions, test_id, roll),
+        "class performance": lambda: _call(main.get_class_performance, "First Year", "CSE", "A"),
+        "class statistics": lambda: _call(main.get_class_statistics, "First Year", "CSE", "A"),
+        "class trends": lambda: _call(main.get_class_trends, "First Year", "CSE", "A", None, None, "day", 30),
+        "student trends": lambda: _call(main.get_student_trends, roll, None, None, "day", 30),
+        "flagged students by class": lambda: _call(functools.partial(
+            main.get_flagged_students, year="First Year", branch="CSE", section="A", limit=1)),
+        "student analytics": lambda: _call(main.get_student_analytics, roll),
+        "student jobs": lambda: _call(main.get_student_jobs, roll),
+        "open test": lambda: _call(main.open_test, test_id),
+        "upload assessment averages": assessment_averages,
+        "re-upload into a batch": reupload,
+        "roll back an upload": rollback,
+    }
+
+    failures = 0
+    for label, run in endpoints.items():
+        # Audit the cold path: cached endpoints would otherwise skip their queries
+        for cache in main.CACHES.values():
+            cache.clear()
+        with count_queries() as statements:
+            run()
+        selects = [(sql, params) for sql, params in statements if sql.lstrip().upper().startswith("SELECT")]
+        scans = sorted({
+            detail for sql, params in selects for detail in _explain(sql, params)
+            # Scans of a subquery's (already bounded) result, e.g. a capped count, are fine
+            if (match := FULL_SCAN.match(detail)) and match.group(1) in main.Base.metadata.tables
+        })
+        failures += bool(scans)
+        status = "FAIL " + ", ".join(scans) if scans else "ok"
+        print(f"{label:>28}: {len(selects)} select(s)  {status}")
+    return 1 if failures else 0
+
+
+def seed_exam(students, questions=20, subject="Data Structures"):
+    """Registers a class of students and creates one test with its question bank. Returns the test id."""
+    _reset_tables(main.Student, main.Test, main.Question, main.StudentAssignedQuestion,
+                  main.StudentAnswer, main.StudentTestResult, main.ClassPerformance, main.AssessmentAggregate)
+    db = main.SessionLocal()
+    try:
+        db.execute(insert(main.Student), [
+            {"name": f"Student {n}", "rollNumber": f"LOAD{n:05d}", "password": "x",
+             "year": "First Year", "branch": "CSE", "section": "A"}
+            for n in range(students)
+        ])
+        test = main.Test(testName="Load", subject=subject, year="First Year", branch="CSE",
+                         section="A", numberOfQuestions=questions, createdBy="bench")
+        db.add(test)
+        db.flush()
+        db.execute(insert(main.Question), [
+            {"test_id": test.id, "question": f"Q{n}", "option_a": f"A{n}", "option_b": f"B{n}",
+             "option_c": f"C{n}", "option_d": f"D{n}", "correct_answer": f"A{n}"}
+            for n in range(questions)
+        ])
+        db.commit()
+        return test.id
+    finally:
+        db.close()
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve_app(port=None, env=None, log_path=None):
+    """
+    Runs the app under uvicorn in a subprocess sharing the benchmark database; yields its
+    base URL. env adds environment overrides; server output goes to log_path if given.
+    """
+    import httpx
+
+    port = port or _free_port()
+    log = open(log_path, "w") if log_path else None
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, **(env or {})},
+        stdout=log, stderr=log,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(100):
+            try:
+                httpx.get(f"{base_url}/openapi.json")
+                break
+            except httpx.TransportError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError("uvicorn did not start")
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait()
+        if log:
+            log.close()
+
+
+def bench_load(args):
+    """p50/p99 latency of exam-window traffic (fetch questions, then submit) at N concurrent clients."""
+    import httpx
+
+    test_id = seed_exam(args.clients)
+    latencies = {"questions": [], "submit": []}
+    failures = []
+
+    async def timed(kind, request):
+        start = time.perf_counter()
+        response = await request
+        latencies[kind].append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            failures.append((kind, response.status_code))
+        return response
+
+    async def student(http, n):
+        roll = f"LOAD{n:05d}"
+        for _ in range(args.rounds):
+            response = await timed("questions", http.get(f"/api/tests/{test_id}/questions",
+                                                          params={"student_roll": roll}))
+        answers = {q["id"]: q["option_a"] for q in response.json()}
+        await timed("submit", http.post(f"/api/tests/{test_id}/submit",
+                                        json={"student_roll": roll, "answers": answers}))
+
+    async def run(base_url):
+        limits = httpx.Limits(max_connections=args.clients)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as http:
+            start = time.perf_counter()
+            await asyncio.gather(*(student(http, n) for n in range(args.clients)))
+            return time.perf_counter() - start
+
+    with serve_app(args.port) as base_url:
+        elapsed = asyncio.run(run(base_url))
+    total = sum(len(v) for v in latencies.values())
+    print(f"{args.clients} concurrent clients, {total} requests in {elapsed:.2f}s ({total / elapsed:,.0f} req/s)")
+    for kind, values in latencies.items():
+        print(f"{kind:>28}: p50 {_percentile(values, 50):8.1f} ms   p99 {_percentile(values, 99):8.1f} ms   "
+              f"mean {statistics.mean(values):8.1f} ms")
+    if failures:
+        print(f"{len(failures)} failed request(s), e.g. {failures[:3]}")
+
+
+def bench_stress(args):
+    """Throughput and lock errors for a burst of concurrently submitted answer sheets."""
+    import httpx
+
+    test_id = seed_exam(args.sheets)
+    db = main.SessionLocal()
+    try:
+        question_ids = [q.id for q in db.query(main.Question).filter(main.Question.test_id == test_id)]
+    finally:
+        db.close()
+    statuses = []
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def submit(http, n):
+        answers = {str(qid): random.choice("ABCD") + str(qid) for qid in question_ids}
+        async with gate:
+            response = await http.post(f"/api/tests/{test_id}/submit",
+                                       json={"student_roll": f"LOAD{n:05d}", "answers": answers})
+        statuses.append(response.status_code)
+
+    async def run(base_url):
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as http:
+            start = time.perf_counter()
+            await asyncio.gather(*(submit(http, n) for n in range(args.sheets)))
+            return time.perf_counter() - start
+
+    log_path = os.path.join(_tmpdir, "stress-server.log")
+    env = {"SUBMISSION_BATCH_SIZE": str(args.batch_size)} if args.batch_size else None
+    with serve_app(args.port, env=env, log_path=log_path) as base_url:
+        elapsed = asyncio.run(run(base_url))
+    with open(log_path) as log:
+        lock_errors = log.read().count("database is locked")
+
+    db = main.SessionLocal()
+    try:
+        stored = db.query(main.StudentTestResult).filter(main.StudentTestResult.test_id == test_id).count()
+    finally:
+        db.close()
+    ok = statuses.count(200)
+    _report(f"{args.concurrency} concurrent", ok, elapsed, unit="sheets")
+    print(f"{'failed requests':>28}: {len(statuses) - ok}")
+    print(f"{'lock errors':>28}: {lock_errors}")
+    print(f"{'results stored':>28}: {stored} of {args.sheets}")
+    return 1 if lock_errors or stored != args.sheets else 0
+
+
+def bench_exam_start(args):
+    """Simulates a whole class opening one test at once, with and without open_test pre-assignment."""
+    rolls = [f"LOAD{n:05d}" for n in range(args.students)]
+
+    async def fetch_all(test_id):
+        latencies = []
+
+        async def fetch(roll):
+            async with main.AsyncSessionLocal() as db:
+                start = time.perf_counter()
+                await main.get_test_questions(test_id, roll, db=db)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        with count_queries() as statements:
+            start = time.perf_counter()
+            await asyncio.gather(*(fetch(roll) for roll in rolls))
+            elapsed = time.perf_counter() - start
+        writes = sum(not sql.lstrip().upper().startswith(("SELECT", "PRAGMA")) for sql, _ in statements)
+        return elapsed, latencies, writes
+
+    # Both scenarios share one event loop: the async engine's pool cannot move between loops
+    async def run():
+        try:
+            for opened in (False, True):
+                test_id = seed_exam(args.students, questions=args.questions)
+                main.question_set_cache.clear()
+                label = "pre-assigned" if opened else "first access"
+                if opened:
+                    start = time.perf_counter()
+                    async with main.AsyncSessionLocal() as db:
+                        result = await main.open_test(test_id, db=db)
+                    _report("open test", result["assignments"], time.perf_counter() - start, unit="assignments")
+                elapsed, latencies, writes = await fetch_all(test_id)
+                _report(f"{label} fetches", len(latencies), elapsed, unit="students")
+                print(f"{'':>28}  p50 {_percentile(latencies, 50):7.1f} ms   p99 {_percentile(latencies, 99):7.1f} ms   "
+                      f"{writes} write statement(s)")
+        finally:
+            await main.async_engine.dispose()
+
+    asyncio.run(run())
+
+
+def bench_generate(args):
+    """Time to create a large test through the chunked generation pipeline, using the offline generator."""
+    generator = question_generation.GENERATORS["offline"]
+    generator.latency = args.latency
+    request = main.TestCreateRequest(
+        testName="Bench", subject="Data Structures", year="First Year", branch="CSE", section="A",
+        numberOfQuestions=args.questions, startTime="", endTime="", createdBy="bench"
+    )
+    settings = [("single prompt", args.questions, 1)] + [
+        (f"chunks of {args.chunk_size}, x{n}", args.chunk_size, n) for n in args.concurrency
+    ]
+
+    async def run():
+        try:
+            for label, chunk_size, concurrency in settings:
+                test = await main.create_test_record(request)
+                start = time.perf_counter()
+                first_chunk = None
+
+                async def on_chunk(questions):
+                    nonlocal first_chunk
+                    await main.store_generated_questions(test.id, questions)
+                    first_chunk = first_chunk or time.perf_counter() - start
+
+                generated = await question_generation.generate_questions(
+                    generator, request.subject, request.difficulty, args.questions, on_chunk, seed=test.id,
+                    chunk_size=chunk_size, concurrency=concurrency
+                )
+                _report(label, generated, time.perf_counter() - start, unit="questions")
+                print(f"{'':>28}  first questions stored after {first_chunk:.2f}s")
+        finally:
+            await main.async_engine.dispose()
+
+    asyncio.run(run())
+
+
+class _ScriptedGenerator(question_generation.OfflineGenerator):
+    """
+    OfflineGenerator whose attempts fail on cue: fail(part, attempt) returns how many
+    questions that attempt delivers before raising, or None to let it succeed. Every
+    request is logged as (part, count, start).
+    """
+
+    def __init__(self, fail):
+        super().__init__()
+        self.fail = fail
+        self.requests = []
+
+    async def _generate(self, subject, difficulty, count, part, parts, seed, start, emit):
+        attempt = sum(1 for logged in self.requests if logged[0] == part)
+        self.requests.append((part, count, start))
+        delivered = self.fail(part, attempt)
+        if delivered is None:
+            return await super()._generate(subject, difficulty, count, part, parts, seed, start, emit)
+        await super()._generate(subject, difficulty, min(delivered, count), part, parts, seed, start, emit)
+        raise RuntimeError(f"scripted failure of chunk {part + 1}")
+
+
+def bench_generation_check(args):
+    """
+    Checks the chunked generation pipeline against the offline generator, without network
+    or API key: chunk splitting, retries that re-request only missing questions, partial
+    results kept when a chunk fails, and the /api/tests/create/stream events. Exits 1 on
+    any failure.
+    """
+    question_generation.RETRY_BACKOFF = 0
+    failures = 0
+
+    def check(label, ok, detail=""):
+        nonlocal failures
+        failures += not ok
+        print(f"{label:>40}: {'ok' if ok else 'FAIL'}  {detail}")
+
+    async def generate(generator, count, chunk_size=10, retries=2):
+        chunks = []
+
+        async def on_chunk(questions):
+            chunks.append(questions)
+        try:
+            generated = await question_generation.generate_questions(
+                generator, "Data Structures", "medium", count, on_chunk, seed=1, chunk_size=chunk_size,
+                concurrency=4, retries=retries, timeout=5
+            )
+            error = None
+        except question_generation.GenerationError as e:
+            generated, error = e.generated, e
+        return generated, error, chunks
+
+    async def create_stream(subject, count):
+        request = main.TestCreateRequest(
+            testName="Check", subject=subject, year="First Year", branch="CSE", section="A",
+            numberOfQuestions=count, startTime="", endTime="", createdBy="bench"
+        )
+        response = await main.create_test_stream(request)
+        return [json.loads(line) async for line in response.body_iterator]
+
+    async def run():
+        sizes = question_generation.chunk_sizes(25, 10)
+        check("chunk sizes", sizes == [10, 10, 5], f"25 by 10 -> {sizes}")
+
+        generated, error, chunks = await generate(question_generation.OfflineGenerator(), 25)
+        hashes = {question_generation.question_hash(q) for chunk in chunks for q in chunk}
+        check("all chunks delivered", error is None and generated == 25 and
+              sorted(map(len, chunks)) == [5, 10, 10], f"{generated} questions in {len(chunks)} chunks")
+        check("questions distinct across chunks", len(hashes) == 25, f"{len(hashes)} distinct")
+
+        # Every chunk's first attempt delivers 4 questions and fails
+        generator = _ScriptedGenerator(lambda part, attempt: 4 if attempt == 0 else None)
+        generated, error, chunks = await generate(generator, 25)
+        retries = sorted(request for request in generator.requests if request[2])
+        check("retries re-request only missing", error is None and generated == 25 and
+              retries == [(0, 6, 4), (1, 6, 4), (2, 1, 4)], f"retry requests {retries}")
+
+        # Chunk 2 fails after 3 questions on both attempts; the other chunks and its 6 are kept
+        generator = _ScriptedGenerator(lambda part, attempt: 3 if part == 1 else None)
+        generated, error, chunks = await generate(generator, 25, retries=1)
+        check("partial results kept on failure", error is not None and generated == 21 and
+              sorted(map(len, chunks)) == [5, 6, 10], f"{generated} delivered, error: {error}")
+
+        previous = main.QUESTION_GENERATOR
+        question_generation.GENERATORS["check"] = _ScriptedGenerator(lambda part, attempt: None)
+        main.QUESTION_GENERATOR = "check"
+        try:
+            events = await create_stream("Generation check", 25)
+            names = [event["event"] for event in events]
+            progress = [event["generated"] for event in events if event["event"] == "progress"]
+            check("stream events", names[0] == "created" and names[-1] == "done" and
+                  progress == sorted(progress) and events[-1]["generated"] == 25 and len(progress) == 3,
+                  f"{names}")
+
+            question_generation.GENERATORS["check"] = _ScriptedGenerator(lambda part, attempt: 2 if part == 0 else None)
+            events = await create_stream("Generation check failing", 25)
+            stored = 15 + min(10, 2 * (main.GENERATION_RETRIES + 1))
+            check("stream error event", events[-1]["event"] == "error" and events[-1]["generated"] == stored,
+                  f"last event {events[-1]['event']}, {events[-1]['generated']} stored")
+        finally:
+            main.QUESTION_GENERATOR = previous
+            del question_generation.GENERATORS["check"]
+            await main.async_engine.dispose()
+
+    asyncio.run(run())
+    return 1 if failures else 0
+
+
+def bench_generate_batch(args):
+    """Tests/s for one test per section: sequential create calls vs one batch call, offline generator."""
+    main.QUESTION_GENERATOR = "offline"
+    generator = question_generation.GENERATORS["offline"]
+    generator.latency = args.latency
+    sections = [main.TestSection(year="First Year", branch="CSE", section=f"S{n}") for n in range(args.sections)]
+    common = dict(testName="Bench", difficulty="medium", numberOfQuestions=args.questions,
+                  startTime="", endTime="", createdBy="bench")
+
+    async def run():
+        try:
+            # Distinct subjects per phase, so neither phase reuses the other's banked questions
+            start = time.perf_counter()
+            for section in sections:
+                await main.create_test(main.TestCreateRequest(subject="Sequential", **common, **section.model_dump()))
+            _report("sequential create", len(sections), time.perf_counter() - start, unit="tests")
+
+            start = time.perf_counter()
+            result = await main.create_tests_batch(
+                main.TestBatchCreateRequest(subject="Batch", sections=sections, **common)
+            )
+            _report("batch create", len(sections), time.perf_counter() - start, unit="tests")
+            print(f"{'failed sections':>28}: {result['failed']}")
+            stats = generator.stats()
+            print(f"{'offline generator':>28}: {stats['calls']} calls, {stats['questions']} questions, "
+                  f"p50 {stats['p50Latency']}s, p95 {stats['p95Latency']}s")
+        finally:
+            await main.async_engine.dispose()
+
+    asyncio.run(run())
+
+
+def seed_list_tables(rows, seed=0):
+    """Fills jobs, teachers, tests and sections with `rows` rows each for the list endpoints."""
+    rng = random.Random(seed)
+    posted = datetime(2026, 1, 1)
+    description = "Responsibilities include " + "designing, building and maintaining services; " * 12
+    db = main.SessionLocal()
+    try:
+        db.execute(insert(main.Job), [
+            {"title": f"Role {n}", "description": description, "company": f"Company {n % 200}",
+             "year": rng.choice(["First Year", "Second Year", "Third Year", "Fourth Year"]),
+             "branch": "CSE", "section": rng.choice("ABC"), "posted_by": "tpo",
+             "posted_at": posted + timedelta(seconds=n // 3)}
+            for n in range(rows)
+        ])
+        db.execute(insert(main.Teacher), [
+            {"name": f"Faculty {n}", "username": f"faculty{n}", "password": "x",
+             "role": "faculty", "subject": f"Subject {n % 40}"}
+            for n in range(rows)
+        ])
+        db.execute(insert(main.Test), [
+            {"testName": f"Test {n}", "subject": f"Subject {n % 40}", "year": "First Year", "branch": "CSE",
+             "section": "A", "numberOfQuestions": 20, "startTime": "", "endTime": "", "createdBy": "bench"}
+            for n in range(rows)
+        ])
+        db.execute(insert(main.Section), [
+            {"name": f"S{n}", "branch": "CSE", "year": "First Year"} for n in range(rows)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+def bench_paginate(args):
+    """Legacy full-list endpoints vs keyset pages (first, deep, OFFSET-equivalent) on large tables."""
+    seed_list_tables(args.rows)
+    deep = args.rows - args.limit * 2
+
+    def payload(response):
+        return len(response.body)
+
+    endpoints = [
+        ("jobs", main.get_all_jobs, {}, main.get_jobs_page, {}, main.Job, (main.Job.posted_at, main.Job.id)),
+        ("teachers", main.get_teachers, {}, main.get_teachers_page, {}, main.Teacher, (main.Teacher.id,)),
+        ("faculty tests", main.get_faculty_tests, {"username": "bench"}, main.get_faculty_tests_page,
+         {"username": "bench"}, main.Test, (main.Test.id,)),
+        ("sections", main.get_sections, {}, main.get_sections_page, {}, main.Section, (main.Section.id,)),
+    ]
+    descending = {"jobs", "faculty tests"}
+
+    async def timed(fn):
+        start = time.perf_counter()
+        result = await fn()
+        return time.perf_counter() - start, result
+
+    async def run():
+        try:
+            async with main.AsyncSessionLocal() as db:
+                for name, legacy, legacy_args, paged, paged_args, model, key in endpoints:
+                    print(f"{name} ({args.rows:,} rows)")
+
+                    async def full_list():
+                        return await legacy(db=db, **legacy_args)
+                    elapsed, result = await timed(full_list)
+                    print(f"{'legacy full list':>28}: {elapsed * 1000:8.1f} ms, {payload(result) / 1e6:7.2f} MB")
+
+                    async def first_page():
+                        return await paged(db=db, limit=args.limit, **paged_args)
+                    elapsed, result = await timed(first_page)
+                    page = json.loads(result.body)
+                    print(f"{'keyset first page':>28}: {elapsed * 1000:8.1f} ms, {payload(result) / 1e3:7.1f} KB"
+                          f"  (total {page['total']:,}, exact={page['totalExact']})")
+
+                    # Cursor at row `deep`, as a client would hold after walking there
+                    order = [column.desc() if name in descending else column for column in key]
+                    cursor_row = (await db.execute(select(*key).order_by(*order).offset(deep).limit(1))).one()
+                    cursor = pagination.encode_cursor(cursor_row)
+
+                    async def deep_page():
+                        return await paged(db=db, limit=args.limit, cursor=cursor, count="none", **paged_args)
+                    elapsed, result = await timed(deep_page)
+                    print(f"{f'keyset page at row {deep:,}':>28}: {elapsed * 1000:8.1f} ms")
+
+                    async def offset_page():
+                        return (await db.execute(
+                            select(model).order_by(*order).offset(deep).limit(args.limit)
+                        )).scalars().all()
+                    elapsed, _ = await timed(offset_page)
+                    print(f"{f'OFFSET page at row {deep:,}':>28}: {elapsed * 1000:8.1f} ms")
+
+                    async def walk():
+                        pages, cursor = 0, None
+                        while True:
+                            response = await paged(db=db, limit=pagination.MAX_PAGE_SIZE, cursor=cursor,
+                                                   count="none", **paged_args)
+                            page = json.loads(response.body)
+                            pages += 1
+                            cursor = page["nextCursor"]
+                            if not cursor:
+                                return pages
+                    elapsed, pages = await timed(walk)
+                    print(f"{f'keyset walk, {pages} pages':>28}: {elapsed * 1000:8.1f} ms")
+        finally:
+            await main.async_engine.dispose()
+
+    asyncio.run(run())
+
+
+def seed_class(students, subjects):
+    """Uploads one marks sheet per subject for First Year / CSE / A."""
+    _reset_tables(main.StudentPerformance, main.ClassPerformance)
+    db = main.SessionLocal()
+    try:
+        for n in range(subjects):
+            main.ingest_marks(db, make_marks_sheet(students, seed=n), "First Year", "CSE", "A", f"Subject {n}", "bench")
+        db.commit()
+    finally:
+        db.close()
+
+
+def bench_poll(args):
+    """Dashboard polling of /api/performance/class: uncached vs cached body vs If-None-Match 304."""
+    import httpx
+
+    seed_class(args.students, args.subjects)
+    url = "/api/performance/class?year=First+Year&branch=CSE&section=A"
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+                etag = (await http.get(url)).headers["etag"]
+                phases = [
+                    # A fresh cache generation per request forces the endpoint to run every time
+                    ("uncached", {}, main.response_cache.bodies.clear),
+                    ("cached body", {}, None),
+                    ("304 revalidation", {"If-None-Match": etag}, None),
+                ]
+                for label, headers, before in phases:
+                    if label != "uncached":
+                        etag = (await http.get(url)).headers["etag"]
+                        headers = {"If-None-Match": etag} if headers else headers
+                    start = time.perf_counter()
+                    size = 0
+                    for _ in range(args.requests):
+                        if before:
+                            before()
+                        response = await http.get(url, headers=headers)
+                        size = len(response.content)
+                    _report(label, args.requests, time.perf_counter() - start, unit="requests")
+                    print(f"{'':>28}  status {response.status_code}, {size:,} byte body")
+        finally:
+            await main.async_engine.dispose()
+
+    asyncio.run(run())
+    print(main.response_cache.stats()["routes"]["/api/performance/class"])
+
+
+def bench_serialize(args):
+    """Encoding cost of a /api/performance/class body: jsonable_encoder + json vs response_model validation vs orjson."""
+    seed_class(args.students, args.subjects)
+    start = time.perf_counter()
+    response = _call(main.get_class_performance, "First Year", "CSE", "A")
+    print(f"{'endpoint':>28}: {(time.perf_counter() - start) * 1000:8.1f} ms  ({len(response.body):,} bytes)")
+    payload = json.loads(response.body)
+
+    encoders = [
+        # FastAPI's path for an endpoint that returns plain dicts without a response_model
+        ("jsonable_encoder + json", lambda: json.dumps(
+            jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode()),
+        ("response_model validation", lambda: main.ClassPerformanceResponse.model_validate(payload).model_dump_json()),
+        ("FastJSONResponse", lambda: main.FastJSONResponse(payload).body),
+    ]
+    for label, encode in encoders:
+        encode()
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            encode()
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"{label:>28}: {elapsed * 1000:8.1f} ms per response")
+
+
+def bench_compress(args):
+    """Size and CPU per compression level for a /api/performance/class body, then served end to end."""
+    import httpx
+
+    seed_class(args.students, args.subjects)
+    body = _call(main.get_class_performance, "First Year", "CSE", "A").body
+    seconds_on_link = lambda size: size * 8 / (args.link_mbps * 1_000_000)
+    print(f"{'identity':>28}: {len(body):>10,} bytes  {'':>14}  {seconds_on_link(len(body)) * 1000:8.0f} ms on the link")
+    levels = {"gzip": args.gzip_levels, "br": args.brotli_levels}
+    for coding in compression.available_encodings():
+        for level in levels[coding]:
+            encoder = compression.ResponseCompressor(gzip_level=level, brotli_level=level)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                compressed = encoder.compress(coding, body)
+            elapsed = (time.perf_counter() - start) / args.repeat
+            print(f"{f'{coding} level {level}':>28}: {len(compressed):>10,} bytes  {elapsed * 1000:8.1f} ms cpu  "
+                  f"{seconds_on_link(len(compressed)) * 1000:8.0f} ms on the link")
+    if "br" not in compression.available_encodings():
+        print("(brotli not installed: pip install brotli to compare it)")
+
+    url = "/api/performance/class?year=First+Year&branch=CSE&section=A"
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+                for coding in ("identity",) + compression.available_encodings():
+                    headers = {"Accept-Encoding": coding}
+                    for label, before in (("uncached", main.response_cache.bodies.clear), ("cached", None)):
+                        await http.get(url, headers=headers)
+                        start = time.perf_counter()
+                        for _ in range(args.requests):
+                            if before:
+                                before()
+                            # Raw bytes, so the client's decompression is not part of the timing
+                            async with http.stream("GET", url, headers=headers) as response:
+                                size = sum([len(chunk) async for chunk in response.aiter_raw()])
+                        _report(f"{coding} {label}", args.requests, time.perf_counter() - start, unit="requests")
+                    print(f"{'':>28}  {size:,} bytes on the wire")
+        finally:
+            await main.async_engine.dispose()
+
+    asyncio.run(run())
+    print(main.response_compressor.stats()["encodings"])
+
+
+def bench_statistics(args):
+    """Class statistics endpoint: query + vectorized compute vs cached, against shipping the whole class."""
+    seed_class(args.students, args.subjects)
+    endpoint = functools.partial(main.get_class_statistics, bins=10, percentiles=None)
+
+    main.class_statistics_cache.clear()
+    start = time.perf_counter()
+    body = _call(endpoint, "First Year", "CSE", "A").body
+    print(f"{'cold (query + compute)':>28}: {(time.perf_counter() - start) * 1000:8.1f} ms  ({len(body):,} bytes)")
+
+    frame = asyncio.run(_load_class_scores("First Year", "CSE", "A"))
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        class_statistics.subject_statistics(frame)
+    elapsed = (time.perf_counter() - start) / args.repeat
+    print(f"{'compute only':>28}: {elapsed * 1000:8.1f} ms  ({len(frame):,} scores)")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        _call(endpoint, "First Year", "CSE", "A")
+    elapsed = (time.perf_counter() - start) / args.repeat
+    print(f"{'cached':>28}: {elapsed * 1000:8.1f} ms")
+
+    summary = json.loads(body)
+    for subject in summary["subjects"]:
+        subject.pop("students")
+    print(f"{'summary without students':>28}: {len(json.dumps(summary)):,} bytes")
+    class_body = _call(main.get_class_performance, "First Year", "CSE", "A").body
+    print(f"{'whole class (old way)':>28}: {len(class_body):,} bytes")
+
+
+async def _load_class_scores(year, branch, section):
+    try:
+        async with main.AsyncSessionLocal() as db:
+            return await main.load_class_scores(db, year, branch, section)
+    finally:
+        await main.async_engine.dispose()
+
+
+def bench_trends(args):
+    """Trend endpoints over a multi-year upload history: daily rollups vs recomputing from raw rows."""
+    _reset_tables(main.StudentPerformance, main.DailyScoreRollup, main.ClassDailyRollup)
+    rng = random.Random(0)
+    start_day = datetime(2022, 1, 1)
+    uploads = range(0, args.years * 365, args.every_days)
+    rows = [
+        {"rollNumber": f"TR{n:05d}", "name": f"Student {n}", "totalMarks": score, "normalized_score": score,
+         "subject": f"Subject {s}", "year": "First Year", "branch": "CSE", "section": "A", "uploadedBy": "bench",
+         "uploadedAt": start_day + timedelta(days=day)}
+        for day in uploads for s in range(args.subjects) for n in range(args.students)
+        for score in (rng.uniform(30, 100),)
+    ]
+    db = main.SessionLocal()
+    try:
+        for offset in range(0, len(rows), 50_000):
+            db.execute(insert(main.StudentPerformance), rows[offset:offset + 50_000])
+        db.commit()
+        start = time.perf_counter()
+        main.rebuild_daily_rollups(db)
+        db.commit()
+        _report("rebuild rollups", len(rows), time.perf_counter() - start)
+        rollups = db.query(main.DailyScoreRollup).count()
+        class_rollups = db.query(main.ClassDailyRollup).count()
+    finally:
+        db.close()
+    print(f"{'':>28}  {len(rows):,} raw scores -> {rollups:,} student and {class_rollups:,} class rollup rows")
+
+    async def raw_class_trend():
+        # What the endpoint would cost without rollups: every raw score of the class
+        async with main.AsyncSessionLocal() as db:
+            sp = main.StudentPerformance
+            raw = (await db.execute(select(sp.subject, sp.uploadedAt, sp.normalized_score).where(
+                sp.year == "First Year", sp.branch == "CSE", sp.section == "A"
+            ))).all()
+        frame = pd.DataFrame.from_records(raw, columns=["subject", "day", "score_sum"]).assign(score_count=1)
+        frame["day"] = frame["day"].dt.normalize()
+        return trends.compute_trends(frame)
+
+    async def run():
+        try:
+            timings = {}
+            for label, call in (
+                ("class trend (raw rows)", raw_class_trend),
+                ("class trend (rollups)", lambda: main.get_class_trends(
+                    "First Year", "CSE", "A", None, None, "day", 30, db=session)),
+                ("class trend by month", lambda: main.get_class_trends(
+                    "First Year", "CSE", "A", None, None, "month", 90, db=session)),
+                ("student trend (rollups)", lambda: main.get_student_trends(
+                    "TR00000", None, None, "day", 30, db=session)),
+            ):
+                async with main.AsyncSessionLocal() as session:
+                    await call()
+                    start = time.perf_counter()
+                    for _ in range(args.repeat):
+                        await call()
+                    timings[label] = (time.perf_counter() - start) / args.repeat
+            return timings
+        finally:
+            await main.async_engine.dispose()
+
+    for label, elapsed in asyncio.run(run()).items():
+        print(f"{label:>28}: {elapsed * 1000:8.1f} ms")
+
+
+def bench_rescore(args):
+    """Keeping combined scores current on submission: running sums vs re-averaging every past result."""
+    rng = random.Random(0)
+    for prior in args.prior_tests:
+        test_id = seed_exam(args.students)
+        _reset_tables(main.StudentPerformance)
+        db = main.SessionLocal()
+        try:
+            question_ids = [q.id for q in db.query(main.Question).filter(main.Question.test_id == test_id)]
+            db.execute(insert(main.StudentPerformance), [
+                {"rollNumber": f"LOAD{n:05d}", "name": f"Student {n}", "totalMarks": 60.0, "normalized_score": 60.0,
+                 "assessment_score": 0.0, "final_combined_score": 60.0, "performance_category": "Average",
+                 "subject": "Data Structures", "year": "First Year", "branch": "CSE", "section": "A"}
+                for n in range(args.students)
+            ])
+            db.execute(insert(main.StudentTestResult), [
+                {"student_roll": f"LOAD{n:05d}", "test_id": test_id, "score": rng.randint(0, 20),
+                 "total_questions": 20}
+                for n in range(args.students) for _ in range(prior)
+            ])
+            main.rebuild_class_performance(db)
+            main.rebuild_assessment_aggregates(db)
+            db.commit()
+            watermark = db.scalar(select(func.max(main.StudentTestResult.id)))
+        finally:
+            db.close()
+        requests = [
+            main.SubmitTestRequest(student_roll=f"LOAD{n:05d}", answers={str(qid): "A0" for qid in question_ids})
+            for n in range(args.students)
+        ]
+
+        async def run():
+            try:
+                start = time.perf_counter()
+                await asyncio.gather(*(main.submit_test(test_id, request) for request in requests))
+                return time.perf_counter() - start
+            finally:
+                await main.submission_writer.stop()
+                await main.async_engine.dispose()
+
+        elapsed = asyncio.run(run())
+        _report(f"submit, {prior} prior tests", args.students, elapsed, unit="sheets")
+        # What the same submissions would cost to fold in by averaging each student's results again
+        db = main.SessionLocal()
+        try:
+            start = time.perf_counter()
+            main.rescore_uploads(db, watermark)
+            elapsed = time.perf_counter() - start
+            db.rollback()
+        finally:
+            db.close()
+        _report(f"re-average, {prior} prior", args.students, elapsed, unit="students")
+
+
+def bench_scoring(args):
+    """The scoring job over a large cohort: a full rescore plus flags, then an incremental run."""
+    _reset_tables(main.StudentPerformance, main.ClassPerformance, main.StudentTestResult, main.Test,
+                  main.DailyScoreRollup, main.ClassDailyRollup, main.ScoringRun, main.StudentFlag)
+    rng = random.Random(0)
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    # Uploads every 20 days up to today; one student in twenty loses ground in every subject
+    days = [today - timedelta(days=20 * k) for k in reversed(range(args.uploads))]
+    declining = {n for n in range(args.students) if n % 20 == 0}
+    db = main.SessionLocal()
+    try:
+        # Sections of 500 students, each with one test per subject
+        sections = [f"S{n:03d}" for n in range((args.students + 499) // 500)]
+        tests = {(section, s): main.Test(testName=f"Bench {s}", subject=f"Subject {s}", year="First Year",
+                                         branch="CSE", section=section, numberOfQuestions=20, createdBy="bench")
+                 for section in sections for s in range(args.subjects)}
+        db.add_all(tests.values())
+        db.flush()
+        test_ids = {key: test.id for key, test in tests.items()}
+        rows, results = [], []
+        for n in range(args.students):
+            section = sections[n // 500]
+            for s in range(args.subjects):
+                base = rng.uniform(50, 95)
+                for k, day in enumerate(days):
+                    score = base - 12 * k if n in declining else base + rng.uniform(-5, 5)
+                    rows.append({"rollNumber": f"SC{n:05d}", "name": f"Student {n}", "totalMarks": score,
+                                 "normalized_score": score, "assessment_score": 0.0, "final_combined_score": score,
+                                 "performance_category": "Average", "subject": f"Subject {s}",
+                                 "year": "First Year", "branch": "CSE", "section": section, "uploadedBy": "bench",
+                                 "uploadedAt": day})
+                # A test on the day of the latest upload, scored in line with it
+                results.append({"student_roll": f"SC{n:05d}", "test_id": test_ids[section, s],
+                                "score": min(max(round(score / 5), 0), 20), "total_questions": 20,
+                                "submitted_at": days[-1]})
+        for offset in range(0, len(rows), 50_000):
+            db.execute(insert(main.StudentPerformance), rows[offset:offset + 50_000])
+        db.execute(insert(main.StudentTestResult), results)
+        main.rebuild_class_performance(db)
+        main.rebuild_daily_rollups(db)
+        main.rebuild_assessment_aggregates(db)
+        db.commit()
+    finally:
+        db.close()
+    print(f"{'':>28}  {args.students:,} students, {len(rows):,} uploaded scores, {len(results):,} test results")
+
+    # Uploads were scored before any test was taken, so the first run rescores every row
+    summary = main.run_scoring_job(full=True)
+    _report("full run", summary["rowsRescored"], summary["seconds"])
+    print(f"{'':>28}  {summary['studentsFlagged']:,} students flagged")
+    summary = main.run_scoring_job(full=True)
+    _report("full run, nothing changed", summary["rowsRescored"], summary["seconds"])
+
+    db = main.SessionLocal()
+    try:
+        new_results = [
+            {"student_roll": f"SC{n:05d}", "test_id": test_ids[sections[n // 500], 0], "score": rng.randint(5, 20),
+             "total_questions": 20, "submitted_at": days[-1]}
+            for n in rng.sample(range(args.students), args.new_results)
+        ]
+        db.execute(insert(main.StudentTestResult), new_results)
+        # As the submit path does, which queues the students for the next flag pass
+        main.mark_students_changed(db, [row["student_roll"] for row in new_results])
+        db.commit()
+    finally:
+        db.close()
+    summary = main.run_scoring_job()
+    _report(f"incremental run ({args.new_results})", summary["rowsRescored"], summary["seconds"])
+
+    start = time.perf_counter()
+    page = _call(main.get_flagged_students, "First Year", "CSE", "S000", None, 50, None, "estimate")
+    elapsed = time.perf_counter() - start
+    print(f"{'flagged page (one class)':>28}: {elapsed * 1000:8.1f} ms, {len(json.loads(page.body)['items'])} items")
+
+
+def bench_submissions(args):
+    """Submissions/s through the coalesced submit path for tests of different lengths."""
+    for questions in args.questions:
+        test_id = seed_exam(args.sheets, questions=questions)
+        main.question_set_cache.clear()
+        db = main.SessionLocal()
+        try:
+            question_ids = [q.id for q in db.query(main.Question).filter(main.Question.test_id == test_id)]
+        finally:
+            db.close()
+        requests = [
+            main.SubmitTestRequest(
+                student_roll=f"LOAD{n:05d}",
+                answers={str(qid): random.choice("ABCD") + str(qid) for qid in question_ids}
+            )
+            for n in range(args.sheets)
+        ]
+
+        async def run():
+            try:
+                start = time.perf_counter()
+                await asyncio.gather(*(main.submit_test(test_id, request) for request in requests))
+                return time.perf_counter() - start
+            finally:
+                await main.submission_writer.stop()
+                await main.async_engine.dispose()
+
+        elapsed = asyncio.run(run())
+        _report(f"{questions} questions", args.sheets, elapsed, unit="sheets")
+        _report(f"{questions} questions", args.sheets * questions, elapsed, unit="answers")
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest = sub.add_parser("ingest", help=bench_ingest.__doc__)
+    ingest.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ingest.set_defaults(func=bench_ingest)
+
+    stream = sub.add_parser("stream", help=bench_stream.__doc__)
+    stream.add_argument("--sizes", type=int, nargs="+", default=[10_000, 50_000, 100_000])
+    stream.add_argument("--format", choices=["csv", "xlsx"], default="csv")
+    stream.set_defaults(func=bench_stream)
+
+    reupload = sub.add_parser("reupload", help=bench_reupload.__doc__)
+    reupload.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    reupload.add_argument("--changed", type=int, default=1, help="Percent of rows corrected in the last upload")
+    reupload.set_defaults(func=bench_reupload)
+
+    rollback = sub.add_parser("rollback", help=bench_rollback.__doc__)
+    rollback.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    rollback.add_argument("--batch-size", type=int, default=ingestion.STREAM_BATCH_SIZE,
+                          help="Streaming batch size for the repeated-rolls sheet")
+    rollback.set_defaults(func=bench_rollback)
+
+    queries = sub.add_parser("queries", help=bench_queries.__doc__)
+    queries.add_argument("--tests", type=int, default=50)
+    queries.set_defaults(func=bench_queries)
+
+    plans = sub.add_parser("plans", help=bench_plans.__doc__)
+    plans.set_defaults(func=bench_plans)
+
+    load = sub.add_parser("load", help=bench_load.__doc__)
+    load.add_argument("--clients", type=int, default=200)
+    load.add_argument("--rounds", type=int, default=3, help="Question fetches per client before submitting")
+    load.add_argument("--port", type=int, default=None, help="Defaults to a free port")
+    load.set_defaults(func=bench_load)
+
+    exam_start = sub.add_parser("exam-start", help=bench_exam_start.__doc__)
+    exam_start.add_argument("--students", type=int, default=500)
+    exam_start.add_argument("--questions", type=int, default=20)
+    exam_start.set_defaults(func=bench_exam_start)
+
+    generate = sub.add_parser("generate", help=bench_generate.__doc__)
+    generate.add_argument("--questions", type=int, default=100)
+    generate.add_argument("--chunk-size", type=int, default=10)
+    generate.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 10])
+    generate.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per generated question")
+    generate.set_defaults(func=bench_generate)
+
+    generation_check = sub.add_parser("generation-check", help=bench_generation_check.__doc__)
+    generation_check.set_defaults(func=bench_generation_check)
+
+    generate_batch = sub.add_parser("generate-batch", help=bench_generate_batch.__doc__)
+    generate_batch.add_argument("--sections", type=int, default=20)
+    generate_batch.add_argument("--questions", type=int, default=30)
+    generate_batch.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per generated question")
+    generate_batch.set_defaults(func=bench_generate_batch)
+
+    paginate = sub.add_parser("paginate", help=bench_paginate.__doc__)
+    paginate.add_argument("--rows", type=int, default=100_000)
+    paginate.add_argument("--limit", type=int, default=50)
+    paginate.set_defaults(func=bench_paginate)
+
+    poll = sub.add_parser("poll", help=bench_poll.__doc__)
+    poll.add_argument("--students", type=int, default=2000)
+    poll.add_argument("--subjects", type=int, default=6)
+    poll.add_argument("--requests", type=int, default=20)
+    poll.set_defaults(func=bench_poll)
+
+    serialize = sub.add_parser("serialize", help=bench_serialize.__doc__)
+    serialize.add_argument("--students", type=int, default=2000)
+    serialize.add_argument("--subjects", type=int, default=6)
+    serialize.add_argument("--repeat", type=int, default=10)
+    serialize.set_defaults(func=bench_serialize)
+
+    compress = sub.add_parser("compress", help=bench_compress.__doc__)
+    compress.add_argument("--students", type=int, default=2000)
+    compress.add_argument("--subjects", type=int, default=6)
+    compress.add_argument("--gzip-levels", type=int, nargs="+", default=[1, 6, 9])
+    compress.add_argument("--brotli-levels", type=int, nargs="+", default=[1, 5, 9, 11])
+    compress.add_argument("--link-mbps", type=float, default=2.0, help="Link speed for the transfer-time estimate")
+    compress.add_argument("--repeat", type=int, default=5)
+    compress.add_argument("--requests", type=int, default=20)
+    compress.set_defaults(func=bench_compress)
+
+    stats = sub.add_parser("statistics", help=bench_statistics.__doc__)
+    stats.add_argument("--students", type=int, default=2000)
+    stats.add_argument("--subjects", type=int, default=6)
+    stats.add_argument("--repeat", type=int, default=10)
+    stats.set_defaults(func=bench_statistics)
+
+    trend = sub.add_parser("trends", help=bench_trends.__doc__)
+    trend.add_argument("--students", type=int, default=200)
+    trend.add_argument("--subjects", type=int, default=6)
+    trend.add_argument("--years", type=int, default=4)
+    trend.add_argument("--every-days", type=int, default=14, help="Days between uploads of each subject")
+    trend.add_argument("--repeat", type=int, default=5)
+    trend.set_defaults(func=bench_trends)
+
+    rescore = sub.add_parser("rescore", help=bench_rescore.__doc__)
+    rescore.add_argument("--students", type=int, default=1000)
+    rescore.add_argument("--prior-tests", type=int, nargs="+", default=[10, 100, 500])
+    rescore.set_defaults(func=bench_rescore)
+
+    scoring = sub.add_parser("scoring", help=bench_scoring.__doc__)
+    scoring.add_argument("--students", type=int, default=50_000)
+    scoring.add_argument("--subjects", type=int, default=6)
+    scoring.add_argument("--uploads", type=int, default=4, help="Uploads of each subject, 20 days apart")
+    scoring.add_argument("--new-results", type=int, default=1000, help="Test results added before the incremental run")
+    scoring.set_defaults(func=bench_scoring)
+
+    submissions = sub.add_parser("submissions", help=bench_submissions.__doc__)
+    submissions.add_argument("--questions", type=int, nargs="+", default=[20, 50, 100])
+    submissions.add_argument("--sheets", type=int, default=2000)
+    submissions.set_defaults(func=bench_submissions)
+
+    stress = sub.add_parser("stress", help=bench_stress.__doc__)
+    stress.add_argument("--sheets", type=int, default=3000)
+    stress.add_argument("--concurrency", type=int, default=500)
+    stress.add_argument("--batch-size", type=int, default=None,
+                        help="Override SUBMISSION_BATCH_SIZE; 1 disables coalescing")
+    stress.add_argument("--port", type=int, default=None, help="Defaults to a free port")
+    stress.set_defaults(func=bench_stress)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
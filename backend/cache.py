@@ -0,0 +1,95 @@
+"""
+In-process caches for hot read paths.
+Caches are bounded LRUs guarded by a lock, since they are shared between the event
+loop and threadpool/upload-job workers, and they count hits and misses for metrics.
+"""
+
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU cache with hit/miss counters.
+
+    Readers that compute a value from the database should capture `generation` before
+    querying and pass it to set(); if any invalidation happened in between, the value
+    may already be stale and is not stored.
+
+    With weigh (value -> size) and max_weight, entries are also evicted to keep their
+    total size under max_weight; a single value heavier than that is not stored.
+    """
+
+    def __init__(self, name, maxsize=1024, weigh=None, max_weight=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.weigh = weigh
+        self.max_weight = max_weight
+        self.weight = 0
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _weigh(self, value):
+        return self.weigh(value) if self.weigh else 0
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            weight = self._weigh(value)
+            if self.max_weight is not None and weight > self.max_weight:
+                return
+            if key in self._data:
+                self.weight -= self._weigh(self._data[key])
+            self._data[key] = value
+            self._data.move_to_end(key)
+            self.weight += weight
+            while len(self._data) > self.maxsize or (self.max_weight is not None and self.weight > self.max_weight):
+                _, evicted = self._data.popitem(last=False)
+                self.weight -= self._weigh(evicted)
+                self.evictions += 1
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self.generation += 1
+            for key in keys:
+                if key in self._data:
+                    self.weight -= self._weigh(self._data.pop(key))
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            **({"weight": self.weight, "maxWeight": self.max_weight} if self.max_weight is not None else {}),
+            "hitRatio": round(self.hits / lookups, 4) if lookups else None
+        }
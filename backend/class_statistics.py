@@ -0,0 +1,113 @@
+"""
+Vectorized class statistics over uploaded marks.
+Takes one score per (student, subject) as a DataFrame and computes every subject's
+summary, percentiles, histogram, category counts and per-student rank in grouped
+pandas/NumPy operations, so a class of thousands is summarized without per-student
+Python loops.
+"""
+
+import numpy as np
+import pandas as pd
+
+import ingestion
+
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+DEFAULT_BINS = 10
+MAX_BINS = 100
+# Scores are percentages; histograms always span this range so classes compare bin for bin
+SCORE_RANGE = (0.0, 100.0)
+
+
+def _rounded(values, digits=2):
+    return np.round(np.asarray(values, dtype=float), digits).tolist()
+
+
+def rank_students(frame):
+    """
+    Adds rank and percentile columns to a frame of (rollNumber, subject, score) rows.
+    Rank is 1 for the top score in a subject, and tied scores share the best rank
+    (1, 2, 2, 4). Percentile is the share of the subject's students scoring at or
+    below the student.
+    """
+    scores = frame.groupby("subject", sort=False)["score"]
+    return frame.assign(
+        rank=scores.rank(method="min", ascending=False).astype(int),
+        percentile=scores.rank(method="max", pct=True) * 100
+    )
+
+
+def subject_statistics(frame, percentiles=DEFAULT_PERCENTILES, bins=DEFAULT_BINS):
+    """
+    Summarizes a frame with rollNumber, name, subject, score and category columns,
+    one row per student and subject. Returns {subject: statistics dict} in
+    first-appearance order. Standard deviation is the population one (ddof=0), since
+    a class is the whole population rather than a sample of it.
+    """
+    if frame.empty:
+        return {}
+    frame = rank_students(frame)
+    codes, subjects = pd.factorize(frame["subject"])
+    scores = frame["score"]
+    grouped = scores.groupby(codes)
+    summary = pd.DataFrame({
+        "count": grouped.count(), "mean": grouped.mean(), "median": grouped.median(),
+        "std": grouped.std(ddof=0), "min": grouped.min(), "max": grouped.max()
+    }).to_numpy()
+    quantiles = grouped.quantile([p / 100 for p in percentiles]).unstack().to_numpy()
+
+    # Per-subject histograms and category counts from one bincount over (subject, bin) cells
+    edges = np.linspace(*SCORE_RANGE, bins + 1)
+    bin_index = np.digitize(scores.clip(*SCORE_RANGE).to_numpy(), edges[1:-1])
+    histograms = np.bincount(codes * bins + bin_index, minlength=len(subjects) * bins).reshape(-1, bins)
+    labels = [label for _, label in ingestion.PERFORMANCE_CATEGORIES] + [ingestion.DEFAULT_CATEGORY]
+    category_index = pd.Categorical(frame["category"], categories=labels).codes
+    known = category_index >= 0
+    categories = np.bincount(
+        codes[known] * len(labels) + category_index[known], minlength=len(subjects) * len(labels)
+    ).reshape(-1, len(labels))
+
+    # Students by subject, then rank, then roll number; each subject is one contiguous slice
+    order = np.lexsort((frame["rollNumber"].to_numpy(), frame["rank"].to_numpy(), codes))
+    bounds = np.searchsorted(codes[order], np.arange(len(subjects) + 1))
+    rolls = frame["rollNumber"].to_numpy()[order].tolist()
+    names = frame["name"].to_numpy()[order].tolist()
+    ranked_scores = _rounded(scores.to_numpy()[order])
+    ranks = frame["rank"].to_numpy()[order].tolist()
+    percentile_ranks = _rounded(frame["percentile"].to_numpy()[order])
+    edges = _rounded(edges)
+    percentile_names = [f"p{p:g}" for p in percentiles]
+
+    statistics = {}
+    for code, subject in enumerate(subjects):
+        count, mean, median, std, low, high = summary[code]
+        start, end = bounds[code], bounds[code + 1]
+        statistics[subject] = {
+            "subject": subject,
+            "count": int(count),
+            "mean": round(float(mean), 2),
+            "median": round(float(median), 2),
+            "std": round(float(std), 2),
+            "min": round(float(low), 2),
+            "max": round(float(high), 2),
+            "percentiles": dict(zip(percentile_names, _rounded(quantiles[code]))),
+            "histogram": {"edges": edges, "counts": histograms[code].tolist()},
+            "categories": dict(zip(labels, categories[code].tolist())),
+            "students": [
+                {"rollNumber": roll, "name": name, "score": score, "rank": rank, "percentile": percentile}
+                for roll, name, score, rank, percentile in zip(
+                    rolls[start:end], names[start:end], ranked_scores[start:end],
+                    ranks[start:end], percentile_ranks[start:end]
+                )
+            ]
+        }
+    return statistics
+
+
+def parse_percentiles(value):
+    """Parses a comma-separated ?percentiles= list such as "10,50,90"; raises ValueError if invalid."""
+    if not value:
+        return DEFAULT_PERCENTILES
+    percentiles = tuple(sorted({float(p) for p in value.split(",") if p.strip()}))
+    if not percentiles or any(not 0 <= p <= 100 for p in percentiles):
+        raise ValueError("percentiles must be numbers between 0 and 100")
+    return percentiles
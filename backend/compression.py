@@ -0,0 +1,215 @@
+"""
+Response compression negotiated from Accept-Encoding.
+Complete JSON and text bodies of at least minimum_size bytes are sent gzip- or
+Brotli-encoded (Brotli needs the optional `brotli` package). Bodies carrying an ETag
+from the response cache are compressed once per ETag and encoding and then served from
+an LRU, so a large dashboard body that is requested over and over costs its compression
+time once. Streamed responses (NDJSON progress, exports) are passed through untouched,
+since buffering them would hold back every line until the end.
+"""
+
+import gzip
+import re
+import threading
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from cache import LRUCache
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# Bodies at least this large are compressed in the threadpool instead of on the event loop
+THREADPOOL_MIN_SIZE = 64 * 1024
+
+
+def _gzip(body, level):
+    # mtime=0 keeps the output identical for identical bodies
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def _brotli(body, level):
+    return brotli.compress(body, quality=level)
+
+
+def available_encodings():
+    """Supported codings in server preference order."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(accept_encoding, available):
+    """
+    Picks the coding to use for an Accept-Encoding header value, or None for identity.
+    The client's highest q-value wins; ties go to the earlier entry of available.
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        match = re.search(r"q\s*=\s*([0-9.]+)", params)
+        try:
+            weights[coding] = float(match.group(1)) if match else 1.0
+        except ValueError:
+            weights[coding] = 0.0
+    best, best_weight = None, 0.0
+    for coding in available:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+class ResponseCompressor:
+    """
+    Compression settings, the compressed-variant LRU and per-coding counters. Held
+    outside the middleware so main.py can report and clear it.
+    """
+
+    def __init__(self, minimum_size=1024, gzip_level=6, brotli_level=5, maxsize=256,
+                 max_bytes=32 * 1024 * 1024):
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_level}
+        self.encoders = {"gzip": _gzip, "br": _brotli}
+        self.encodings = available_encodings()
+        self.variants = LRUCache("compressed_responses", maxsize=maxsize, weigh=len, max_weight=max_bytes)
+        self.counters = {coding: {"responses": 0, "cached": 0, "bytesIn": 0, "bytesOut": 0, "seconds": 0.0}
+                         for coding in self.encodings}
+        self.skipped = {"small": 0, "incompressible": 0, "streamed": 0}
+        self._lock = threading.Lock()
+
+    def compress(self, coding, body):
+        start = time.perf_counter()
+        compressed = self.encoders[coding](body, self.levels[coding])
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            counters = self.counters[coding]
+            counters["responses"] += 1
+            counters["bytesIn"] += len(body)
+            counters["bytesOut"] += len(compressed)
+            counters["seconds"] += elapsed
+        return compressed
+
+    async def encode(self, coding, body, etag=None):
+        """Returns body compressed with coding, reusing the variant cached for etag if there is one."""
+        key = (etag, coding)
+        if etag is not None:
+            cached = self.variants.get(key)
+            if cached is not None:
+                with self._lock:
+                    self.counters[coding]["cached"] += 1
+                return cached
+        generation = self.variants.generation
+        if len(body) >= THREADPOOL_MIN_SIZE:
+            compressed = await run_in_threadpool(self.compress, coding, body)
+        else:
+            compressed = self.compress(coding, body)
+        if etag is not None:
+            self.variants.set(key, compressed, generation)
+        return compressed
+
+    def stats(self):
+        encodings = {}
+        for coding, counters in self.counters.items():
+            compressed = counters["responses"]
+            encodings[coding] = {
+                **counters,
+                "level": self.levels[coding],
+                "seconds": round(counters["seconds"], 4),
+                "ratio": round(counters["bytesOut"] / counters["bytesIn"], 4) if counters["bytesIn"] else None,
+                "msPerResponse": round(counters["seconds"] * 1000 / compressed, 3) if compressed else None
+            }
+        return {
+            "minimumSize": self.minimum_size,
+            "encodings": encodings,
+            "skipped": dict(self.skipped),
+            "variants": self.variants.stats()
+        }
+
+
+def _compressible(headers):
+    content_type = b""
+    for name, value in headers:
+        if name == b"content-encoding":
+            return False
+        if name == b"content-type":
+            content_type = value
+    return content_type.decode("latin-1").startswith(COMPRESSIBLE_TYPES)
+
+
+def _with_vary(headers):
+    for i, (name, value) in enumerate(headers):
+        if name == b"vary":
+            if b"accept-encoding" in value.lower() or value.strip() == b"*":
+                return headers
+            return headers[:i] + [(name, value + b", Accept-Encoding")] + headers[i + 1:]
+    return headers + [(b"vary", b"Accept-Encoding")]
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing complete response bodies with a ResponseCompressor."""
+
+    def __init__(self, app, compressor):
+        self.app = app
+        self.compressor = compressor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = next((value for name, value in scope["headers"] if name == b"accept-encoding"), b"")
+        coding = negotiate(accept_encoding.decode("latin-1"), self.compressor.encodings)
+        compressor = self.compressor
+        pending = {"start": None, "passthrough": False}
+
+        async def compress(message):
+            if pending["passthrough"]:
+                await send(message)
+            elif message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if message["status"] == 304:
+                    # Revalidates a 200 that carried Vary, so a shared cache keys it the same way
+                    pending["passthrough"] = True
+                    await send({**message, "headers": _with_vary(headers)})
+                elif message["status"] == 204 or not _compressible(headers):
+                    pending["passthrough"] = True
+                    await send(message)
+                elif coding is None:
+                    # Identity this time, but shared caches must not reuse it for other encodings
+                    pending["passthrough"] = True
+                    await send({**message, "headers": _with_vary(headers)})
+                else:
+                    # Held back until the body shows whether and how it is encoded
+                    pending["start"] = {**message, "headers": headers}
+            elif message["type"] == "http.response.body":
+                start = pending["start"]
+                headers = _with_vary(start["headers"])
+                body = message.get("body", b"")
+                pending["passthrough"] = True
+                if message.get("more_body", False):
+                    compressor.skipped["streamed"] += 1
+                elif len(body) < compressor.minimum_size:
+                    compressor.skipped["small"] += 1
+                else:
+                    etag = next((value.decode("latin-1") for name, value in headers if name == b"etag"), None)
+                    compressed = await compressor.encode(coding, body, etag)
+                    if len(compressed) < len(body):
+                        body = compressed
+                        headers = [
+                            # The bytes differ from the identity body, so the validator becomes weak
+                            (name, b"W/" + value if name == b"etag" and not value.startswith(b"W/") else value)
+                            for name, value in headers if name != b"content-length"
+                        ] + [(b"content-encoding", coding.encode()), (b"content-length", str(len(body)).encode())]
+                    else:
+                        compressor.skipped["incompressible"] += 1
+                await send({**start, "headers": headers})
+                await send({**message, "body": body})
+            else:
+                await send(message)
+
+        await self.app(scope, receive, compress)
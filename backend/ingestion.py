@@ -0,0 +1,294 @@
+"""
+Vectorized ingestion helpers for marks uploads.
+Column detection, normalization, score blending and categorization all operate on
+whole DataFrame columns so large sheets are scored without per-row Python loops.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+MARKS_KEYWORDS = ('mark', 'score', 'total')
+
+# Rows pushed through scoring and insert at a time by the streaming upload path
+STREAM_BATCH_SIZE = 5000
+STREAMABLE_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# (lower bound, label) pairs checked from the top down; anything below the last
+# bound falls into DEFAULT_CATEGORY.
+PERFORMANCE_CATEGORIES = (
+    (85, "Excellent"),
+    (70, "Good"),
+    (50, "Average"),
+)
+DEFAULT_CATEGORY = "Needs Improvement"
+
+# Stored columns a re-uploaded row is compared on; it is rewritten only if one differs
+UPSERT_COLUMNS = (
+    "name", "totalMarks", "normalized_score", "assessment_score", "final_combined_score", "performance_category"
+)
+CHANGES = ("inserted", "updated", "unchanged")
+
+
+def detect_columns(columns):
+    """
+    Detects the roll number, name and marks columns from a sheet header.
+    Returns a (roll_col, name_col, marks_col) tuple; marks_col is None if not found.
+    """
+    columns = list(columns)
+    roll_col = next((c for c in columns if 'roll' in str(c).lower()), None)
+    name_col = next((c for c in columns if 'name' in str(c).lower()), None)
+    marks_col = next(
+        (c for c in columns if any(keyword in str(c).lower() for keyword in MARKS_KEYWORDS)),
+        None
+    )
+
+    # Fallback to positional columns if specific headers aren't found
+    if roll_col is None and columns:
+        roll_col = columns[0]
+    if name_col is None and len(columns) > 1:
+        name_col = columns[1]
+    return roll_col, name_col, marks_col
+
+
+def _blank(column):
+    # Checked before astype(str), which turns empty cells into "nan" or "None"
+    return column.isna() | (column.astype(str).str.strip() == "")
+
+
+def extract_marks(df, roll_col, name_col, marks_col):
+    """
+    Reduces a raw sheet to clean (rollNumber, name, totalMarks) columns.
+    Rows with non-numeric marks or blank roll numbers are dropped.
+    """
+    frame = pd.DataFrame({
+        "rollNumber": df[roll_col].astype(str),
+        "name": df[name_col].astype(str),
+        "totalMarks": pd.to_numeric(df[marks_col], errors="coerce"),
+    })
+    valid = frame["totalMarks"].notna() & ~_blank(df[roll_col]).to_numpy()
+    return frame[valid].reset_index(drop=True)
+
+
+def dedupe_rolls(frame):
+    """Keeps the last row of each roll number, so a later row in a sheet corrects an earlier one."""
+    return frame.drop_duplicates("rollNumber", keep="last").reset_index(drop=True)
+
+
+def find_row_errors(df, roll_col, marks_col, first_row=2):
+    """
+    Lists rows that carry a marks value but cannot be imported, as {"row", "error"} dicts.
+    Rows without any marks are treated as blank and skipped silently.
+    first_row is the sheet row number of df's first row (the header is row 1).
+    """
+    raw_marks = df[marks_col]
+    marks = pd.to_numeric(raw_marks, errors="coerce")
+    present = raw_marks.notna().to_numpy()
+    bad_marks = present & marks.isna().to_numpy()
+    blank_roll = present & ~bad_marks & _blank(df[roll_col]).to_numpy()
+
+    errors = [(i, "Non-numeric marks value") for i in np.flatnonzero(bad_marks)]
+    errors += [(i, "Missing roll number") for i in np.flatnonzero(blank_roll)]
+    return [{"row": int(i) + first_row, "error": error} for i, error in sorted(errors)]
+
+
+def categorize(scores):
+    """Maps an array of final scores onto performance category labels."""
+    scores = np.asarray(scores, dtype=float)
+    conditions = [scores >= bound for bound, _ in PERFORMANCE_CATEGORIES]
+    labels = [label for _, label in PERFORMANCE_CATEGORIES]
+    return np.select(conditions, labels, default=DEFAULT_CATEGORY)
+
+
+def score_marks(frame, assessment_averages, max_total=None):
+    """
+    Adds normalized_score, assessment_score, final_combined_score and
+    performance_category columns to an extracted marks frame.
+
+    assessment_averages is a Series of average AI test percentages indexed by roll
+    number. Students without any tests keep their normalized score as the final score.
+    max_total overrides the normalization base (defaults to the frame's max marks).
+    """
+    if max_total is None:
+        max_total = frame["totalMarks"].max()
+    if pd.isna(max_total) or max_total == 0:
+        max_total = 100  # Fallback to prevent divide-by-zero
+
+    normalized = frame["totalMarks"] / max_total * 100
+    assessment = frame["rollNumber"].map(assessment_averages).astype(float)
+    has_tests = assessment.notna()
+    assessment = assessment.fillna(0.0)
+    final = np.where(has_tests, (normalized + assessment) / 2, normalized)
+
+    return frame.assign(
+        normalized_score=normalized,
+        assessment_score=assessment,
+        final_combined_score=final,
+        performance_category=categorize(final),
+    )
+
+
+def diff_marks(scored, stored):
+    """
+    Compares scored rows with the rows already stored for the same upload batch.
+    stored has id, rollNumber, uploadedAt and the UPSERT_COLUMNS, at most one row per
+    roll number. Returns scored with a change column ("inserted", "updated" or
+    "unchanged") plus the matching row's id, uploadedAt and normalized_score (as
+    stored_score) for rows that already exist.
+    """
+    stored = stored.rename(columns={column: f"stored_{column}" for column in UPSERT_COLUMNS})
+    merged = scored.merge(stored, on="rollNumber", how="left")
+    exists = merged["id"].notna().to_numpy()
+    differs = np.zeros(len(merged), dtype=bool)
+    for column in UPSERT_COLUMNS:
+        new, old = merged[column], merged[f"stored_{column}"]
+        if pd.api.types.is_numeric_dtype(new):
+            differs |= ~np.isclose(new.to_numpy(dtype=float), old.to_numpy(dtype=float), equal_nan=True)
+        else:
+            differs |= (new != old).to_numpy()
+    change = np.where(~exists, "inserted", np.where(differs, "updated", "unchanged"))
+    merged = merged.drop(columns=[f"stored_{column}" for column in UPSERT_COLUMNS if column != "normalized_score"])
+    return merged.rename(columns={"stored_normalized_score": "stored_score"}).assign(change=change)
+
+
+def diff_summary(scored):
+    """Counts a diffed frame's rows by change."""
+    counts = scored["change"].value_counts()
+    return {change: int(counts.get(change, 0)) for change in CHANGES}
+
+
+def summarize_rows(scored):
+    """Builds the per-row response payload returned by the upload endpoint."""
+    rounded = scored.round({"normalized_score": 2, "assessment_score": 2, "final_combined_score": 2})
+    return [
+        {
+            "rollNumber": roll,
+            "name": name,
+            "marks": marks,
+            "normalized": normalized,
+            "assessment": assessment,
+            "finalScore": final,
+            "category": category,
+            "change": change
+        }
+        for roll, name, marks, normalized, assessment, final, category, change in zip(
+            rounded["rollNumber"],
+            rounded["name"],
+            rounded["totalMarks"].tolist(),
+            rounded["normalized_score"].tolist(),
+            rounded["assessment_score"].tolist(),
+            rounded["final_combined_score"].tolist(),
+            rounded["performance_category"],
+            rounded["change"],
+        )
+    ]
+
+
+def content_hash(contents):
+    """SHA-256 hex digest of an upload's bytes."""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def file_content_hash(path):
+    """SHA-256 hex digest of a spooled upload, read in fixed-size chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(SPOOL_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def spool_upload(fileobj, suffix, directory=None):
+    """Copies an upload stream to a named temp file in fixed-size chunks and returns its path."""
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=directory) as tmp:
+        shutil.copyfileobj(fileobj, tmp, SPOOL_CHUNK_SIZE)
+        return tmp.name
+
+
+def _iter_xlsx_batches(path, batch_size):
+    """Reads an .xlsx sheet row by row in read-only mode, yielding DataFrame batches."""
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [c if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+        width = len(columns)
+
+        batch = []
+        for row in rows:
+            # Read-only rows can be ragged when trailing cells are empty
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_sheet_batches(path, batch_size=STREAM_BATCH_SIZE):
+    """
+    Yields DataFrames of at most batch_size rows from a spooled .xlsx, .xls or .csv file.
+    Only one batch is held in memory at a time, except for legacy .xls workbooks which
+    cannot be read incrementally.
+    """
+    suffix = os.path.splitext(path)[1].lower()
+    if suffix == '.csv':
+        yield from pd.read_csv(path, chunksize=batch_size)
+    elif suffix == '.xlsx':
+        yield from _iter_xlsx_batches(path, batch_size)
+    else:
+        df = pd.read_excel(path)
+        for start in range(0, len(df), batch_size):
+            yield df.iloc[start:start + batch_size]
+
+
+def scan_max_marks(path, batch_size=STREAM_BATCH_SIZE):
+    """
+    First streaming pass over a sheet: returns the detected (roll, name, marks) columns,
+    the maximum valid mark, which anchors normalization for every later batch, the
+    number of data rows in the sheet, and {roll number: position of its last importable
+    row} for superseded_rows, so duplicates are resolved across the whole sheet rather
+    than within each batch.
+    """
+    columns = (None, None, None)
+    max_total = np.nan
+    row_count = 0
+    last_rows = {}
+    for batch in iter_sheet_batches(path, batch_size):
+        if columns[2] is None:
+            columns = detect_columns(batch.columns)
+            if columns[2] is None:
+                break
+        roll_col, _, marks_col = columns
+        marks = pd.to_numeric(batch[marks_col], errors="coerce")
+        valid = (marks.notna() & ~_blank(batch[roll_col])).to_numpy()
+        positions = np.arange(row_count, row_count + len(batch))
+        last_rows.update(zip(batch[roll_col].astype(str).to_numpy()[valid], positions[valid].tolist()))
+        row_count += len(batch)
+        batch_max = marks[valid].max()
+        if not pd.isna(batch_max) and (pd.isna(max_total) or batch_max > max_total):
+            max_total = batch_max
+    return columns, max_total, row_count, last_rows
+
+
+def superseded_rows(batch, roll_col, last_rows, first_position):
+    """
+    Boolean mask of the batch rows whose roll number appears again further down the
+    sheet. first_position is the position of the batch's first row in the sheet.
+    """
+    positions = np.arange(first_position, first_position + len(batch))
+    last = batch[roll_col].astype(str).map(last_rows).to_numpy(dtype=float)
+    return ~np.isnan(last) & (last != positions)
@@ -4,21 +4,45 @@ FastAPI Backend for Performance Analyzer
 Handles Excel file uploads, parsing student marks, and storing them in an SQLite database.
 """
 
+import asyncio
 import io
 import json
 import logging
 import hashlib
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta
 import os
+import random
 import google.generativeai as genai
+import orjson
 import pandas as pd
 import uvicorn
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text, ForeignKey
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event, make_url, select, Column, Integer, String, Float, Date, DateTime, Text, ForeignKey, Boolean, Index, bindparam, case, cast, delete, exists, func, insert, literal, or_, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import DeclarativeBase, sessionmaker, Session
 from pydantic import BaseModel
-from typing import Optional
+from typing import Generic, List, NamedTuple, Optional, TypeVar
+
+import class_statistics
+import compression
+import ingestion
+import migrations
+import pagination
+import question_generation
+import trends
+from cache import LRUCache
+from response_cache import CacheRule, ResponseCache, ResponseCacheMiddleware, TableVersions
+from scheduler import PeriodicJob
+from upload_jobs import UploadJobQueue
+from write_coalescer import WriteCoalescer
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,6 +58,20 @@ if GEMINI_API_KEY:
 else:
     logger.warning("GEMINI_API_KEY not found in environment variables.")
 
+# Question generation backend ("gemini", or "offline" for air-gapped runs) and chunking
+QUESTION_GENERATOR = os.environ.get("QUESTION_GENERATOR", "gemini")
+if QUESTION_GENERATOR not in question_generation.GENERATORS:
+    raise ValueError(f"Unknown QUESTION_GENERATOR '{QUESTION_GENERATOR}'")
+question_generation.GENERATORS["offline"].latency = float(os.environ.get("OFFLINE_GENERATOR_LATENCY", "0"))
+GENERATION_CHUNK_SIZE = int(os.environ.get("GENERATION_CHUNK_SIZE", "10"))
+GENERATION_CONCURRENCY = int(os.environ.get("GENERATION_CONCURRENCY", "4"))
+GENERATION_TIMEOUT = float(os.environ.get("GENERATION_TIMEOUT", "60"))
+GENERATION_RETRIES = int(os.environ.get("GENERATION_RETRIES", "2"))
+
+# Banked questions are reused for this many days, then pruned the next time their pool grows
+QUESTION_BANK_TTL_DAYS = float(os.environ.get("QUESTION_BANK_TTL_DAYS", "30"))
+question_bank_stats = question_generation.BankStats()
+
 # Admin credentials from environment
 ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "superadmin")
 ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "superadmin123")
@@ -42,8 +80,59 @@ def hash_password(password: str) -> str:
     """Hashes a password using SHA-256 for basic security."""
     return hashlib.sha256(password.encode()).hexdigest()
 
+class FastJSONResponse(ORJSONResponse):
+    """
+    orjson rendering that accepts what the stdlib encoder did: numpy scalars from the
+    pandas analytics paths and non-string dict keys.
+    """
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+def rows_response(fields, rows) -> FastJSONResponse:
+    """Renders SQL row tuples as a list of {field: value} objects, without ORM instances or jsonable_encoder."""
+    return FastJSONResponse([dict(zip(fields, row)) for row in rows])
+
 # Initialize FastAPI
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+
+# Dashboard GET routes polled far more often than their data changes, with the tables
+# each one reads. Their ETags change when a commit writes one of those tables, or at
+# the latest after the route's TTL in seconds.
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_RULES = {
+    "/api/performance/class": CacheRule(("class_performance",), RESPONSE_CACHE_TTL),
+    "/api/performance/class/statistics": CacheRule(("student_performance",), RESPONSE_CACHE_TTL),
+    "/api/performance/class/trends": CacheRule(("class_daily_rollups",), RESPONSE_CACHE_TTL),
+    "/api/students/{roll_number}/trends": CacheRule(("daily_score_rollups",), RESPONSE_CACHE_TTL),
+    "/api/students/flagged": CacheRule(("student_flags",), RESPONSE_CACHE_TTL),
+    "/api/student/{rollNumber}/jobs": CacheRule(("students", "jobs"), RESPONSE_CACHE_TTL),
+    "/api/jobs": CacheRule(("jobs",), RESPONSE_CACHE_TTL),
+    "/api/jobs/page": CacheRule(("jobs",), RESPONSE_CACHE_TTL),
+    "/api/sections": CacheRule(("sections",), 5 * RESPONSE_CACHE_TTL),
+    "/api/sections/page": CacheRule(("sections",), 5 * RESPONSE_CACHE_TTL),
+    "/api/teachers": CacheRule(("teachers",), 5 * RESPONSE_CACHE_TTL),
+    "/api/teachers/page": CacheRule(("teachers",), 5 * RESPONSE_CACHE_TTL),
+}
+table_versions = TableVersions()
+response_cache = ResponseCache(RESPONSE_CACHE_RULES, table_versions, maxsize=RESPONSE_CACHE_SIZE,
+                               max_bytes=RESPONSE_CACHE_MAX_BYTES)
+# Added before CORS so it runs inside it: cached bodies never carry another origin's CORS headers
+app.add_middleware(ResponseCacheMiddleware, cache=response_cache)
+
+# gzip/Brotli for bodies of at least COMPRESSION_MIN_SIZE bytes. It wraps the response
+# cache, so each cached body is compressed once per ETag and coding.
+# Levels trade CPU for size: gzip 1-9, Brotli 0-11.
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_LEVEL = int(os.environ.get("COMPRESSION_BROTLI_LEVEL", "5"))
+COMPRESSION_CACHE_MAX_BYTES = int(os.environ.get("COMPRESSION_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+response_compressor = compression.ResponseCompressor(
+    minimum_size=COMPRESSION_MIN_SIZE, gzip_level=COMPRESSION_GZIP_LEVEL,
+    brotli_level=COMPRESSION_BROTLI_LEVEL, maxsize=RESPONSE_CACHE_SIZE, max_bytes=COMPRESSION_CACHE_MAX_BYTES
+)
+app.add_middleware(compression.CompressionMiddleware, compressor=response_compressor)
 
 # Enable CORS for React frontend
 app.add_middleware(
@@ -55,9 +144,169 @@ app.add_middleware(
 )
 
 # Database Setup
-SQLALCHEMY_DATABASE_URL = "sqlite:///./database.sqlite"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+# Request handlers use the async engine so a slow query never stalls the event loop.
+# The sync engine serves startup tasks, migrations and threadpool/upload-job work.
+SQLALCHEMY_DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./database.sqlite")
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def to_async_url(url: str) -> str:
+    """Maps a sync database URL onto its async driver (aiosqlite or asyncpg)."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for '{backend}' databases")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL") or to_async_url(SQLALCHEMY_DATABASE_URL)
+IS_SQLITE = make_url(SQLALCHEMY_DATABASE_URL).get_backend_name() == "sqlite"
+
+# Storage profile. On SQLite, WAL lets readers run alongside the single writer,
+# busy_timeout makes a writer wait for the lock instead of failing with "database is
+# locked", and synchronous=NORMAL skips the per-commit fsync, which is still durable
+# in WAL mode. Both engines share the pool sizing.
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "30000"))
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "8"))
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    connect_args={"check_same_thread": False} if IS_SQLITE else {}
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# aiosqlite defaults to NullPool, so the queue pool is requested explicitly
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    **({"poolclass": AsyncAdaptedQueuePool} if IS_SQLITE else {})
+)
+if IS_SQLITE:
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def get_db():
+    """FastAPI dependency providing a request-scoped AsyncSession; uncommitted work is rolled back on close."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Per-student analytics payloads, invalidated whenever a student's marks or tests change
+STUDENT_ANALYTICS_CACHE_SIZE = int(os.environ.get("STUDENT_ANALYTICS_CACHE_SIZE", "5000"))
+student_analytics_cache = LRUCache("student_analytics", maxsize=STUDENT_ANALYTICS_CACHE_SIZE)
+
+def mark_students_changed(db, rolls):
+    """Records students whose cached analytics must be dropped once this session (sync or async) commits."""
+    db.info.setdefault("changed_students", set()).update(rolls)
+
+# Class statistics per (year, branch, section, subject), each entry holding one result per
+# (bins, percentiles) variant requested; (year, branch, section, None) lists the class's subjects
+CLASS_STATISTICS_CACHE_SIZE = int(os.environ.get("CLASS_STATISTICS_CACHE_SIZE", "1024"))
+class_statistics_cache = LRUCache("class_statistics", maxsize=CLASS_STATISTICS_CACHE_SIZE)
+
+def mark_class_subjects_changed(db, keys):
+    """Records (year, branch, section, subject) keys whose cached statistics must be dropped once this session commits."""
+    db.info.setdefault("changed_class_subjects", set()).update(keys)
+
+# Registered on the Session class so both sync sessions and the sync session wrapped by
+# every AsyncSession are covered
+@event.listens_for(Session, "after_commit")
+def invalidate_changed_students(session):
+    changed = session.info.pop("changed_students", None)
+    if changed:
+        student_analytics_cache.invalidate(*changed)
+        flag_candidates.add(changed)
+    changed_tests = session.info.pop("changed_tests", None)
+    if changed_tests:
+        question_set_cache.invalidate(*changed_tests)
+    changed_subjects = session.info.pop("changed_class_subjects", None)
+    if changed_subjects:
+        class_keys = {(year, branch, section, None) for year, branch, section, _ in changed_subjects}
+        class_statistics_cache.invalidate(*changed_subjects, *class_keys)
+
+@event.listens_for(Session, "after_rollback")
+def discard_changed_students(session):
+    session.info.pop("changed_students", None)
+    session.info.pop("changed_tests", None)
+    session.info.pop("changed_class_subjects", None)
+
+# Every table written in a transaction gets its version bumped after the commit, so a
+# reader can never pair the new version with data from before the commit
+@event.listens_for(Session, "before_flush")
+def track_flushed_tables(session, flush_context, instances):
+    tables = {obj.__table__.name for obj in (*session.new, *session.dirty, *session.deleted)}
+    if tables:
+        session.info.setdefault("changed_tables", set()).update(tables)
+
+@event.listens_for(Session, "do_orm_execute")
+def track_executed_tables(orm_execute_state):
+    # Core and bulk ORM insert/update/delete statements bypass the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = orm_execute_state.statement.table
+        orm_execute_state.session.info.setdefault("changed_tables", set()).add(table.name)
+
+@event.listens_for(Session, "after_commit")
+def bump_table_versions(session):
+    changed = session.info.pop("changed_tables", None)
+    if changed:
+        table_versions.bump(*changed)
+
+@event.listens_for(Session, "after_rollback")
+def discard_changed_tables(session):
+    session.info.pop("changed_tables", None)
+
+# Per-test question sets shared by question fetches and submission grading
+QUESTION_SET_CACHE_SIZE = int(os.environ.get("QUESTION_SET_CACHE_SIZE", "256"))
+question_set_cache = LRUCache("question_sets", maxsize=QUESTION_SET_CACHE_SIZE)
+
+class CachedQuestion(NamedTuple):
+    """Detached copy of a questions row, as held in question_set_cache."""
+    id: int
+    question: str
+    option_a: str
+    option_b: str
+    option_c: str
+    option_d: str
+    correct_answer: str
+
+class QuestionSet:
+    """A test's questions in id order, with lookups by question id and the grading key."""
+    __slots__ = ("questions", "by_id", "answer_key")
+
+    def __init__(self, questions):
+        self.questions = tuple(questions)
+        self.by_id = {q.id: q for q in self.questions}
+        self.answer_key = {str(q.id): q.correct_answer for q in self.questions}
+
+def mark_tests_changed(db, test_ids):
+    """Records tests whose cached question sets must be dropped once this session commits."""
+    db.info.setdefault("changed_tests", set()).update(test_ids)
+
+@event.listens_for(Session, "before_flush")
+def track_question_changes(session, flush_context, instances):
+    # Any ORM insert, update or delete of a question invalidates its test's question set
+    changed = {
+        obj.test_id for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, Question)
+    }
+    if changed:
+        mark_tests_changed(session, changed)
+
+# Background upload jobs are tracked in their own local SQLite file so no broker is needed
+UPLOAD_JOBS_DB = os.environ.get("UPLOAD_JOBS_DB", "./upload_jobs.sqlite")
+UPLOAD_SPOOL_DIR = os.environ.get("UPLOAD_SPOOL_DIR", "./upload_spool")
+UPLOAD_JOB_WORKERS = int(os.environ.get("UPLOAD_JOB_WORKERS", "2"))
+
 class Base(DeclarativeBase):
     pass
 
@@ -67,6 +316,17 @@ class StudentPerformance(Base):
     SQLAlchemy Model for storing student performance records from Excel uploads.
     """
     __tablename__ = "student_performance"
+    __table_args__ = (
+        Index("ix_student_performance_demographics", "year", "branch", "section"),
+        # Student and subject first for incremental rescoring; the class columns let the
+        # latest-upload lookup for a class_performance row use it too
+        Index("ix_student_performance_roll_subject", "rollNumber", "subject", "year", "branch", "section"),
+        # One row per student and subject in each upload batch, so a re-uploaded sheet
+        # updates its rows in place; batch first so a batch's rows are one index range
+        Index("ix_student_performance_upload_key", "upload_batch", "subject", "year", "branch", "section",
+              "rollNumber", unique=True),
+        Index("ix_student_performance_batch", "batch_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     rollNumber = Column(String, index=True)
     name = Column(String)
@@ -77,6 +337,11 @@ class StudentPerformance(Base):
     section = Column(String)
     uploadedBy = Column(String)
     uploadedAt = Column(DateTime, default=datetime.utcnow)
+    # The uploaded file's content hash unless the uploader named the batch; NULL for
+    # rows stored before batches existed
+    upload_batch = Column(String, nullable=True)
+    # upload_batches row of the upload that last wrote this row
+    batch_id = Column(Integer, nullable=True)
     
     # Advanced Analytics Fields
     normalized_score = Column(Float, nullable=True)
@@ -86,6 +351,9 @@ class StudentPerformance(Base):
 
 class Student(Base):
     __tablename__ = "students"
+    __table_args__ = (
+        Index("ix_students_demographics", "year", "branch", "section"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     rollNumber = Column(String, unique=True, index=True)
@@ -112,6 +380,11 @@ class Section(Base):
 
 class Test(Base):
     __tablename__ = "tests"
+    __table_args__ = (
+        Index("ix_tests_demographics", "year", "branch", "section"),
+        Index("ix_tests_created_by", "createdBy"),
+        Index("ix_tests_subject", "subject"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     testName = Column(String)
     subject = Column(String)
@@ -136,6 +409,9 @@ class Question(Base):
 
 class StudentTestResult(Base):
     __tablename__ = "student_test_results"
+    __table_args__ = (
+        Index("ix_student_test_results_roll_test", "student_roll", "test_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     student_roll = Column(String, index=True)
     test_id = Column(Integer, index=True)
@@ -145,6 +421,9 @@ class StudentTestResult(Base):
 
 class StudentAnswer(Base):
     __tablename__ = "student_answers"
+    __table_args__ = (
+        Index("ix_student_answers_roll_test", "student_roll", "test_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     student_roll = Column(String, index=True)
     test_id = Column(Integer, index=True)
@@ -153,6 +432,9 @@ class StudentAnswer(Base):
 
 class StudentAssignedQuestion(Base):
     __tablename__ = "student_assigned_questions"
+    __table_args__ = (
+        Index("ix_student_assigned_questions_roll_test", "student_roll", "test_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     student_roll = Column(String, index=True)
     test_id = Column(Integer, index=True)
@@ -161,6 +443,11 @@ class StudentAssignedQuestion(Base):
 
 class Job(Base):
     __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_demographics", "year", "branch", "section"),
+        Index("ix_jobs_posted_at", "posted_at"),
+        Index("ix_jobs_year_posted_at", "year", "posted_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String)
     description = Column(Text)
@@ -171,8 +458,237 @@ class Job(Base):
     posted_by = Column(String)
     posted_at = Column(DateTime, default=datetime.utcnow)
 
-# Create tables
+class ClassPerformance(Base):
+    """
+    Maintained aggregate of each student's standing per subject within a class.
+    Refreshed incrementally by marks uploads and test submissions so the class
+    dashboard is a single indexed read instead of a rebuild over the raw tables.
+    """
+    __tablename__ = "class_performance"
+    __table_args__ = (
+        Index("ix_class_performance_key", "year", "branch", "section", "rollNumber", "subject", unique=True),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    year = Column(String)
+    branch = Column(String)
+    section = Column(String)
+    rollNumber = Column(String)
+    subject = Column(String)
+    name = Column(String)
+    marks = Column(Float, default=0)  # Raw uploaded marks (0 when only AI tests exist)
+    assessment_score = Column(Float, default=0)
+    final_score = Column(Float, default=0)
+    has_upload = Column(Boolean, default=False)
+    # Running aggregates of AI test percentages for tests targeted at this class
+    test_count = Column(Integer, default=0)
+    test_score_sum = Column(Float, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+CLASS_PERFORMANCE_KEY = ["year", "branch", "section", "rollNumber", "subject"]
+
+class DailyScoreRollup(Base):
+    """
+    Per-day sum and count of each student's scores by subject and source ("upload":
+    normalized marks, "test": AI test percentages), maintained by uploads and test
+    submissions. Trend queries read these rows instead of the raw history, so a
+    multi-year trend costs one row per day with scores rather than one per record.
+    """
+    __tablename__ = "daily_score_rollups"
+    __table_args__ = (
+        Index("ix_daily_score_rollups_key", "year", "branch", "section", "subject", "rollNumber", "source", "day",
+              unique=True),
+        Index("ix_daily_score_rollups_student", "rollNumber", "subject", "day"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    year = Column(String)
+    branch = Column(String)
+    section = Column(String)
+    subject = Column(String)
+    rollNumber = Column(String)
+    source = Column(String)
+    day = Column(Date)
+    score_sum = Column(Float, default=0)
+    score_count = Column(Integer, default=0)
+
+DAILY_ROLLUP_KEY = ["year", "branch", "section", "subject", "rollNumber", "source", "day"]
+
+class ClassDailyRollup(Base):
+    """daily_score_rollups summed over a class's students, so class trends read one row per subject and day."""
+    __tablename__ = "class_daily_rollups"
+    __table_args__ = (
+        Index("ix_class_daily_rollups_key", "year", "branch", "section", "subject", "source", "day", unique=True),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    year = Column(String)
+    branch = Column(String)
+    section = Column(String)
+    subject = Column(String)
+    source = Column(String)
+    day = Column(Date)
+    score_sum = Column(Float, default=0)
+    score_count = Column(Integer, default=0)
+
+CLASS_DAILY_ROLLUP_KEY = [column for column in DAILY_ROLLUP_KEY if column != "rollNumber"]
+ROLLUP_SOURCES = ("upload", "test")
+
+class AssessmentAggregate(Base):
+    """
+    Running count and sum of each student's AI test percentages per subject, over every
+    test of the subject. Submissions add to them in O(1), and uploads and rescoring read
+    a student's assessment average here instead of averaging the raw results.
+    """
+    __tablename__ = "assessment_aggregates"
+    __table_args__ = (
+        # Subject first: uploads read a whole subject's averages
+        Index("ix_assessment_aggregates_key", "subject", "rollNumber", unique=True),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    subject = Column(String)
+    rollNumber = Column(String)
+    test_count = Column(Integer, default=0)
+    test_score_sum = Column(Float, default=0)
+
+ASSESSMENT_AGGREGATE_KEY = ["subject", "rollNumber"]
+
+class UploadBatch(Base):
+    """
+    One marks upload: the file's hash, what it did to its upload batch, its parse
+    errors and how long it took. Rows it wrote carry its id in student_performance.batch_id,
+    so rolling it back or restoring it is a few statements over indexed ids.
+    """
+    __tablename__ = "upload_batches"
+    __table_args__ = (
+        # Uploads into the same batch of a class and subject, oldest first
+        Index("ix_upload_batches_key", "upload_batch", "subject", "year", "branch", "section", "id"),
+        Index("ix_upload_batches_class", "year", "branch", "section", "subject", "id"),
+        Index("ix_upload_batches_uploaded_by", "uploaded_by", "id"),
+        Index("ix_upload_batches_seconds", "seconds", "id"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    upload_batch = Column(String)
+    file_hash = Column(String)
+    filename = Column(String, nullable=True)
+    year = Column(String)
+    branch = Column(String)
+    section = Column(String)
+    subject = Column(String)
+    uploaded_by = Column(String)
+    source = Column(String)  # sheet, stream, job
+    status = Column(String, default="running")  # running, active, rolled_back, failed
+    row_count = Column(Integer, default=0)  # Data rows in the sheet, valid or not
+    inserted = Column(Integer, default=0)
+    updated = Column(Integer, default=0)
+    unchanged = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    errors = Column(Text, nullable=True)  # JSON list of the first MAX_BATCH_ERRORS row errors
+    error = Column(Text, nullable=True)  # Why a failed upload failed
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    read_seconds = Column(Float, nullable=True)  # Reading, hashing and validating the file
+    write_seconds = Column(Float, nullable=True)  # Scoring, diffing and writing rows
+    seconds = Column(Float, nullable=True)
+    rolled_back_at = Column(DateTime, nullable=True)
+
+class StudentPerformanceVersion(Base):
+    """
+    student_performance rows taken out of the table, with their original ids: versions a
+    later upload replaced (superseded_by is that upload) and the rows of a rolled back
+    upload (superseded_by is NULL). Rollback and restore move rows between the two tables.
+    """
+    __tablename__ = "student_performance_versions"
+    __table_args__ = (
+        Index("ix_student_performance_versions_batch", "batch_id"),
+        Index("ix_student_performance_versions_superseded_by", "superseded_by"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    performance_id = Column(Integer)
+    superseded_by = Column(Integer, nullable=True)
+    rollNumber = Column(String)
+    name = Column(String)
+    totalMarks = Column(Float)
+    subject = Column(String)
+    year = Column(String)
+    branch = Column(String)
+    section = Column(String)
+    uploadedBy = Column(String)
+    uploadedAt = Column(DateTime)
+    upload_batch = Column(String)
+    batch_id = Column(Integer)
+    normalized_score = Column(Float, nullable=True)
+    assessment_score = Column(Float, nullable=True)
+    final_combined_score = Column(Float, nullable=True)
+    performance_category = Column(String, nullable=True)
+
+# Unique key of student_performance rows stored in an upload batch
+UPLOAD_KEY = ["upload_batch", "subject", "year", "branch", "section", "rollNumber"]
+# Columns copied between student_performance and student_performance_versions
+PERFORMANCE_VERSION_COLUMNS = [
+    column.name for column in StudentPerformance.__table__.columns if column.name != "id"
+]
+
+class ScoringRun(Base):
+    """
+    One run of the batch scoring job. last_result_id is the highest student_test_results
+    id the run had seen; the next incremental run rescores only what was submitted after it.
+    """
+    __tablename__ = "scoring_runs"
+    id = Column(Integer, primary_key=True, index=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    status = Column(String, default="running")  # running, done, failed
+    full = Column(Boolean, default=False)
+    last_result_id = Column(Integer, nullable=True)
+    rows_rescored = Column(Integer, default=0)
+    students_flagged = Column(Integer, default=0)
+    seconds = Column(Float, nullable=True)
+    error = Column(Text, nullable=True)
+
+class StudentFlag(Base):
+    """Students trending down across subjects, as found by the latest scoring run."""
+    __tablename__ = "student_flags"
+    __table_args__ = (
+        Index("ix_student_flags_class_slope", "year", "branch", "section", "slope"),
+        Index("ix_student_flags_slope", "slope"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    year = Column(String)
+    branch = Column(String)
+    section = Column(String)
+    rollNumber = Column(String)
+    declining_subjects = Column(Integer)
+    slope = Column(Float)  # Mean slope of the declining subjects, points per trends.SLOPE_DAYS days
+    worst_subject = Column(String)
+    worst_slope = Column(Float)
+    run_id = Column(Integer)
+    flagged_at = Column(DateTime, default=datetime.utcnow)
+
+class BankQuestion(Base):
+    """
+    Generated questions kept for reuse by later tests. Pools are addressed by bank_key,
+    a hash of the normalized subject and difficulty, and content_hash keeps each pool
+    free of duplicate questions.
+    """
+    __tablename__ = "question_bank"
+    __table_args__ = (
+        Index("ix_question_bank_content", "bank_key", "content_hash", unique=True),
+        Index("ix_question_bank_key_created", "bank_key", "created_at"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    bank_key = Column(String, nullable=False)
+    content_hash = Column(String, nullable=False)
+    subject = Column(String)
+    difficulty = Column(String)
+    question = Column(Text)
+    option_a = Column(String)
+    option_b = Column(String)
+    option_c = Column(String)
+    option_d = Column(String)
+    correct_answer = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Create tables, then bring existing databases up to the current schema
 Base.metadata.create_all(bind=engine)
+migrations.upgrade(engine)
 
 # Database Seeding
 def seed_default_accounts():
@@ -197,6 +713,346 @@ def seed_default_accounts():
 
 seed_default_accounts()
 
+def dialect_insert(db: Session, model):
+    """Returns an INSERT construct supporting ON CONFLICT upserts for the session's database."""
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql_insert(model)
+    return sqlite_insert(model)
+
+def category_case(score):
+    """SQL counterpart of ingestion.categorize for a score expression."""
+    return case(
+        *((score >= bound, label) for bound, label in ingestion.PERFORMANCE_CATEGORIES),
+        else_=ingestion.DEFAULT_CATEGORY
+    )
+
+def refresh_class_performance_uploads(db: Session, records: list):
+    """
+    Upserts uploaded marks into the class_performance aggregate.
+    records are student_performance row dicts; the latest upload for a subject wins.
+    Running AI test aggregates on existing rows are left untouched.
+    """
+    if not records:
+        return
+    stmt = dialect_insert(db, ClassPerformance)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=CLASS_PERFORMANCE_KEY,
+        set_={
+            "name": stmt.excluded.name,
+            "marks": stmt.excluded.marks,
+            "assessment_score": stmt.excluded.assessment_score,
+            "final_score": stmt.excluded.final_score,
+            "has_upload": True,
+            "updated_at": datetime.utcnow()
+        }
+    )
+    db.execute(stmt, [
+        {
+            "year": r["year"],
+            "branch": r["branch"],
+            "section": r["section"],
+            "rollNumber": r["rollNumber"],
+            "subject": r["subject"],
+            "name": r["name"],
+            "marks": r["totalMarks"],
+            "assessment_score": r["assessment_score"],
+            "final_score": r["final_combined_score"],
+            "has_upload": True,
+            "test_count": 0,
+            "test_score_sum": 0.0
+        } for r in records
+    ])
+
+def refresh_class_performance_tests(db: Session, results: list):
+    """
+    Folds AI test results, given as (test, student_roll, score, total_questions) tuples,
+    into the class_performance aggregate in O(1) per result with one executemany upsert.
+    Subjects without uploaded marks score as the running average of their tests;
+    subjects with uploaded marks keep the combined score computed at upload time.
+    """
+    if not results:
+        return
+    rolls = {student_roll for _, student_roll, _, _ in results}
+    names = dict(db.execute(select(Student.rollNumber, Student.name).where(Student.rollNumber.in_(rolls))).all())
+    rows = []
+    for test, student_roll, score, total_questions in results:
+        if student_roll not in names:
+            continue  # Only registered students appear on class dashboards
+        pct = (score / total_questions) * 100 if total_questions > 0 else 0
+        rows.append({
+            "year": test.year,
+            "branch": test.branch,
+            "section": test.section,
+            "rollNumber": student_roll,
+            "subject": test.subject,
+            "name": names[student_roll],
+            "marks": 0,
+            "assessment_score": pct,
+            "final_score": pct,
+            "has_upload": False,
+            "test_count": 1,
+            "test_score_sum": pct
+        })
+    if not rows:
+        return
+
+    stmt = dialect_insert(db, ClassPerformance)
+    new_average = (ClassPerformance.test_score_sum + stmt.excluded.test_score_sum) / (ClassPerformance.test_count + 1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=CLASS_PERFORMANCE_KEY,
+        set_={
+            "test_count": ClassPerformance.test_count + 1,
+            "test_score_sum": ClassPerformance.test_score_sum + stmt.excluded.test_score_sum,
+            "assessment_score": case((ClassPerformance.has_upload, ClassPerformance.assessment_score), else_=new_average),
+            "final_score": case((ClassPerformance.has_upload, ClassPerformance.final_score), else_=new_average),
+            "updated_at": datetime.utcnow()
+        }
+    )
+    db.execute(stmt, rows)
+
+def refresh_assessment_scores(db: Session, results: list):
+    """
+    Folds AI test results, given as (test, student_roll, score, total_questions) tuples,
+    into the running sums of assessment_aggregates, then rescores the student's uploaded
+    marks in the test's subject from the new average. Each result costs one upsert and
+    one indexed update of its (rollNumber, subject) rows, however many tests came
+    before. class_performance rows backed by an upload pick up the latest upload's new
+    scores.
+    """
+    if not results:
+        return
+    sums = {}
+    classes = set()
+    for test, student_roll, score, total_questions in results:
+        pct = (score / total_questions) * 100 if total_questions > 0 else 0
+        aggregate = sums.setdefault((test.subject, student_roll), [0.0, 0])
+        aggregate[0] += pct
+        aggregate[1] += 1
+        classes.add((test.year, test.branch, test.section, student_roll, test.subject))
+
+    stmt = dialect_insert(db, AssessmentAggregate)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=ASSESSMENT_AGGREGATE_KEY,
+        set_={
+            "test_count": AssessmentAggregate.test_count + stmt.excluded.test_count,
+            "test_score_sum": AssessmentAggregate.test_score_sum + stmt.excluded.test_score_sum
+        }
+    ).returning(AssessmentAggregate.subject, AssessmentAggregate.rollNumber,
+                AssessmentAggregate.test_score_sum, AssessmentAggregate.test_count)
+    averages = {
+        (subject, roll): score_sum / count
+        for subject, roll, score_sum, count in db.execute(stmt, [
+            {"subject": subject, "rollNumber": roll, "test_score_sum": score_sum, "test_count": count}
+            for (subject, roll), (score_sum, count) in sums.items()
+        ])
+    }
+
+    # Table-level statements, so the parameter lists run as plain executemany updates
+    performance = StudentPerformance.__table__.c
+    assessment = bindparam("assessment", type_=Float)
+    final = (func.coalesce(performance.normalized_score, performance.totalMarks) + assessment) / 2
+    db.execute(
+        update(StudentPerformance.__table__)
+        .where(performance.rollNumber == bindparam("roll"), performance.subject == bindparam("test_subject"))
+        .values(assessment_score=assessment, final_combined_score=final, performance_category=category_case(final)),
+        [{"roll": roll, "test_subject": subject, "assessment": average} for (subject, roll), average in averages.items()]
+    )
+    class_row = ClassPerformance.__table__.c
+    upload = StudentPerformance.__table__.alias("upload")
+    latest_final = select(upload.c.final_combined_score).where(
+        *(upload.c[column] == class_row[column] for column in CLASS_PERFORMANCE_KEY)
+    ).order_by(upload.c.id.desc()).limit(1).scalar_subquery()
+    db.execute(
+        update(ClassPerformance.__table__)
+        .where(*(class_row[column] == bindparam(f"key_{column}") for column in CLASS_PERFORMANCE_KEY),
+               class_row.has_upload.is_(True))
+        .values(assessment_score=assessment, final_score=latest_final),
+        [{**{f"key_{column}": value for column, value in zip(CLASS_PERFORMANCE_KEY, key)},
+          "assessment": averages[key[4], key[3]]} for key in classes]
+    )
+    mark_class_subjects_changed(db, {(year, branch, section, subject) for year, branch, section, _, subject in classes})
+
+def rebuild_class_performance(db: Session):
+    """Recomputes the whole class_performance aggregate from the raw tables. The caller commits."""
+    latest_upload_ids = db.query(func.max(StudentPerformance.id)).group_by(
+        StudentPerformance.year, StudentPerformance.branch, StudentPerformance.section,
+        StudentPerformance.rollNumber, StudentPerformance.subject
+    )
+    uploads = db.query(
+        StudentPerformance.year, StudentPerformance.branch, StudentPerformance.section,
+        StudentPerformance.rollNumber, StudentPerformance.subject, StudentPerformance.name,
+        StudentPerformance.totalMarks, StudentPerformance.assessment_score,
+        func.coalesce(StudentPerformance.final_combined_score, StudentPerformance.totalMarks)
+    ).filter(StudentPerformance.id.in_(latest_upload_ids)).order_by(StudentPerformance.id).all()
+
+    test_pct = case(
+        (StudentTestResult.total_questions > 0,
+         StudentTestResult.score * 100.0 / StudentTestResult.total_questions),
+        else_=0.0
+    )
+    tests = db.query(
+        Test.year, Test.branch, Test.section, StudentTestResult.student_roll, Test.subject,
+        func.min(Student.name), func.count(StudentTestResult.id), func.sum(test_pct)
+    ).join(
+        Test, StudentTestResult.test_id == Test.id
+    ).join(
+        Student, StudentTestResult.student_roll == Student.rollNumber
+    ).group_by(
+        Test.year, Test.branch, Test.section, StudentTestResult.student_roll, Test.subject
+    ).order_by(func.min(StudentTestResult.id)).all()
+
+    rows = {}
+    for year, branch, section, roll, subject, name, marks, assessment, final in uploads:
+        rows[(year, branch, section, roll, subject)] = {
+            "name": name, "marks": marks, "assessment_score": assessment or 0,
+            "final_score": final, "has_upload": True, "test_count": 0, "test_score_sum": 0.0
+        }
+    for year, branch, section, roll, subject, name, count, pct_sum in tests:
+        row = rows.setdefault((year, branch, section, roll, subject), {
+            "name": name, "marks": 0, "assessment_score": pct_sum / count,
+            "final_score": pct_sum / count, "has_upload": False
+        })
+        row["test_count"] = count
+        row["test_score_sum"] = pct_sum
+
+    db.query(ClassPerformance).delete()
+    if rows:
+        db.execute(insert(ClassPerformance), [
+            dict(zip(CLASS_PERFORMANCE_KEY, key), **values) for key, values in rows.items()
+        ])
+
+def ensure_class_performance():
+    """Backfills the class_performance aggregate for databases created before it existed."""
+    db = SessionLocal()
+    try:
+        if db.query(ClassPerformance.id).first() is None and (
+            db.query(StudentPerformance.id).first() is not None
+            or db.query(StudentTestResult.id).first() is not None
+        ):
+            rebuild_class_performance(db)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error backfilling class performance: {e}")
+    finally:
+        db.close()
+
+ensure_class_performance()
+
+def upsert_rollup_sums(db: Session, model, key: list, rows: list):
+    """Adds the score_sum and score_count of rows into model's rows with the same key, in one executemany upsert."""
+    stmt = dialect_insert(db, model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=key,
+        set_={
+            "score_sum": model.score_sum + stmt.excluded.score_sum,
+            "score_count": model.score_count + stmt.excluded.score_count
+        }
+    )
+    db.execute(stmt, rows)
+
+def refresh_daily_rollups(db: Session, rows: list):
+    """
+    Adds score sums and counts into daily_score_rollups and class_daily_rollups.
+    rows are dicts with the DAILY_ROLLUP_KEY columns plus score_sum and score_count.
+    """
+    if not rows:
+        return
+    upsert_rollup_sums(db, DailyScoreRollup, DAILY_ROLLUP_KEY, rows)
+    class_rows = {}
+    for row in rows:
+        key = tuple(row[column] for column in CLASS_DAILY_ROLLUP_KEY)
+        class_row = class_rows.setdefault(key, {**dict(zip(CLASS_DAILY_ROLLUP_KEY, key)), "score_sum": 0.0, "score_count": 0})
+        class_row["score_sum"] += row["score_sum"]
+        class_row["score_count"] += row["score_count"]
+    upsert_rollup_sums(db, ClassDailyRollup, CLASS_DAILY_ROLLUP_KEY, list(class_rows.values()))
+
+def rebuild_daily_rollups(db: Session):
+    """Recomputes both rollup tables from the raw tables with INSERT ... SELECT statements. The caller commits."""
+    upload_day = func.date(StudentPerformance.uploadedAt)
+    uploads = select(
+        StudentPerformance.year, StudentPerformance.branch, StudentPerformance.section,
+        StudentPerformance.subject, StudentPerformance.rollNumber, literal("upload"), upload_day,
+        func.sum(func.coalesce(StudentPerformance.normalized_score, StudentPerformance.totalMarks)),
+        func.count(StudentPerformance.id)
+    ).group_by(
+        StudentPerformance.year, StudentPerformance.branch, StudentPerformance.section,
+        StudentPerformance.subject, StudentPerformance.rollNumber, upload_day
+    )
+    test_day = func.date(StudentTestResult.submitted_at)
+    test_pct = case(
+        (StudentTestResult.total_questions > 0,
+         StudentTestResult.score * 100.0 / StudentTestResult.total_questions),
+        else_=0.0
+    )
+    tests = select(
+        Test.year, Test.branch, Test.section, Test.subject, StudentTestResult.student_roll, literal("test"),
+        test_day, func.sum(test_pct), func.count(StudentTestResult.id)
+    ).join(
+        Test, StudentTestResult.test_id == Test.id
+    ).group_by(
+        Test.year, Test.branch, Test.section, Test.subject, StudentTestResult.student_roll, test_day
+    )
+    columns = DAILY_ROLLUP_KEY + ["score_sum", "score_count"]
+    db.query(DailyScoreRollup).delete()
+    db.query(ClassDailyRollup).delete()
+    db.execute(insert(DailyScoreRollup).from_select(columns, uploads))
+    db.execute(insert(DailyScoreRollup).from_select(columns, tests))
+    class_key = [getattr(DailyScoreRollup, column) for column in CLASS_DAILY_ROLLUP_KEY]
+    db.execute(insert(ClassDailyRollup).from_select(
+        CLASS_DAILY_ROLLUP_KEY + ["score_sum", "score_count"],
+        select(*class_key, func.sum(DailyScoreRollup.score_sum), func.sum(DailyScoreRollup.score_count))
+        .group_by(*class_key)
+    ))
+
+def ensure_daily_rollups():
+    """Backfills daily_score_rollups for databases created before it existed."""
+    db = SessionLocal()
+    try:
+        if db.query(DailyScoreRollup.id).first() is None and (
+            db.query(StudentPerformance.id).first() is not None
+            or db.query(StudentTestResult.id).first() is not None
+        ):
+            rebuild_daily_rollups(db)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error backfilling daily score rollups: {e}")
+    finally:
+        db.close()
+
+ensure_daily_rollups()
+
+def rebuild_assessment_aggregates(db: Session):
+    """Recomputes assessment_aggregates from the raw test results with one INSERT ... SELECT. The caller commits."""
+    test_pct = case(
+        (StudentTestResult.total_questions > 0,
+         StudentTestResult.score * 100.0 / StudentTestResult.total_questions),
+        else_=0.0
+    )
+    db.query(AssessmentAggregate).delete()
+    db.execute(insert(AssessmentAggregate).from_select(
+        ASSESSMENT_AGGREGATE_KEY + ["test_count", "test_score_sum"],
+        select(Test.subject, StudentTestResult.student_roll, func.count(StudentTestResult.id), func.sum(test_pct))
+        .join(Test, StudentTestResult.test_id == Test.id)
+        .group_by(Test.subject, StudentTestResult.student_roll)
+    ))
+
+def ensure_assessment_aggregates():
+    """Backfills assessment_aggregates for databases created before it existed."""
+    db = SessionLocal()
+    try:
+        if db.query(AssessmentAggregate.id).first() is None and db.query(StudentTestResult.id).first() is not None:
+            rebuild_assessment_aggregates(db)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error backfilling assessment aggregates: {e}")
+    finally:
+        db.close()
+
+ensure_assessment_aggregates()
+
 # Pydantic Request Models
 class StudentRegisterRequest(BaseModel):
     name: str
@@ -238,9 +1094,25 @@ class JobCreateRequest(BaseModel):
 class TestCreateRequest(BaseModel):
     testName: str
     subject: str
+    difficulty: str = question_generation.DEFAULT_DIFFICULTY
+    year: str
+    branch: str
+    section: str
+    numberOfQuestions: int
+    startTime: str
+    endTime: str
+    createdBy: str
+
+class TestSection(BaseModel):
     year: str
     branch: str
     section: str
+
+class TestBatchCreateRequest(BaseModel):
+    testName: str
+    subject: str
+    difficulty: str = question_generation.DEFAULT_DIFFICULTY
+    sections: List[TestSection]
     numberOfQuestions: int
     startTime: str
     endTime: str
@@ -254,6 +1126,184 @@ class StudentTestSubmission(BaseModel):
     student_roll: str
     answers: dict[str, str] # mapping of question_id (stringified int) to selected_answer
 
+# Response schemas for the list endpoints. They document the payloads in OpenAPI; the
+# endpoints return a FastJSONResponse built straight from SQL rows, so FastAPI neither
+# validates nor re-encodes each item on the way out.
+class TeacherResponse(BaseModel):
+    id: int
+    name: Optional[str] = None
+    username: Optional[str] = None
+    role: Optional[str] = None
+    subject: Optional[str] = None
+
+class SectionResponse(BaseModel):
+    id: int
+    name: Optional[str] = None
+    branch: Optional[str] = None
+    year: Optional[str] = None
+
+class TestResponse(BaseModel):
+    id: str
+    testName: Optional[str] = None
+    subject: Optional[str] = None
+    year: Optional[str] = None
+    branch: Optional[str] = None
+    section: Optional[str] = None
+    numberOfQuestions: Optional[int] = None  # Page endpoint only, with ?fields=
+    startTime: Optional[str] = None
+    endTime: Optional[str] = None
+    createdBy: Optional[str] = None
+
+class QuestionResponse(BaseModel):
+    id: str
+    question: str
+    option_a: str
+    option_b: str
+    option_c: str
+    option_d: str
+
+class FacultyQuestionResponse(QuestionResponse):
+    correct_answer: str
+
+class JobResponse(BaseModel):
+    id: int
+    title: Optional[str] = None
+    description: Optional[str] = None
+    company: Optional[str] = None
+    year: Optional[str] = None
+    branch: Optional[str] = None
+    section: Optional[str] = None
+    posted_by: Optional[str] = None
+    posted_at: Optional[datetime] = None
+
+class SubjectScoreResponse(BaseModel):
+    subjectName: Optional[str] = None
+    marks: Optional[float] = None
+    assessmentScore: float
+    finalScore: Optional[float] = None
+
+class ClassStudentResponse(BaseModel):
+    rollNumber: str
+    name: Optional[str] = None
+    subjects: List[SubjectScoreResponse]
+    totalMarks: float
+    averageMarks: float
+
+class ClassPerformanceResponse(BaseModel):
+    year: str
+    branch: str
+    section: str
+    students: List[ClassStudentResponse]
+
+class StudentRankResponse(BaseModel):
+    rollNumber: str
+    name: Optional[str] = None
+    score: float
+    rank: int
+    percentile: float
+
+class HistogramResponse(BaseModel):
+    edges: List[float]
+    counts: List[int]
+
+class SubjectStatisticsResponse(BaseModel):
+    subject: str
+    count: int
+    mean: float
+    median: float
+    std: float
+    min: float
+    max: float
+    percentiles: dict[str, float]
+    histogram: HistogramResponse
+    categories: dict[str, int]
+    students: Optional[List[StudentRankResponse]] = None  # Left out with ?students=false
+
+class ClassStatisticsResponse(BaseModel):
+    year: str
+    branch: str
+    section: str
+    subjects: List[SubjectStatisticsResponse]
+
+class TrendPointResponse(BaseModel):
+    date: str
+    average: float
+    rollingAverage: float
+    count: int
+
+class SubjectTrendResponse(BaseModel):
+    subject: str
+    points: List[TrendPointResponse]
+    slopePer30Days: Optional[float] = None
+    first: float
+    latest: float
+    delta: float
+    recentDelta: Optional[float] = None
+
+class TrendResponse(BaseModel):
+    period: str
+    windowDays: int
+    subjects: List[SubjectTrendResponse]
+
+class StudentFlagResponse(BaseModel):
+    rollNumber: Optional[str] = None
+    year: Optional[str] = None
+    branch: Optional[str] = None
+    section: Optional[str] = None
+    decliningSubjects: Optional[int] = None
+    slope: Optional[float] = None
+    worstSubject: Optional[str] = None
+    worstSlope: Optional[float] = None
+    flaggedAt: Optional[datetime] = None
+
+class ScoringRunResponse(BaseModel):
+    id: int
+    startedAt: datetime
+    finishedAt: Optional[datetime] = None
+    status: str
+    full: bool
+    lastResultId: Optional[int] = None
+    rowsRescored: Optional[int] = None
+    studentsFlagged: Optional[int] = None
+    seconds: Optional[float] = None
+    error: Optional[str] = None
+
+class UploadBatchResponse(BaseModel):
+    id: Optional[int] = None
+    uploadBatch: Optional[str] = None
+    fileHash: Optional[str] = None
+    filename: Optional[str] = None
+    year: Optional[str] = None
+    branch: Optional[str] = None
+    section: Optional[str] = None
+    subject: Optional[str] = None
+    uploadedBy: Optional[str] = None
+    source: Optional[str] = None
+    status: Optional[str] = None
+    rowCount: Optional[int] = None
+    inserted: Optional[int] = None
+    updated: Optional[int] = None
+    unchanged: Optional[int] = None
+    errorCount: Optional[int] = None
+    errors: Optional[List[dict]] = None
+    error: Optional[str] = None
+    startedAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
+    readSeconds: Optional[float] = None
+    writeSeconds: Optional[float] = None
+    seconds: Optional[float] = None
+    rowsPerSecond: Optional[float] = None
+    rolledBackAt: Optional[datetime] = None
+
+PageItem = TypeVar("PageItem")
+
+class Page(BaseModel, Generic[PageItem]):
+    """Keyset page envelope; items carry only the fields picked with ?fields=."""
+    items: List[PageItem]
+    nextCursor: Optional[str] = None
+    total: Optional[int] = None
+    totalExact: bool
+
 @app.post("/api/admin/login")
 async def login_admin(request: AdminLoginRequest):
     """Validates super admin credentials from environment variables."""
@@ -265,62 +1315,53 @@ async def login_admin(request: AdminLoginRequest):
     raise HTTPException(status_code=401, detail="Invalid admin credentials")
 
 @app.post("/api/students/register")
-async def register_student(request: StudentRegisterRequest):
-    db = SessionLocal()
-    try:
-        if db.query(Student).filter(Student.rollNumber == request.rollNumber).first():
-            raise HTTPException(status_code=400, detail="Student already exists")
-        
-        new_student = Student(
-            name=request.name,
-            rollNumber=request.rollNumber,
-            password=hash_password(request.password),
-            section=request.section,
-            branch=request.branch,
-            year=request.year
-        )
-        db.add(new_student)
-        db.commit()
-        return {"message": "Student registered successfully"}
-    finally:
-        db.close()
+async def register_student(request: StudentRegisterRequest, db: AsyncSession = Depends(get_db)):
+    if await db.scalar(select(Student.id).where(Student.rollNumber == request.rollNumber)):
+        raise HTTPException(status_code=400, detail="Student already exists")
+    
+    new_student = Student(
+        name=request.name,
+        rollNumber=request.rollNumber,
+        password=hash_password(request.password),
+        section=request.section,
+        branch=request.branch,
+        year=request.year
+    )
+    db.add(new_student)
+    await db.commit()
+    return {"message": "Student registered successfully"}
 
 @app.post("/api/students/login")
-async def login_student(request: StudentLoginRequest):
-    db = SessionLocal()
-    try:
-        student = db.query(Student).filter(Student.rollNumber == request.rollNumber).first()
-        if not student:
+async def login_student(request: StudentLoginRequest, db: AsyncSession = Depends(get_db)):
+    student = await db.scalar(select(Student).where(Student.rollNumber == request.rollNumber))
+    if not student:
+        raise HTTPException(status_code=401, detail="Invalid roll number or password")
+    
+    if student.password != hash_password(request.password):
+        # Allow fallback to plain text if the user existed from before hashing was implemented
+        if student.password != request.password:
             raise HTTPException(status_code=401, detail="Invalid roll number or password")
-        
-        if student.password != hash_password(request.password):
-            # Allow fallback to plain text if the user existed from before hashing was implemented
-            if student.password != request.password:
-                raise HTTPException(status_code=401, detail="Invalid roll number or password")
-            else:
-                # Optional: Upgrade password to hash here automatically
-                student.password = hash_password(request.password)
-                db.commit()
-
-        return {
-            "message": "Login successful",
-            "student": {
-                "name": student.name,
-                "rollNumber": student.rollNumber,
-                "section": student.section,
-                "branch": student.branch,
-                "year": student.year
-            }
+        else:
+            # Optional: Upgrade password to hash here automatically
+            student.password = hash_password(request.password)
+            await db.commit()
+
+    return {
+        "message": "Login successful",
+        "student": {
+            "name": student.name,
+            "rollNumber": student.rollNumber,
+            "section": student.section,
+            "branch": student.branch,
+            "year": student.year
         }
-    finally:
-        db.close()
+    }
 
 @app.post("/api/teachers/add")
-async def add_teacher(teacher: TeacherCreateRequest):
-    db: Session = SessionLocal()
+async def add_teacher(teacher: TeacherCreateRequest, db: AsyncSession = Depends(get_db)):
     try:
         # Check if username already exists
-        existing = db.query(Teacher).filter(Teacher.username == teacher.username).first()
+        existing = await db.scalar(select(Teacher.id).where(Teacher.username == teacher.username))
         if existing:
             raise HTTPException(status_code=400, detail="Username already exists")
 
@@ -332,20 +1373,18 @@ async def add_teacher(teacher: TeacherCreateRequest):
             subject=teacher.subject
         )
         db.add(new_teacher)
-        db.commit()
-        db.refresh(new_teacher)
+        await db.commit()
         return {"message": "Teacher added successfully", "teacher": {"id": new_teacher.id, "name": new_teacher.name, "username": new_teacher.username, "role": new_teacher.role, "subject": new_teacher.subject}}
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        db.close()
 
 @app.post("/api/teachers/login")
-async def login_teacher(login_req: TeacherLoginRequest):
-    db: Session = SessionLocal()
+async def login_teacher(login_req: TeacherLoginRequest, db: AsyncSession = Depends(get_db)):
     try:
-        teacher = db.query(Teacher).filter(Teacher.username == login_req.username).first()
+        teacher = await db.scalar(select(Teacher).where(Teacher.username == login_req.username))
         if not teacher:
             raise HTTPException(status_code=401, detail="Invalid username or password")
             
@@ -355,7 +1394,7 @@ async def login_teacher(login_req: TeacherLoginRequest):
                 raise HTTPException(status_code=401, detail="Invalid username or password")
             else:
                 teacher.password = hash_password(login_req.password)
-                db.commit()
+                await db.commit()
             
         return {
             "message": "Login successful",
@@ -371,69 +1410,114 @@ async def login_teacher(login_req: TeacherLoginRequest):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail="Internal server error")
-    finally:
-        db.close()
 
-@app.get("/api/teachers")
-async def get_teachers():
-    db = SessionLocal()
-    try:
-        teachers = db.query(Teacher).all()
-        return [
-            {
-                "id": t.id,
-                "name": t.name,
-                "username": t.username,
-                "role": t.role,
-                "subject": t.subject
-            } for t in teachers
-        ]
-    finally:
-        db.close()
+TEACHER_FIELDS = {
+    "id": Teacher.id,
+    "name": Teacher.name,
+    "username": Teacher.username,
+    "role": Teacher.role,
+    "subject": Teacher.subject
+}
+
+@app.get("/api/teachers", response_model=List[TeacherResponse])
+async def get_teachers(db: AsyncSession = Depends(get_db)):
+    rows = (await db.execute(select(*TEACHER_FIELDS.values()))).all()
+    return rows_response(TEACHER_FIELDS, rows)
+
+@app.get("/api/teachers/page", response_model=Page[TeacherResponse])
+async def get_teachers_page(role: Optional[str] = None, subject: Optional[str] = None, fields: Optional[str] = None,
+                            limit: int = pagination.DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                            count: str = "estimate", db: AsyncSession = Depends(get_db)):
+    """Keyset-paginated /api/teachers in id order. Pass nextCursor back as ?cursor= for the next page."""
+    where = []
+    if role:
+        where.append(Teacher.role == role)
+    if subject:
+        where.append(Teacher.subject == subject)
+    return FastJSONResponse(await pagination.keyset_page(
+        db, Teacher, TEACHER_FIELDS, (Teacher.id,),
+        pagination.parse_fields(fields, TEACHER_FIELDS, TEACHER_FIELDS),
+        where=where, limit=limit, cursor=cursor, count=count
+    ))
 
 @app.post("/api/sections/add")
-async def add_section(request: SectionCreateRequest):
-    db = SessionLocal()
-    try:
-        if db.query(Section).filter(Section.name == request.name).first():
-            raise HTTPException(status_code=400, detail="Section already exists")
-        
-        new_section = Section(
-            name=request.name,
-            branch=request.branch,
-            year=request.year
+async def add_section(request: SectionCreateRequest, db: AsyncSession = Depends(get_db)):
+    if await db.scalar(select(Section.id).where(Section.name == request.name)):
+        raise HTTPException(status_code=400, detail="Section already exists")
+    
+    new_section = Section(
+        name=request.name,
+        branch=request.branch,
+        year=request.year
+    )
+    db.add(new_section)
+    await db.commit()
+    return {"message": "Section added successfully", "section": request.model_dump()}
+
+SECTION_FIELDS = {
+    "id": Section.id,
+    "name": Section.name,
+    "branch": Section.branch,
+    "year": Section.year
+}
+
+@app.get("/api/sections", response_model=List[SectionResponse])
+async def get_sections(db: AsyncSession = Depends(get_db)):
+    rows = (await db.execute(select(*SECTION_FIELDS.values()))).all()
+    return rows_response(SECTION_FIELDS, rows)
+
+@app.get("/api/sections/page", response_model=Page[SectionResponse])
+async def get_sections_page(year: Optional[str] = None, branch: Optional[str] = None, fields: Optional[str] = None,
+                            limit: int = pagination.DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                            count: str = "estimate", db: AsyncSession = Depends(get_db)):
+    """Keyset-paginated /api/sections in id order. Pass nextCursor back as ?cursor= for the next page."""
+    where = []
+    if year:
+        where.append(Section.year == year)
+    if branch:
+        where.append(Section.branch == branch)
+    return FastJSONResponse(await pagination.keyset_page(
+        db, Section, SECTION_FIELDS, (Section.id,),
+        pagination.parse_fields(fields, SECTION_FIELDS, SECTION_FIELDS),
+        where=where, limit=limit, cursor=cursor, count=count
+    ))
+
+def question_generator() -> question_generation.QuestionGenerator:
+    """Returns the configured generator backend, refusing Gemini when no API key is set."""
+    if QUESTION_GENERATOR == "gemini" and not GEMINI_API_KEY:
+        raise HTTPException(status_code=500, detail="Gemini API Key is not configured. Cannot generate questions.")
+    return question_generation.GENERATORS[QUESTION_GENERATOR]
+
+QUESTION_FIELDS = question_generation.QUESTION_FIELDS
+
+async def load_bank_questions(key: str) -> list:
+    """Returns the unexpired questions of a bank pool as question dicts."""
+    cutoff = datetime.utcnow() - timedelta(days=QUESTION_BANK_TTL_DAYS)
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(
+            select(*(getattr(BankQuestion, field) for field in QUESTION_FIELDS))
+            .where(BankQuestion.bank_key == key, BankQuestion.created_at >= cutoff)
+            .order_by(BankQuestion.id)
         )
-        db.add(new_section)
-        db.commit()
-        return {"message": "Section added successfully", "section": request.model_dump()}
-    finally:
-        db.close()
-
-@app.get("/api/sections")
-async def get_sections():
-    db = SessionLocal()
-    try:
-        sections = db.query(Section).all()
-        return [
-            {
-                "id": s.id,
-                "name": s.name,
-                "branch": s.branch,
-                "year": s.year
-            } for s in sections
-        ]
-    finally:
-        db.close()
-
-# ⚠️ BILLING WARNING: This endpoint calls the Google Gemini API which may incur costs.
-# Ensure GEMINI_API_KEY is set and monitor usage in your Google Cloud Console.
-@app.post("/api/tests/create")
-async def create_test(request: TestCreateRequest):
-    db: Session = SessionLocal()
-    try:
-        if not GEMINI_API_KEY:
-            raise HTTPException(status_code=500, detail="Gemini API Key is not configured. Cannot generate questions.")
-
+        return [dict(zip(QUESTION_FIELDS, row)) for row in rows]
+
+def bank_generated_questions(db: Session, key: str, subject: str, difficulty: str, questions: list):
+    """Adds generated questions to their bank pool, skipping duplicates and pruning expired entries."""
+    cutoff = datetime.utcnow() - timedelta(days=QUESTION_BANK_TTL_DAYS)
+    db.query(BankQuestion).filter(BankQuestion.bank_key == key, BankQuestion.created_at < cutoff).delete()
+    stmt = dialect_insert(db, BankQuestion).on_conflict_do_nothing(index_elements=["bank_key", "content_hash"])
+    db.execute(stmt, [
+        {
+            "bank_key": key,
+            "content_hash": question_generation.question_hash(q_data),
+            "subject": subject,
+            "difficulty": difficulty,
+            **{field: q_data.get(field, "") for field in QUESTION_FIELDS}
+        } for q_data in questions
+    ])
+
+async def create_test_record(request: TestCreateRequest) -> Test:
+    async with AsyncSessionLocal() as db:
         new_test = Test(
             testName=request.testName,
             subject=request.subject,
@@ -446,447 +1530,1195 @@ async def create_test(request: TestCreateRequest):
             createdBy=request.createdBy
         )
         db.add(new_test)
-        db.commit()
-        db.refresh(new_test)
+        await db.commit()
+        return new_test
 
-        # Call Gemini to generate questions
-        try:
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            prompt = f"""
-            Generate exactly {request.numberOfQuestions} multiple choice questions for the subject "{request.subject}".
-            Return the result ONLY as a raw JSON array of objects. Do not use markdown blocks like ```json.
-            Each object must use these exact keys:
-            "question", "option_a", "option_b", "option_c", "option_d", "correct_answer".
-            Make sure "correct_answer" exactly matches the text of one of the options (A, B, C, or D).
-            """
-            response = model.generate_content(prompt)
-            
-            # Clean up the response if Gemini wraps it in markdown
-            raw_text = response.text.strip()
-            if raw_text.startswith("```json"):
-                raw_text = raw_text[7:]
-            if raw_text.startswith("```"):
-                raw_text = raw_text[3:]
-            if raw_text.endswith("```"):
-                raw_text = raw_text[:-3]
-                
-            questions_data = json.loads(raw_text.strip())
-
-            for q_data in questions_data:
-                q_model = Question(
-                    test_id=new_test.id,
-                    question=q_data.get("question", "Unknown Question"),
-                    option_a=q_data.get("option_a", ""),
-                    option_b=q_data.get("option_b", ""),
-                    option_c=q_data.get("option_c", ""),
-                    option_d=q_data.get("option_d", ""),
-                    correct_answer=q_data.get("correct_answer", "")
-                )
-                db.add(q_model)
-            
-            db.commit()
+async def store_generated_questions(test_id: int, questions: list, bank: tuple = None):
+    """
+    Inserts one chunk of questions in its own transaction, so earlier chunks survive a
+    later failure. bank=(key, subject, difficulty) also adds them to the question bank.
+    """
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(Question), [
+            {
+                "test_id": test_id,
+                "question": q_data.get("question", "Unknown Question"),
+                "option_a": q_data.get("option_a", ""),
+                "option_b": q_data.get("option_b", ""),
+                "option_c": q_data.get("option_c", ""),
+                "option_d": q_data.get("option_d", ""),
+                "correct_answer": q_data.get("correct_answer", "")
+            } for q_data in questions
+        ])
+        if bank:
+            await db.run_sync(bank_generated_questions, *bank, questions)
+        mark_tests_changed(db, [test_id])
+        await db.commit()
+
+class TestBuild:
+    """A new test plus the plan for filling it: banked questions to reuse and the shortfall to generate."""
+    __slots__ = ("test", "difficulty", "bank_key", "reused", "shortfall", "generator")
+
+    def __init__(self, test, difficulty, bank_key, reused, shortfall, generator):
+        self.test = test
+        self.difficulty = difficulty
+        self.bank_key = bank_key
+        self.reused = reused
+        self.shortfall = shortfall
+        self.generator = generator
+
+async def plan_tests(requests: list) -> list:
+    """
+    Checks the question bank for every request, then creates the test records. Fails
+    before creating anything if some test needs generation and no backend is available.
+    """
+    banked = {}
+    plans = []
+    for request in requests:
+        key = question_generation.bank_key(request.subject, request.difficulty)
+        if key not in banked:
+            banked[key] = await load_bank_questions(key)
+        reused = random.sample(banked[key], min(len(banked[key]), request.numberOfQuestions))
+        plans.append((request, key, reused))
+    needs_generation = any(len(reused) < request.numberOfQuestions for request, _, reused in plans)
+    generator = question_generator() if needs_generation else None
+
+    builds = []
+    for request, key, reused in plans:
+        test = await create_test_record(request)
+        builds.append(TestBuild(test, request.difficulty, key, reused, request.numberOfQuestions - len(reused), generator))
+    return builds
+
+async def plan_test(request: TestCreateRequest) -> TestBuild:
+    return (await plan_tests([request]))[0]
+
+async def fill_test(build: TestBuild, on_stored=None, semaphore=None):
+    """
+    Stores the reused bank questions, then generates and stores the shortfall chunk by
+    chunk. A shared semaphore bounds in-flight chunks across concurrently filled tests.
+    """
+    test = build.test
+    question_bank_stats.record(test.numberOfQuestions, len(build.reused))
+
+    async def store(questions, bank=None):
+        await store_generated_questions(test.id, questions, bank=bank)
+        if on_stored:
+            on_stored(len(questions))
+
+    if build.reused:
+        await store(build.reused)
+    if build.shortfall > 0:
+        bank = (build.bank_key, test.subject, build.difficulty)
+
+        async def on_chunk(questions):
+            question_bank_stats.generated += len(questions)
+            await store(questions, bank=bank)
+
+        await question_generation.generate_questions(
+            build.generator, test.subject, build.difficulty, build.shortfall, on_chunk, seed=test.id,
+            chunk_size=GENERATION_CHUNK_SIZE, concurrency=GENERATION_CONCURRENCY,
+            retries=GENERATION_RETRIES, timeout=GENERATION_TIMEOUT, semaphore=semaphore
+        )
 
+# ⚠️ BILLING WARNING: These endpoints call the Google Gemini API which may incur costs.
+# Ensure GEMINI_API_KEY is set and monitor usage in your Google Cloud Console.
+@app.post("/api/tests/create")
+async def create_test(request: TestCreateRequest):
+    """
+    Creates a test, reusing banked questions for the same subject and difficulty and
+    generating only the shortfall, in parallel chunks. Chunks are stored as they arrive;
+    if some still fail after retries the test keeps the questions stored so far and the
+    error is reported.
+    """
+    build = await plan_test(request)
+    try:
+        await fill_test(build)
+    except Exception as e:
+        logger.error(f"Error generating questions via {QUESTION_GENERATOR}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to generate questions: {str(e)}")
+
+    return {
+        "message": "Test and questions created successfully",
+        "test": request.model_dump(),
+        "test_id": build.test.id,
+        "reusedQuestions": len(build.reused),
+        "generatedQuestions": max(build.shortfall, 0)
+    }
+
+@app.post("/api/tests/create/stream")
+async def create_test_stream(request: TestCreateRequest):
+    """
+    Same as create_test, but streams newline-delimited JSON progress events while the
+    questions are stored: "created", one "progress" per stored chunk, then "done" or
+    "error". Generation stops if the client disconnects.
+    """
+    build = await plan_test(request)
+    test_id = build.test.id
+    total = build.test.numberOfQuestions
+
+    def event(name, **fields):
+        return json.dumps({"event": name, "test_id": test_id, **fields}) + "\n"
+
+    async def events():
+        progress = asyncio.Queue()
+        task = asyncio.create_task(fill_test(build, on_stored=progress.put_nowait))
+        task.add_done_callback(lambda _: progress.put_nowait(None))
+        yield event("created", total=total, reused=len(build.reused))
+        stored_count = 0
+        try:
+            while (stored := await progress.get()) is not None:
+                stored_count += stored
+                yield event("progress", generated=stored_count, total=total)
+            await task
+            yield event("done", generated=stored_count, total=total)
         except Exception as e:
-            logger.error(f"Error generating questions via Gemini: {e}")
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Failed to generate questions: {str(e)}")
-
-        return {"message": "Test and questions created successfully", "test": request.model_dump(), "test_id": new_test.id}
-    finally:
-        db.close()
+            logger.error(f"Error generating questions via {QUESTION_GENERATOR}: {e}")
+            yield event("error", generated=stored_count, total=total, detail=f"Failed to generate questions: {str(e)}")
+        finally:
+            task.cancel()
 
-@app.get("/api/tests/student")
-async def get_student_tests(year: str, branch: str, section: str, student_roll: str):
-    db: Session = SessionLocal()
-    try:
-        from datetime import datetime
-        
-        # 1. Fetch tests the student has already taken
-        taken_tests = db.query(StudentTestResult.test_id).filter(
-            StudentTestResult.student_roll == student_roll
-        ).all()
-        taken_test_ids = [t[0] for t in taken_tests]
-
-        # 2. Fetch active assigned tests mapping to the student demographic
-        all_assigned_tests = db.query(Test).filter(
-            Test.year == year,
-            Test.branch == branch,
-            Test.section == section
-        ).all()
-
-        current_time = datetime.now()
-        available_tests = []
-
-        # 3. Filter out taken tests, and tests where the endTime is strictly in the past
-        for t in all_assigned_tests:
-            if t.id in taken_test_ids:
-                continue
-                
-            try:
-                # The frontend passes startTime and endTime as ISO dates or 'HH:MM' (which gets appended to date in the frontend state). Let's parse securely.
-                # Assuming t.endTime is an ISO string: "2026-03-06T15:30"
-                if t.endTime:
-                    end_dt = datetime.fromisoformat(t.endTime)
-                    if current_time > end_dt:
-                        continue # Time has expired
-            except Exception as e:
-                logger.warning(f"Could not parse test end time for {t.id}: {t.endTime} - {e}")
-                
-            available_tests.append(t)
-        
-        return [
-            {
-                "id": str(t.id),
-                "testName": t.testName,
-                "subject": t.subject,
-                "year": t.year,
-                "branch": t.branch,
-                "section": t.section,
-                "startTime": t.startTime,
-                "endTime": t.endTime,
-                "createdBy": t.createdBy
-            } for t in available_tests
-        ]
-    finally:
-        db.close()
+    return StreamingResponse(events(), media_type="application/x-ndjson")
 
-@app.get("/api/tests/faculty")
-async def get_faculty_tests(username: str):
-    db: Session = SessionLocal()
-    try:
-        tests = db.query(Test).filter(Test.createdBy == username).all()
-        return [
+@app.post("/api/tests/create/batch")
+async def create_tests_batch(request: TestBatchCreateRequest):
+    """
+    Creates the same test for several sections in one call, one test per section. Sections
+    drawing on the same question-bank pool generate its shortfall once and each sample
+    their own selection from it; all generation shares one semaphore, so the batch keeps
+    at most GENERATION_CONCURRENCY chunks in flight. A section whose generation fails
+    reports its error without failing the rest.
+    """
+    common = request.model_dump(exclude={"sections"})
+    builds = await plan_tests([
+        TestCreateRequest(**common, **section.model_dump()) for section in request.sections
+    ])
+    semaphore = asyncio.Semaphore(GENERATION_CONCURRENCY)
+    errors = {}
+
+    async def fill(build):
+        try:
+            await fill_test(build, semaphore=semaphore)
+        except Exception as e:
+            logger.error(f"Error generating questions for test {build.test.id} via {QUESTION_GENERATOR}: {e}")
+            errors[build.test.id] = f"Failed to generate questions: {str(e)}"
+
+    async def fill_pool(pool_builds):
+        # The section with the largest shortfall generates it into the bank once; the
+        # others then draw from the refilled pool and only generate what is still missing
+        lead = max(pool_builds, key=lambda build: build.shortfall)
+        await fill(lead)
+        others = [build for build in pool_builds if build is not lead]
+        if others and lead.shortfall > 0:
+            banked = await load_bank_questions(lead.bank_key)
+            for build in others:
+                build.reused = random.sample(banked, min(len(banked), build.test.numberOfQuestions))
+                build.shortfall = build.test.numberOfQuestions - len(build.reused)
+        # Bank-only fills are a single short write each, and run fastest back to back
+        for build in others:
+            if build.shortfall <= 0:
+                await fill(build)
+        await asyncio.gather(*(fill(build) for build in others if build.shortfall > 0))
+
+    pools = {}
+    for build in builds:
+        pools.setdefault(build.bank_key, []).append(build)
+    await asyncio.gather(*(fill_pool(pool_builds) for pool_builds in pools.values()))
+
+    return {
+        "message": f"Created {len(builds)} tests",
+        "failed": len(errors),
+        "tests": [
             {
-                "id": str(t.id),
-                "testName": t.testName,
-                "subject": t.subject,
-                "year": t.year,
-                "branch": t.branch,
-                "section": t.section,
-                "startTime": t.startTime,
-                "endTime": t.endTime,
-                "createdBy": t.createdBy
-            } for t in tests
+                "test_id": build.test.id,
+                "year": build.test.year,
+                "branch": build.test.branch,
+                "section": build.test.section,
+                "reusedQuestions": len(build.reused),
+                "generatedQuestions": max(build.shortfall, 0),
+                "error": errors.get(build.test.id)
+            } for build in builds
         ]
-    finally:
-        db.close()
-
-@app.get("/api/tests/{test_id}/questions")
-async def get_test_questions(test_id: int, student_roll: str):
+    }
+
+TEST_FIELDS = {
+    "id": cast(Test.id, String),
+    "testName": Test.testName,
+    "subject": Test.subject,
+    "year": Test.year,
+    "branch": Test.branch,
+    "section": Test.section,
+    "numberOfQuestions": Test.numberOfQuestions,
+    "startTime": Test.startTime,
+    "endTime": Test.endTime,
+    "createdBy": Test.createdBy
+}
+TEST_DEFAULT_FIELDS = [field for field in TEST_FIELDS if field != "numberOfQuestions"]
+
+@app.get("/api/tests/student", response_model=List[TestResponse])
+async def get_student_tests(year: str, branch: str, section: str, student_roll: str, db: AsyncSession = Depends(get_db)):
+    # Active tests assigned to the student's class that they have not taken yet
+    taken_tests = select(StudentTestResult.test_id).where(StudentTestResult.student_roll == student_roll)
+    rows = (await db.execute(select(*(TEST_FIELDS[field] for field in TEST_DEFAULT_FIELDS)).where(
+        Test.year == year,
+        Test.branch == branch,
+        Test.section == section,
+        Test.id.not_in(taken_tests)
+    ))).all()
+
+    current_time = datetime.now()
+    end_index = TEST_DEFAULT_FIELDS.index("endTime")
+    available_tests = []
+
+    # Filter out tests where the endTime is strictly in the past
+    for row in rows:
+        end_time = row[end_index]
+        try:
+            # The frontend passes startTime and endTime as ISO dates or 'HH:MM' (which gets appended to date in the frontend state). Let's parse securely.
+            # Assuming endTime is an ISO string: "2026-03-06T15:30"
+            if end_time and current_time > datetime.fromisoformat(end_time):
+                continue # Time has expired
+        except Exception as e:
+            logger.warning(f"Could not parse test end time for {row[0]}: {end_time} - {e}")
+
+        available_tests.append(row)
+
+    return rows_response(TEST_DEFAULT_FIELDS, available_tests)
+
+@app.get("/api/tests/faculty", response_model=List[TestResponse])
+async def get_faculty_tests(username: str, db: AsyncSession = Depends(get_db)):
+    rows = (await db.execute(select(*(TEST_FIELDS[field] for field in TEST_DEFAULT_FIELDS)).where(
+        Test.createdBy == username
+    ))).all()
+    return rows_response(TEST_DEFAULT_FIELDS, rows)
+
+@app.get("/api/tests/faculty/page", response_model=Page[TestResponse])
+async def get_faculty_tests_page(username: str, subject: Optional[str] = None, year: Optional[str] = None,
+                                 branch: Optional[str] = None, section: Optional[str] = None,
+                                 fields: Optional[str] = None, limit: int = pagination.DEFAULT_PAGE_SIZE,
+                                 cursor: Optional[str] = None, count: str = "estimate",
+                                 db: AsyncSession = Depends(get_db)):
+    """Keyset-paginated /api/tests/faculty, newest first, walking ix_tests_created_by."""
+    where = [Test.createdBy == username]
+    for column, value in ((Test.subject, subject), (Test.year, year), (Test.branch, branch), (Test.section, section)):
+        if value:
+            where.append(column == value)
+    return FastJSONResponse(await pagination.keyset_page(
+        db, Test, TEST_FIELDS, (Test.id,),
+        pagination.parse_fields(fields, TEST_FIELDS, TEST_DEFAULT_FIELDS),
+        where=where, limit=limit, cursor=cursor, descending=True, count=count
+    ))
+
+async def load_question_sets(db: AsyncSession, test_ids) -> dict:
+    """Returns {test_id: QuestionSet} for those of test_ids that have questions, served from question_set_cache."""
+    sets = {}
+    missing = []
+    for test_id in test_ids:
+        cached = question_set_cache.get(test_id)
+        if cached is None:
+            missing.append(test_id)
+        else:
+            sets[test_id] = cached
+    if not missing:
+        return sets
+
+    generation = question_set_cache.generation
+    loaded = {}
+    rows = await db.execute(
+        select(Question.test_id, Question.id, Question.question, Question.option_a, Question.option_b,
+               Question.option_c, Question.option_d, Question.correct_answer)
+        .where(Question.test_id.in_(missing))
+        .order_by(Question.id)
+    )
+    for test_id, *fields in rows:
+        loaded.setdefault(test_id, []).append(CachedQuestion(*fields))
+    for test_id, questions in loaded.items():
+        sets[test_id] = QuestionSet(questions)
+        question_set_cache.set(test_id, sets[test_id], generation=generation)
+    return sets
+
+def assignment_rng(test_id: int, student_roll: str, salt: int = 0) -> random.Random:
+    """A Random seeded from the test, the student and an optional salt, so every shuffle can be recomputed."""
+    digest = hashlib.sha256(f"{test_id}:{student_roll}:{salt}".encode()).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+def pick_questions(test: "Test", question_set: QuestionSet, student_roll: str) -> list:
+    """Deterministically selects and orders a student's questions for a test."""
+    all_questions = list(question_set.questions)
+    # Select required number (or all if not enough), in a per-student random order
+    num_req = min(test.numberOfQuestions or len(all_questions), len(all_questions))
+    return assignment_rng(test.id, student_roll).sample(all_questions, num_req)
+
+@app.post("/api/tests/{test_id}/open")
+async def open_test(test_id: int, db: AsyncSession = Depends(get_db)):
+    """
+    Pre-assigns questions to every registered student of the test's class in one bulk insert.
+    Students who already have an assignment keep it, so opening a test twice is harmless.
+    """
+    test = await db.get(Test, test_id)
+    if not test:
+        raise HTTPException(status_code=404, detail="Test not found")
+    question_set = (await load_question_sets(db, [test_id])).get(test_id)
+    if not question_set:
+        raise HTTPException(status_code=400, detail="Test has no questions to assign.")
+
+    rolls = (await db.scalars(select(Student.rollNumber).where(
+        Student.year == test.year, Student.branch == test.branch, Student.section == test.section
+    ))).all()
+    already_assigned = set((await db.scalars(
+        select(StudentAssignedQuestion.student_roll).where(StudentAssignedQuestion.test_id == test_id).distinct()
+    )).all())
+
+    rows = []
+    new_rolls = [roll for roll in rolls if roll not in already_assigned]
+    for roll in new_rolls:
+        rows.extend(
+            {"student_roll": roll, "test_id": test_id, "question_id": q.id}
+            for q in pick_questions(test, question_set, roll)
+        )
+    if rows:
+        await db.execute(insert(StudentAssignedQuestion), rows)
+        await db.commit()
+
+    return {
+        "message": "Test opened successfully",
+        "assignedStudents": len(new_rolls),
+        "alreadyAssigned": len(rolls) - len(new_rolls),
+        "assignments": len(rows)
+    }
+
+@app.get("/api/tests/{test_id}/questions", response_model=List[QuestionResponse])
+async def get_test_questions(test_id: int, student_roll: str, db: AsyncSession = Depends(get_db)):
     """
     Fetches the questions for a specific test for the student to take.
     OMITS the correct_answer field for security.
+    Read-only: students pre-assigned by open_test get their stored questions, anyone else
+    gets the same seeded selection open_test would have stored for them.
     """
-    db: Session = SessionLocal()
-    try:
-        test = db.query(Test).filter(Test.id == test_id).first()
-        if not test:
-            raise HTTPException(status_code=404, detail="Test not found")
-
-        # Check if the student already has assigned questions for this test
-        assigned_questions = db.query(StudentAssignedQuestion).filter(
-            StudentAssignedQuestion.student_roll == student_roll,
-            StudentAssignedQuestion.test_id == test_id
-        ).all()
-
-        import random
-
-        if assigned_questions:
-            # Fetch those specific questions
-            question_ids = [aq.question_id for aq in assigned_questions]
-            selected_questions_unordered = db.query(Question).filter(Question.id.in_(question_ids)).all()
-            
-            # Sort them in the order they were assigned to maintain order per student
-            q_map = {q.id: q for q in selected_questions_unordered}
-            selected_questions = [q_map[q_id] for q_id in question_ids if q_id in q_map]
-        else:
-            # First time: select random questions and assign them
-            all_questions = db.query(Question).filter(Question.test_id == test_id).all()
-            
-            # Select required number (or all if not enough)
-            num_req = test.numberOfQuestions if test.numberOfQuestions else len(all_questions)
-            if num_req > len(all_questions):
-                num_req = len(all_questions)
-                
-            selected_questions = random.sample(all_questions, num_req) if num_req < len(all_questions) else all_questions
-            # Randomize order even if we pick all
-            random.shuffle(selected_questions)
-
-            # Save the assignment
-            for q in selected_questions:
-                assignment = StudentAssignedQuestion(
-                    student_roll=student_roll,
-                    test_id=test_id,
-                    question_id=q.id
-                )
-                db.add(assignment)
-            db.commit()
-
-        result = []
-        for q in selected_questions:
-            # Shuffle options
-            options = [
-                {"key": "a", "text": q.option_a},
-                {"key": "b", "text": q.option_b},
-                {"key": "c", "text": q.option_c},
-                {"key": "d", "text": q.option_d}
-            ]
-            random.shuffle(options)
-            
-            result.append({
-                "id": str(q.id),
-                "question": q.question,
-                "option_a": options[0]["text"],
-                "option_b": options[1]["text"],
-                "option_c": options[2]["text"],
-                "option_d": options[3]["text"]
-            })
-
-        return result
-    finally:
-        db.close()
+    test = await db.get(Test, test_id)
+    if not test:
+        raise HTTPException(status_code=404, detail="Test not found")
+
+    question_set = (await load_question_sets(db, [test_id])).get(test_id)
+    if not question_set:
+        return FastJSONResponse([])
+
+    # Assigned questions are returned in the order they were assigned
+    question_ids = (await db.scalars(select(StudentAssignedQuestion.question_id).where(
+        StudentAssignedQuestion.student_roll == student_roll,
+        StudentAssignedQuestion.test_id == test_id
+    ).order_by(StudentAssignedQuestion.id))).all()
+    if question_ids:
+        selected_questions = [question_set.by_id[q_id] for q_id in question_ids if q_id in question_set.by_id]
+    else:
+        selected_questions = pick_questions(test, question_set, student_roll)
+
+    result = []
+    for q in selected_questions:
+        # Option order is shuffled per student and question, and recomputed on every fetch
+        options = [q.option_a, q.option_b, q.option_c, q.option_d]
+        assignment_rng(test_id, student_roll, q.id).shuffle(options)
+        result.append({
+            "id": str(q.id),
+            "question": q.question,
+            "option_a": options[0],
+            "option_b": options[1],
+            "option_c": options[2],
+            "option_d": options[3]
+        })
+
+    return FastJSONResponse(result)
 
 class SubmitTestRequest(BaseModel):
     student_roll: str
     answers: dict
 
+async def record_submissions(submissions: list) -> list:
+    """
+    Grades and stores a batch of (test_id, SubmitTestRequest) pairs in one transaction.
+    Returns one response dict, or HTTPException for unknown tests, per submission.
+    """
+    async with AsyncSessionLocal() as db:
+        test_ids = {test_id for test_id, _ in submissions}
+        question_sets = await load_question_sets(db, test_ids)
+        tests = {t.id: t for t in (await db.scalars(select(Test).where(Test.id.in_(question_sets)))).all()}
+
+        outcomes = []
+        answer_rows = []
+        result_rows = []
+        aggregate_updates = []
+        rollup_rows = {}
+        submitted_at = datetime.utcnow()
+        for test_id, request in submissions:
+            if test_id not in question_sets:
+                outcomes.append(HTTPException(status_code=404, detail="Test not found or has no questions."))
+                continue
+            answer_key = question_sets[test_id].answer_key
+            total_questions = len(answer_key)
+
+            # Score the submitted answers; every answer is stored for metrics
+            score = 0
+            for q_id_str, selected_ans in request.answers.items():
+                correct_ans = answer_key.get(q_id_str)
+                if correct_ans and selected_ans == correct_ans:
+                    score += 1
+                answer_rows.append({
+                    "student_roll": request.student_roll,
+                    "test_id": test_id,
+                    "question_id": int(q_id_str),
+                    "selected_answer": selected_ans
+                })
+
+            result_rows.append({
+                "student_roll": request.student_roll,
+                "test_id": test_id,
+                "score": score,
+                "total_questions": total_questions,
+                "submitted_at": submitted_at
+            })
+            if test_id in tests:
+                test = tests[test_id]
+                aggregate_updates.append((test, request.student_roll, score, total_questions))
+                key = (test.year, test.branch, test.section, test.subject, request.student_roll, "test", submitted_at.date())
+                pct = (score / total_questions) * 100 if total_questions > 0 else 0
+                rollup = rollup_rows.setdefault(key, {**dict(zip(DAILY_ROLLUP_KEY, key)), "score_sum": 0.0, "score_count": 0})
+                rollup["score_sum"] += pct
+                rollup["score_count"] += 1
+            outcomes.append({
+                "message": "Test submitted successfully",
+                "score": score,
+                "total_questions": total_questions
+            })
+
+        if answer_rows:
+            await db.execute(insert(StudentAnswer), answer_rows)
+        if result_rows:
+            await db.execute(insert(StudentTestResult), result_rows)
+            await db.run_sync(refresh_class_performance_tests, aggregate_updates)
+            await db.run_sync(refresh_assessment_scores, aggregate_updates)
+            await db.run_sync(refresh_daily_rollups, list(rollup_rows.values()))
+            mark_students_changed(db, [row["student_roll"] for row in result_rows])
+        await db.commit()
+    return outcomes
+
+# Submissions arriving together (an exam ending) are written by one task in shared
+# transactions rather than each request committing on its own
+SUBMISSION_BATCH_SIZE = int(os.environ.get("SUBMISSION_BATCH_SIZE", "200"))
+submission_writer = WriteCoalescer("submissions", record_submissions, max_batch=SUBMISSION_BATCH_SIZE)
+
 @app.post("/api/tests/{test_id}/submit")
 async def submit_test(test_id: int, request: SubmitTestRequest):
     """
     Evaluates a submitted test against the database question keys.
     """
-    db: Session = SessionLocal()
-    try:
-        all_questions = db.query(Question).filter(Question.test_id == test_id).all()
-        if not all_questions:
-            raise HTTPException(status_code=404, detail="Test not found or has no questions.")
-
-        score = 0
-        total_questions = len(all_questions)
-
-        # Build mapping of question_id -> correct_answer
-        answer_key = {str(q.id): q.correct_answer for q in all_questions}
-
-        # Check submitted answers and score them while saving the student_answers row
-        for q_id_str, selected_ans in request.answers.items():
-            is_correct = False
-            correct_ans = answer_key.get(q_id_str)
-            if correct_ans and selected_ans == correct_ans:
-                score += 1
-                is_correct = True
-            
-            # Save individual answer for metrics optional
-            student_answer = StudentAnswer(
-                student_roll=request.student_roll,
-                test_id=test_id,
-                question_id=int(q_id_str),
-                selected_answer=selected_ans
-            )
-            db.add(student_answer)
-
-        # Save test result
-        test_result = StudentTestResult(
-            student_roll=request.student_roll,
-            test_id=test_id,
-            score=score,
-            total_questions=total_questions
-        )
-        db.add(test_result)
-        db.commit()
+    return await submission_writer.submit((test_id, request))
 
-        return {
-            "message": "Test submitted successfully",
-            "score": score,
-            "total_questions": total_questions
-        }
-    finally:
-        db.close()
+@app.on_event("shutdown")
+async def stop_submission_writer():
+    await submission_writer.stop()
 
-@app.get("/api/tests/{test_id}/questions/all")
-async def get_all_test_questions(test_id: int):
+@app.get("/api/tests/{test_id}/questions/all", response_model=List[FacultyQuestionResponse])
+async def get_all_test_questions(test_id: int, db: AsyncSession = Depends(get_db)):
     """
     Fetches the questions for a specific test INCLUDING the correct_answer for faculty/admin.
     Returns all generated questions.
     """
-    db: Session = SessionLocal()
-    try:
-        test = db.query(Test).filter(Test.id == test_id).first()
-        if not test:
-            raise HTTPException(status_code=404, detail="Test not found")
-
-        all_questions = db.query(Question).filter(Question.test_id == test_id).all()
-        
-        return [
-            {
-                "id": str(q.id),
-                "question": q.question,
-                "option_a": q.option_a,
-                "option_b": q.option_b,
-                "option_c": q.option_c,
-                "option_d": q.option_d,
-                "correct_answer": q.correct_answer
-            } for q in all_questions
-        ]
-    finally:
-        db.close()
+    test = await db.get(Test, test_id)
+    if not test:
+        raise HTTPException(status_code=404, detail="Test not found")
+
+    question_set = (await load_question_sets(db, [test_id])).get(test_id)
+    all_questions = question_set.questions if question_set else ()
+
+    return FastJSONResponse([
+        {
+            "id": str(q.id),
+            "question": q.question,
+            "option_a": q.option_a,
+            "option_b": q.option_b,
+            "option_c": q.option_c,
+            "option_d": q.option_d,
+            "correct_answer": q.correct_answer
+        } for q in all_questions
+    ])
 
 @app.post("/api/sections/add")
-async def add_section(request: SectionCreateRequest):
-    db = SessionLocal()
-    try:
-        if db.query(Section).filter(Section.name == request.name).first():
-            raise HTTPException(status_code=400, detail="Section already exists")
-        
-        new_section = Section(
-            name=request.name,
-            branch=request.branch,
-            year=request.year
-        )
-        db.add(new_section)
-        db.commit()
-        return {"message": "Section added successfully", "section": request.model_dump()}
-    finally:
-        db.close()
+async def add_section(request: SectionCreateRequest, db: AsyncSession = Depends(get_db)):
+    if await db.scalar(select(Section.id).where(Section.name == request.name)):
+        raise HTTPException(status_code=400, detail="Section already exists")
+    
+    new_section = Section(
+        name=request.name,
+        branch=request.branch,
+        year=request.year
+    )
+    db.add(new_section)
+    await db.commit()
+    return {"message": "Section added successfully", "section": request.model_dump()}
 
 @app.get("/api/students/{roll_number}/analytics")
-async def get_student_analytics(roll_number: str):
+async def get_student_analytics(roll_number: str, db: AsyncSession = Depends(get_db)):
     """
     Fetches combined analytics data for a specific student, merging uploaded internal
     marks with dynamically scored AI-generated tests.
+    Served from a per-student cache; a miss costs two queries regardless of test count.
+    """
+    cached = student_analytics_cache.get(roll_number)
+    if cached is not None:
+        return cached
+
+    generation = student_analytics_cache.generation
+
+    # Fetch uploaded performance (internal marks)
+    internal_performances = (await db.execute(select(
+        StudentPerformance.subject, StudentPerformance.totalMarks, StudentPerformance.uploadedAt
+    ).where(StudentPerformance.rollNumber == roll_number))).all()
+
+    # Fetch actual AI test results together with their subject in one joined query
+    ai_test_results = (await db.execute(select(
+        StudentTestResult.score, StudentTestResult.total_questions,
+        StudentTestResult.submitted_at, Test.subject
+    ).outerjoin(
+        Test, StudentTestResult.test_id == Test.id
+    ).where(StudentTestResult.student_roll == roll_number))).all()
+
+    analytics_data = []
+
+    # Map internal marks
+    for subject, total_marks, uploaded_at in internal_performances:
+        analytics_data.append({
+            "source": "Internal Excel Upload",
+            "subject": subject,
+            "score": total_marks,
+            "max_score": 100, # Assuming internal marks are out of 100
+            "date": uploaded_at.date().isoformat() if uploaded_at else None
+        })
+
+    # Map AI Tests
+    for score, total_questions, submitted_at, subject in ai_test_results:
+        # Normalize score to percentage for fair comparison, or just send raw values 
+        # (Recharts can handle multiple domain setups, but standardizing helps)
+        analytics_data.append({
+            "source": "AI Generated Test",
+            "subject": subject if subject is not None else "Unknown Test",
+            "score": score,
+            "max_score": total_questions,
+            "date": submitted_at.date().isoformat() if submitted_at else None
+        })
+
+    student_analytics_cache.set(roll_number, analytics_data, generation=generation)
+    return analytics_data
+
+
+@app.get("/api/performance/class", response_model=ClassPerformanceResponse)
+async def get_class_performance(year: str, branch: str, section: str, db: AsyncSession = Depends(get_db)):
+    """
+    Fetches the combined performance for an entire class (for the Class & Student Graphs).
+    Reads the maintained class_performance aggregate with a single indexed query.
+    """
+    rows = (await db.execute(select(
+        ClassPerformance.rollNumber,
+        ClassPerformance.name,
+        ClassPerformance.subject,
+        ClassPerformance.marks,
+        ClassPerformance.assessment_score,
+        ClassPerformance.final_score
+    ).where(
+        ClassPerformance.year == year,
+        ClassPerformance.branch == branch,
+        ClassPerformance.section == section
+    ).order_by(ClassPerformance.id))).all()
+
+    student_map = {}
+    for roll, name, subject, marks, assessment, final in rows:
+        student = student_map.get(roll)
+        if student is None:
+            student = student_map[roll] = {
+                "rollNumber": roll,
+                "name": name,
+                "subjects": [],
+                "totalMarks": 0,
+                "averageMarks": 0
+            }
+        student["subjects"].append({
+            "subjectName": subject,
+            "marks": marks,
+            "assessmentScore": assessment if assessment is not None else 0,
+            "finalScore": final
+        })
+        student["totalMarks"] += final
+
+    for student in student_map.values():
+        student["averageMarks"] = student["totalMarks"] / len(student["subjects"])
+
+    return FastJSONResponse({
+        "year": year,
+        "branch": branch,
+        "section": section,
+        "students": list(student_map.values())
+    })
+
+
+async def load_class_scores(db: AsyncSession, year: str, branch: str, section: str,
+                            subject: Optional[str] = None) -> pd.DataFrame:
+    """
+    Returns each student's latest uploaded score per subject in a class as a DataFrame
+    with rollNumber, name, subject, score and category columns.
     """
-    db: Session = SessionLocal()
+    filters = [StudentPerformance.year == year, StudentPerformance.branch == branch,
+               StudentPerformance.section == section]
+    if subject:
+        filters.append(StudentPerformance.subject == subject)
+    latest_upload_ids = select(func.max(StudentPerformance.id)).where(*filters).group_by(
+        StudentPerformance.rollNumber, StudentPerformance.subject
+    )
+    rows = (await db.execute(select(
+        StudentPerformance.rollNumber,
+        StudentPerformance.name,
+        StudentPerformance.subject,
+        func.coalesce(StudentPerformance.final_combined_score, StudentPerformance.totalMarks),
+        StudentPerformance.performance_category
+    ).where(StudentPerformance.id.in_(latest_upload_ids)).order_by(StudentPerformance.id))).all()
+
+    frame = pd.DataFrame.from_records(rows, columns=["rollNumber", "name", "subject", "score", "category"])
+    frame["score"] = frame["score"].astype(float)
+    # Rows uploaded before categories were stored
+    uncategorized = frame["category"].isna()
+    if uncategorized.any():
+        frame.loc[uncategorized, "category"] = ingestion.categorize(frame.loc[uncategorized, "score"])
+    return frame
+
+@app.get("/api/performance/class/statistics", response_model=ClassStatisticsResponse)
+async def get_class_statistics(year: str, branch: str, section: str, subject: Optional[str] = None,
+                               bins: int = class_statistics.DEFAULT_BINS, percentiles: Optional[str] = None,
+                               students: bool = True, db: AsyncSession = Depends(get_db)):
+    """
+    Per-subject score distribution for a class: mean, median, standard deviation,
+    percentiles (?percentiles=10,50,90), a histogram of ?bins= equal bins over 0-100,
+    category counts, and every student's rank and percentile (?students=false leaves
+    those out for summary views). Scores are each student's latest upload per subject.
+    Cached until the next upload for the class.
+    """
+    if not 1 <= bins <= class_statistics.MAX_BINS:
+        raise HTTPException(status_code=400, detail=f"bins must be between 1 and {class_statistics.MAX_BINS}")
     try:
-        # Fetch uploaded performance (internal marks)
-        internal_performances = db.query(StudentPerformance).filter(StudentPerformance.rollNumber == roll_number).all()
-        
-        # Fetch actual AI test results
-        ai_test_results = db.query(StudentTestResult).filter(StudentTestResult.student_roll == roll_number).all()
-        
-        analytics_data = []
-
-        # Map internal marks
-        for perf in internal_performances:
-            analytics_data.append({
-                "source": "Internal Excel Upload",
-                "subject": perf.subject,
-                "score": perf.totalMarks,
-                "max_score": 100, # Assuming internal marks are out of 100
-                "date": str(perf.uploadedAt).split(' ')[0]
-            })
+        points = class_statistics.parse_percentiles(percentiles)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    variant = (bins, points)
+
+    def respond(subjects):
+        if not students:
+            subjects = [{field: value for field, value in stats.items() if field != "students"} for stats in subjects]
+        return FastJSONResponse({"year": year, "branch": branch, "section": section, "subjects": subjects})
+
+    subjects = [subject] if subject else class_statistics_cache.get((year, branch, section, None))
+    if subjects is not None:
+        cached = [(class_statistics_cache.get((year, branch, section, name)) or {}).get(variant) for name in subjects]
+        if all(stats is not None for stats in cached):
+            return respond(cached)
+
+    generation = class_statistics_cache.generation
+    frame = await load_class_scores(db, year, branch, section, subject)
+    statistics = class_statistics.subject_statistics(frame, points, bins)
+    for name, stats in statistics.items():
+        key = (year, branch, section, name)
+        # Copied, not updated in place: readers may be holding the cached dict
+        variants = {**(class_statistics_cache.get(key) or {}), variant: stats}
+        class_statistics_cache.set(key, variants, generation)
+    if not subject:
+        class_statistics_cache.set((year, branch, section, None), tuple(statistics), generation)
+    return respond(list(statistics.values()))
+
+
+async def load_daily_rollups(db: AsyncSession, model, filters: list) -> pd.DataFrame:
+    """Sums matching rollup rows of model per subject and day (across sources) into a subject/day/score_sum/score_count frame."""
+    rows = (await db.execute(select(
+        model.subject, model.day, func.sum(model.score_sum), func.sum(model.score_count)
+    ).where(*filters).group_by(model.subject, model.day))).all()
+    return pd.DataFrame.from_records(rows, columns=["subject", "day", "score_sum", "score_count"])
+
+def trend_filters(model, subject: Optional[str], source: Optional[str], period: str, window: int) -> list:
+    """Validates the shared trend query parameters and returns model's subject/source filters."""
+    if period not in trends.PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(trends.PERIODS)}")
+    if not 1 <= window <= trends.MAX_WINDOW_DAYS:
+        raise HTTPException(status_code=400, detail=f"window must be between 1 and {trends.MAX_WINDOW_DAYS} days")
+    if source is not None and source not in ROLLUP_SOURCES:
+        raise HTTPException(status_code=400, detail=f"source must be one of {', '.join(ROLLUP_SOURCES)}")
+    filters = []
+    if subject:
+        filters.append(model.subject == subject)
+    if source:
+        filters.append(model.source == source)
+    return filters
+
+def trend_response(frame: pd.DataFrame, period: str, window: int) -> FastJSONResponse:
+    return FastJSONResponse({
+        "period": period,
+        "windowDays": window,
+        "subjects": trends.compute_trends(frame, period, window)
+    })
+
+@app.get("/api/students/{roll_number}/trends", response_model=TrendResponse)
+async def get_student_trends(roll_number: str, subject: Optional[str] = None, source: Optional[str] = None,
+                             period: str = "day", window: int = trends.DEFAULT_WINDOW_DAYS,
+                             db: AsyncSession = Depends(get_db)):
+    """
+    A student's score trajectory per subject from uploaded marks and AI tests: scores
+    averaged per ?period= (day, week, month, quarter), a ?window=-day rolling average,
+    the least-squares slope per 30 days, and the change from the first to the latest
+    rolling average. ?source=upload or test limits it to one kind of score.
+    """
+    filters = trend_filters(DailyScoreRollup, subject, source, period, window)
+    frame = await load_daily_rollups(db, DailyScoreRollup, [DailyScoreRollup.rollNumber == roll_number, *filters])
+    return trend_response(frame, period, window)
+
+@app.get("/api/performance/class/trends", response_model=TrendResponse)
+async def get_class_trends(year: str, branch: str, section: str, subject: Optional[str] = None,
+                           source: Optional[str] = None, period: str = "day",
+                           window: int = trends.DEFAULT_WINDOW_DAYS, db: AsyncSession = Depends(get_db)):
+    """The class-wide counterpart of /api/students/{roll_number}/trends, over every student's scores."""
+    filters = trend_filters(ClassDailyRollup, subject, source, period, window)
+    frame = await load_daily_rollups(db, ClassDailyRollup, [
+        ClassDailyRollup.year == year, ClassDailyRollup.branch == branch, ClassDailyRollup.section == section,
+        *filters
+    ])
+    return trend_response(frame, period, window)
+
+
+def fetch_assessment_averages(db: Session, subject: str) -> pd.Series:
+    """
+    Returns the average AI test percentage per student for a subject, indexed by roll number.
+    Read from the running sums in assessment_aggregates, one row per student.
+    """
+    rows = db.query(
+        AssessmentAggregate.rollNumber, AssessmentAggregate.test_score_sum / AssessmentAggregate.test_count
+    ).filter(
+        AssessmentAggregate.subject == subject, AssessmentAggregate.test_count > 0
+    ).all()
+
+    return pd.Series({roll: avg for roll, avg in rows}, dtype=float)
+
+
+# Roll numbers per stored-row lookup, well under SQLite's bound parameter limit
+UPSERT_LOOKUP_CHUNK = 5000
+# student_performance columns an upload writes from the scored sheet
+MARKS_RECORD_COLUMNS = ["rollNumber", *ingestion.UPSERT_COLUMNS]
+
+
+def fetch_batch_rows(db: Session, upload_batch: str, year: str, branch: str, section: str,
+                     subject: str, rolls: list) -> pd.DataFrame:
+    """Rows already stored in an upload batch for the given roll numbers, in the shape ingestion.diff_marks expects."""
+    columns = ["id", "rollNumber", "uploadedAt", *ingestion.UPSERT_COLUMNS]
+    rows = []
+    for start in range(0, len(rolls), UPSERT_LOOKUP_CHUNK):
+        rows += db.execute(select(*(getattr(StudentPerformance, column) for column in columns)).where(
+            StudentPerformance.upload_batch == upload_batch, StudentPerformance.subject == subject,
+            StudentPerformance.year == year, StudentPerformance.branch == branch,
+            StudentPerformance.section == section,
+            StudentPerformance.rollNumber.in_(rolls[start:start + UPSERT_LOOKUP_CHUNK])
+        )).all()
+    return pd.DataFrame(rows, columns=columns)
+
+
+def fetch_latest_upload_ids(db: Session, year: str, branch: str, section: str, subject: str, rolls: list) -> dict:
+    """Maps each roll number to the id of its latest upload in a class and subject."""
+    latest = {}
+    for start in range(0, len(rolls), UPSERT_LOOKUP_CHUNK):
+        latest.update(db.execute(
+            select(StudentPerformance.rollNumber, func.max(StudentPerformance.id)).where(
+                StudentPerformance.rollNumber.in_(rolls[start:start + UPSERT_LOOKUP_CHUNK]),
+                StudentPerformance.subject == subject, StudentPerformance.year == year,
+                StudentPerformance.branch == branch, StudentPerformance.section == section
+            ).group_by(StudentPerformance.rollNumber)
+        ).all())
+    return latest
+
+
+def archive_performance_rows(db: Session, where: list, superseded_by: Optional[int] = None) -> int:
+    """
+    Copies the student_performance rows matching where into student_performance_versions.
+    An upload never supersedes its own rows: those are overwritten without a version,
+    so rolling the upload back cannot bring one of them back.
+    """
+    performance = StudentPerformance.__table__.c
+    if superseded_by is not None:
+        where = [*where, performance.batch_id.is_distinct_from(superseded_by)]
+    return db.execute(insert(StudentPerformanceVersion).from_select(
+        ["performance_id", "superseded_by", *PERFORMANCE_VERSION_COLUMNS],
+        select(performance.id, literal(superseded_by, Integer),
+               *(performance[column] for column in PERFORMANCE_VERSION_COLUMNS)).where(*where)
+    )).rowcount
 
-        # Map AI Tests
-        for result in ai_test_results:
-            # We need the subject name from the Test table
-            test = db.query(Test).filter(Test.id == result.test_id).first()
-            subject_name = test.subject if test else "Unknown Test"
-            
-            # Normalize score to percentage for fair comparison, or just send raw values 
-            # (Recharts can handle multiple domain setups, but standardizing helps)
-            analytics_data.append({
-                "source": "AI Generated Test",
-                "subject": subject_name,
-                "score": result.score,
-                "max_score": result.total_questions,
-                "date": str(result.submitted_at).split(' ')[0]
-            })
 
-        return analytics_data
+def restore_performance_versions(db: Session, where: list) -> int:
+    """
+    Moves the versions matching where back into student_performance. Each keeps its
+    original id, and with it its place in the latest-upload order, unless a row
+    inserted since took that id; those few get new ids. Versions an upload recorded as
+    replacing its own rows are dropped rather than restored.
+    """
+    versions = StudentPerformanceVersion.__table__.c
+    performance = StudentPerformance.__table__.c
+    columns = [versions[column] for column in PERFORMANCE_VERSION_COLUMNS]
+    restorable = [*where, versions.batch_id.is_distinct_from(versions.superseded_by)]
+    free = ~exists().where(performance.id == versions.performance_id)
+    restored = db.execute(insert(StudentPerformance).from_select(
+        ["id", *PERFORMANCE_VERSION_COLUMNS], select(versions.performance_id, *columns).where(*restorable, free)
+    )).rowcount
+    placed = exists().where(performance.id == versions.performance_id,
+                            *(performance[column] == versions[column] for column in UPLOAD_KEY))
+    restored += db.execute(insert(StudentPerformance).from_select(
+        PERFORMANCE_VERSION_COLUMNS, select(*columns).where(*restorable, ~placed)
+    )).rowcount
+    db.execute(delete(StudentPerformanceVersion.__table__).where(*where))
+    return restored
+
+
+def ingest_marks(db: Session, df: pd.DataFrame, year: str, branch: str, section: str,
+                 subject: str, uploadedBy: str, max_total=None, assessment_averages=None,
+                 upload_batch=None, batch_id=None) -> pd.DataFrame:
+    """
+    Scores a raw marks sheet and stores it in student_performance. The caller commits.
+    With an upload_batch, rows are upserted on (upload batch, class, subject, roll
+    number): a student already in the batch is rewritten only if a stored value
+    changed, so re-uploading a sheet never duplicates it. Without one, every row is
+    appended. batch_id tags every row written with the upload_batches row of this
+    upload, and the versions it replaces are kept so the upload can be rolled back.
+    Returns the scored DataFrame with a change column ("inserted", "updated" or
+    "unchanged"), one row per student in the sheet.
+    max_total and assessment_averages let batched callers share one normalization base
+    and one averages lookup across every batch of the same file.
+    """
+    roll_col, name_col, marks_col = ingestion.detect_columns(df.columns)
+    if not marks_col:
+        raise HTTPException(
+            status_code=400,
+            detail="Could not detect a Marks/Score column in the uploaded file."
+        )
+
+    extracted = ingestion.extract_marks(df, roll_col, name_col, marks_col)
+    if upload_batch is not None:
+        extracted = ingestion.dedupe_rolls(extracted)
+    if extracted.empty:
+        return extracted.assign(change=pd.Series(dtype=object))
+
+    if assessment_averages is None:
+        assessment_averages = fetch_assessment_averages(db, subject)
+    scored = ingestion.score_marks(extracted, assessment_averages, max_total)
+    if upload_batch is None:
+        scored = scored.assign(change="inserted")
+    else:
+        stored = fetch_batch_rows(db, upload_batch, year, branch, section, subject, scored["rollNumber"].tolist())
+        scored = ingestion.diff_marks(scored, stored)
+    inserted = scored[scored["change"] == "inserted"]
+    updated = scored[scored["change"] == "updated"]
+    if inserted.empty and updated.empty:
+        return scored
+
+    uploaded_at = datetime.utcnow()
+    class_columns = {"subject": subject, "year": year, "branch": branch, "section": section}
+    if not inserted.empty:
+        db.execute(insert(StudentPerformance), inserted[MARKS_RECORD_COLUMNS].assign(
+            **class_columns, uploadedBy=uploadedBy, uploadedAt=uploaded_at, upload_batch=upload_batch,
+            batch_id=batch_id
+        ).to_dict("records"))
+    current = inserted
+    if not updated.empty:
+        ids = updated["id"].astype(int).tolist()
+        if batch_id is not None:
+            for start in range(0, len(ids), UPSERT_LOOKUP_CHUNK):
+                archive_performance_rows(db, [StudentPerformance.id.in_(ids[start:start + UPSERT_LOOKUP_CHUNK])],
+                                         superseded_by=batch_id)
+        # Table-level statement, so the parameter list runs as a plain executemany update
+        performance = StudentPerformance.__table__
+        db.execute(
+            update(performance).where(performance.c.id == bindparam("key_id")),
+            updated[list(ingestion.UPSERT_COLUMNS)].assign(key_id=ids, batch_id=batch_id).to_dict("records")
+        )
+        # A corrected row feeds class_performance only while it is still the student's latest upload
+        latest = fetch_latest_upload_ids(db, year, branch, section, subject, updated["rollNumber"].tolist())
+        current = pd.concat([updated[updated["id"] == updated["rollNumber"].map(latest)], inserted])
+    refresh_class_performance_uploads(db, current[MARKS_RECORD_COLUMNS].assign(**class_columns).to_dict("records"))
+
+    # New rows count on today's rollup; corrected rows move their own day's sum by the difference
+    contributions = []
+    if not inserted.empty:
+        contributions.append(pd.DataFrame({
+            "rollNumber": inserted["rollNumber"], "day": uploaded_at.date(),
+            "score_sum": inserted["normalized_score"], "score_count": 1
+        }))
+    if not updated.empty:
+        contributions.append(pd.DataFrame({
+            "rollNumber": updated["rollNumber"], "day": pd.to_datetime(updated["uploadedAt"]).dt.date,
+            "score_sum": updated["normalized_score"] - updated["stored_score"], "score_count": 0
+        }))
+    daily = pd.concat(contributions).groupby(["rollNumber", "day"], sort=False)[["score_sum", "score_count"]].sum()
+    daily = daily[(daily["score_sum"] != 0) | (daily["score_count"] != 0)]
+    refresh_daily_rollups(db, [
+        {**class_columns, "rollNumber": roll, "source": "upload", "day": day, "score_sum": score_sum,
+         "score_count": count}
+        for (roll, day), score_sum, count in zip(
+            daily.index, daily["score_sum"].tolist(), daily["score_count"].tolist()
+        )
+    ])
+    mark_students_changed(db, pd.concat([inserted["rollNumber"], updated["rollNumber"]]))
+    mark_class_subjects_changed(db, {(year, branch, section, subject)})
+    return scored
+
+
+# Row errors kept per upload in upload_batches.errors; error_count has the full count
+MAX_BATCH_ERRORS = 100
+
+
+class UploadBatchStats:
+    """Per-process totals of recorded uploads for /api/metrics, to spot slow imports at a glance."""
+
+    def __init__(self):
+        self.uploads = 0
+        self.failures = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.read_seconds = 0.0
+        self.write_seconds = 0.0
+        self.slowest = None
+        self._lock = threading.Lock()
+
+    def record(self, batch_record):
+        seconds = batch_record.seconds or 0.0
+        with self._lock:
+            self.uploads += 1
+            self.failures += batch_record.status == "failed"
+            self.rows += batch_record.row_count or 0
+            self.seconds += seconds
+            self.read_seconds += batch_record.read_seconds or 0.0
+            self.write_seconds += batch_record.write_seconds or 0.0
+            if self.slowest is None or seconds > self.slowest["seconds"]:
+                self.slowest = {"id": batch_record.id, "seconds": seconds, "rows": batch_record.row_count}
+
+    def stats(self):
+        return {
+            "uploads": self.uploads,
+            "failures": self.failures,
+            "rows": self.rows,
+            "seconds": round(self.seconds, 3),
+            "readSeconds": round(self.read_seconds, 3),
+            "writeSeconds": round(self.write_seconds, 3),
+            "rowsPerSecond": round(self.rows / self.seconds, 1) if self.seconds else None,
+            "slowest": self.slowest
+        }
+
 
-    finally:
-        db.close()
+upload_batch_stats = UploadBatchStats()
+
+
+def note_upload_batch(batch_record: UploadBatch, row_count: int, diff: dict, error_count: int,
+                      errors: list, write_seconds: float):
+    """Fills in what an upload did: sheet rows, diff counts, row errors and time spent writing."""
+    batch_record.row_count = row_count
+    batch_record.inserted = diff["inserted"]
+    batch_record.updated = diff["updated"]
+    batch_record.unchanged = diff["unchanged"]
+    batch_record.error_count = error_count
+    batch_record.errors = json.dumps(errors[:MAX_BATCH_ERRORS])
+    batch_record.write_seconds = round(write_seconds, 3)
 
 
-@app.get("/api/performance/class")
-async def get_class_performance(year: str, branch: str, section: str):
+def record_upload(ingest, source: str, file_hash: str, upload_batch: Optional[str], **fields):
     """
-    Fetches the combined performance for an entire class (for the Class & Student Graphs).
+    Runs ingest(db, batch_record) in one transaction under a new upload_batches row and
+    returns its result. ingest fills in the counts, errors and write time with
+    note_upload_batch; the rest of the elapsed time is recorded as read time. A failed
+    upload is rolled back and then recorded on its own with status "failed". Runs in a
+    worker thread.
     """
-    db: Session = SessionLocal()
+    fields.update(source=source, file_hash=file_hash, upload_batch=upload_batch or file_hash)
+    start = time.perf_counter()
+    started_at = datetime.utcnow()
+    db = SessionLocal()
     try:
-        student_map = {}
-
-        # 1. Fetch uploaded performance
-        performances = db.query(StudentPerformance).filter(
-            StudentPerformance.year == year,
-            StudentPerformance.branch == branch,
-            StudentPerformance.section == section
-        ).all()
-        
-        for p in performances:
-            roll = p.rollNumber
-            if roll not in student_map:
-                student_map[roll] = {
-                    "rollNumber": roll,
-                    "name": p.name,
-                    "subjects": [],
-                    "totalMarks": 0,
-                    "averageMarks": 0
-                }
-            
-            sub_marks = p.final_combined_score if p.final_combined_score is not None else p.totalMarks
-            
-            student_map[roll]["subjects"].append({
-                "subjectName": p.subject,
-                "marks": p.totalMarks,
-                "assessmentScore": p.assessment_score if p.assessment_score is not None else 0,
-                "finalScore": sub_marks
-            })
-            student_map[roll]["totalMarks"] += sub_marks
+        batch_record = UploadBatch(**fields, status="running", started_at=started_at)
+        db.add(batch_record)
+        db.flush()
+        result = ingest(db, batch_record)
+        batch_record.status = "active"
+        batch_record.finished_at = datetime.utcnow()
+        batch_record.seconds = round(time.perf_counter() - start, 3)
+        batch_record.read_seconds = round(batch_record.seconds - (batch_record.write_seconds or 0.0), 3)
+        db.commit()
+        upload_batch_stats.record(batch_record)
+        return result
+    except Exception as e:
+        db.rollback()
+        failed = UploadBatch(
+            **fields, status="failed", error=str(getattr(e, "detail", e)), started_at=started_at,
+            finished_at=datetime.utcnow(), seconds=round(time.perf_counter() - start, 3)
+        )
+        try:
+            db.add(failed)
+            db.commit()
+            upload_batch_stats.record(failed)
+        except Exception as record_error:
+            db.rollback()
+            logger.error(f"Error recording failed upload: {record_error}")
+        raise
+    finally:
+        db.close()
 
-        # 2. Fetch standalone test submissions that match the demographics
-        test_results = db.query(StudentTestResult, Test, Student).join(
-            Test, StudentTestResult.test_id == Test.id
-        ).join(
-            Student, StudentTestResult.student_roll == Student.rollNumber
-        ).filter(
-            Test.year == year,
-            Test.branch == branch,
-            Test.section == section
-        ).all()
-
-        for result, test, student in test_results:
-            roll = result.student_roll
-            if roll not in student_map:
-                student_map[roll] = {
-                    "rollNumber": roll,
-                    "name": student.name,
-                    "subjects": [],
-                    "totalMarks": 0,
-                    "averageMarks": 0
-                }
-
-            # If the subject exists in the map already from uploaded marks, skip or merge.
-            # Realistically, the uploaded marks natively average out the assessments already at upload-time
-            # For this phase, if we haven't seen the subject, we add it. 
-            existing_sub = next((s for s in student_map[roll]["subjects"] if s["subjectName"] == test.subject), None)
-            
-            if not existing_sub:
-                pct = (result.score / result.total_questions) * 100 if result.total_questions > 0 else 0
-                student_map[roll]["subjects"].append({
-                    "subjectName": test.subject,
-                    "marks": 0,
-                    "assessmentScore": pct,
-                    "finalScore": pct
-                })
-                student_map[roll]["totalMarks"] += pct
 
-        # 3. Calculate averages safely
-        students_list = []
-        for roll, data in student_map.items():
-            subs = len(data["subjects"])
-            if subs > 0:
-                data["averageMarks"] = data["totalMarks"] / subs
-            students_list.append(data)
+def process_marks_sheet(contents: bytes, year: str, branch: str, section: str, subject: str,
+                        uploadedBy: str, upload_batch: Optional[str] = None, filename: Optional[str] = None) -> dict:
+    """
+    Parses, scores and upserts an uploaded sheet into its upload batch, which defaults
+    to the file's content hash, recording the upload in upload_batches. Runs in a
+    worker thread.
+    """
+    content_hash = ingestion.content_hash(contents)
 
+    def ingest(db, batch_record):
+        df = pd.read_excel(io.BytesIO(contents))
+        roll_col, _, marks_col = ingestion.detect_columns(df.columns)
+        errors = ingestion.find_row_errors(df, roll_col, marks_col) if marks_col else []
+        start = time.perf_counter()
+        scored = ingest_marks(db, df, year, branch, section, subject, uploadedBy,
+                              upload_batch=batch_record.upload_batch, batch_id=batch_record.id)
+        if scored.empty:
+            raise HTTPException(status_code=400, detail="No valid data could be extracted.")
+        diff = ingestion.diff_summary(scored)
+        note_upload_batch(batch_record, len(df), diff, len(errors), errors, time.perf_counter() - start)
         return {
-            "year": year,
-            "branch": branch,
-            "section": section,
-            "students": students_list
+            "rows": ingestion.summarize_rows(scored),
+            "diff": diff,
+            "contentHash": content_hash,
+            "uploadBatch": batch_record.upload_batch,
+            "batchId": batch_record.id
         }
 
+    return record_upload(ingest, "sheet", content_hash, upload_batch, filename=filename, year=year,
+                         branch=branch, section=section, subject=subject, uploaded_by=uploadedBy)
+
+
+def ingest_marks_file(db: Session, path: str, year: str, branch: str, section: str,
+                      subject: str, uploadedBy: str, batch_size: int = ingestion.STREAM_BATCH_SIZE,
+                      progress=None, upload_batch: Optional[str] = None,
+                      batch_record: Optional[UploadBatch] = None) -> dict:
+    """
+    Streams a spooled .xlsx/.csv sheet through scoring and bulk upsert in fixed-size batches.
+    A first pass finds the max mark for normalization and each roll number's last row, so
+    memory stays bounded by batch_size plus one entry per student.
+    Rows are upserted into upload_batch, which defaults to the file's content hash, or
+    into batch_record's batch, tagged with its id and noted on it when given.
+    progress, if given, is called as progress(rows_read, batch_row_errors, total_rows)
+    after every batch. Returns summary stats; the caller commits.
+    """
+    if batch_record is not None:
+        content_hash, upload_batch = batch_record.file_hash, batch_record.upload_batch
+    else:
+        content_hash = ingestion.file_content_hash(path)
+        upload_batch = upload_batch or content_hash
+    batch_id = batch_record.id if batch_record is not None else None
+    (roll_col, _, marks_col), max_total, total_rows, last_rows = ingestion.scan_max_marks(path, batch_size)
+    if not marks_col:
+        raise HTTPException(
+            status_code=400,
+            detail="Could not detect a Marks/Score column in the uploaded file."
+        )
+
+    averages = fetch_assessment_averages(db, subject)
+    inserted = 0
+    batches = 0
+    error_count = 0
+    errors = []
+    write_seconds = 0.0
+    next_row = 2  # Sheet row of the first data row (row 1 is the header)
+    categories = {}
+    diff = dict.fromkeys(ingestion.CHANGES, 0)
+    for batch in ingestion.iter_sheet_batches(path, batch_size):
+        row_errors = ingestion.find_row_errors(batch, roll_col, marks_col, first_row=next_row)
+        # A roll number repeated in a later batch is written once, from its last row
+        latest = batch[~ingestion.superseded_rows(batch, roll_col, last_rows, next_row - 2)]
+        start = time.perf_counter()
+        scored = ingest_marks(db, latest, year, branch, section, subject, uploadedBy,
+                              max_total=max_total, assessment_averages=averages,
+                              upload_batch=upload_batch, batch_id=batch_id)
+        write_seconds += time.perf_counter() - start
+        batches += 1
+        next_row += len(batch)
+        inserted += len(scored)
+        error_count += len(row_errors)
+        errors += row_errors[:MAX_BATCH_ERRORS - len(errors)]
+        for change, count in ingestion.diff_summary(scored).items():
+            diff[change] += count
+        if not scored.empty:
+            for category, count in scored["performance_category"].value_counts().items():
+                categories[category] = categories.get(category, 0) + int(count)
+        if progress:
+            progress(next_row - 2, row_errors, total_rows)
+
+    if batch_record is not None:
+        note_upload_batch(batch_record, total_rows, diff, error_count, errors, write_seconds)
+    return {
+        "rows": inserted,
+        "totalRows": total_rows,
+        "batches": batches,
+        "errorCount": error_count,
+        "categories": categories,
+        "diff": diff,
+        "contentHash": content_hash,
+        "uploadBatch": upload_batch,
+        "batchId": batch_id
+    }
+
+
+def process_marks_file(path: str, year: str, branch: str, section: str, subject: str, uploadedBy: str,
+                       upload_batch: Optional[str] = None, filename: Optional[str] = None,
+                       source: str = "stream", progress=None) -> dict:
+    """
+    Streams a spooled sheet into the database in one transaction, recording the upload
+    in upload_batches. Runs in a worker thread.
+    """
+    def ingest(db, batch_record):
+        stats = ingest_marks_file(db, path, year, branch, section, subject, uploadedBy,
+                                  progress=progress, batch_record=batch_record)
+        if not stats["rows"]:
+            raise HTTPException(status_code=400, detail="No valid data could be extracted.")
+        return stats
+
+    return record_upload(ingest, source, ingestion.file_content_hash(path), upload_batch, filename=filename,
+                         year=year, branch=branch, section=section, subject=subject, uploaded_by=uploadedBy)
+
+
+def run_upload_job(params: dict, progress) -> dict:
+    """Upload job handler: streams the spooled sheet into the database, then removes it."""
+    path = params["path"]
+    try:
+        return process_marks_file(
+            path, params["year"], params["branch"], params["section"], params["subject"],
+            params["uploadedBy"], upload_batch=params.get("batch"), filename=params.get("filename"),
+            source="job", progress=progress.update
+        )
     finally:
-        db.close()
+        # A job killed mid-run never reaches this point, so its spooled file is still
+        # there when the job is requeued on restart
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def describe_diff(diff: dict) -> str:
+    return f"{diff['inserted']} new, {diff['updated']} updated, {diff['unchanged']} unchanged"
+
+
+upload_job_queue = UploadJobQueue(UPLOAD_JOBS_DB, run_upload_job, workers=UPLOAD_JOB_WORKERS)
+
+
+@app.on_event("startup")
+def start_upload_jobs():
+    upload_job_queue.start()
+
+
+@app.on_event("shutdown")
+def stop_upload_jobs():
+    upload_job_queue.stop()
 
 
 @app.post("/api/upload-marks")
@@ -896,11 +2728,18 @@ async def upload_marks(
     branch: str = Form(...),
     section: str = Form(...),
     subject: str = Form(...),
-    uploadedBy: str = Form(...)
+    uploadedBy: str = Form(...),
+    batch: Optional[str] = Form(None)
 ):
     """
     Endpoint to process an uploaded Excel sheet containing student marks.
     Extracts 'Roll Number', 'Name', and 'Marks', then stores them in SQLite.
+    Rows are upserted into an upload batch: uploading the same file again, or any
+    corrected sheet under the same `batch` name, rewrites only the rows that changed.
+    Without a `batch` the file's content hash names the batch, so only byte-identical
+    re-uploads are matched and a corrected sheet is stored as a new batch; the upload
+    form always sends one (the assessment name, or else the file name).
+    The response carries a diff summary of inserted, updated and unchanged rows.
     """
     # Validate file type
     if not file.filename.endswith(('.xlsx', '.xls')):
@@ -910,212 +2749,868 @@ async def upload_marks(
         )
 
     try:
-        # Read the uploaded file into a Pandas DataFrame
         contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
 
-        # Dynamically detect required columns
-        roll_col = next((c for c in df.columns if 'roll' in str(c).lower()), None)
-        name_col = next((c for c in df.columns if 'name' in str(c).lower()), None)
-        marks_col = next(
-            (c for c in df.columns if any(
-                keyword in str(c).lower() for keyword in ['mark', 'score', 'total']
-            )),
-            None
+        # Parsing, scoring and the bulk insert are CPU/IO bound; keep them off the event loop
+        # An upload without valid rows is recorded as failed and raises a 400
+        result = await run_in_threadpool(
+            process_marks_sheet, contents, year, branch, section, subject, uploadedBy, batch, file.filename
         )
+        parsed_results = result["rows"]
 
-        if not marks_col:
-            raise HTTPException(
-                status_code=400,
-                detail="Could not detect a Marks/Score column in the uploaded file."
-            )
+        return {
+            "message": f"Successfully parsed and categorized {len(parsed_results)} records "
+                       f"({describe_diff(result['diff'])}).",
+            "data": parsed_results,
+            "diff": result["diff"],
+            "contentHash": result["contentHash"],
+            "uploadBatch": result["uploadBatch"],
+            "batchId": result["batchId"]
+        }
 
-        # Fallback if specific columns aren't found
-        roll_col = roll_col if roll_col else df.columns[0]
-        name_col = name_col if name_col else df.columns[1]
-
-        # Extract only the necessary columns and filter out missing marks
-        extracted_data = df[[roll_col, name_col, marks_col]].dropna(subset=[marks_col])
-
-        # Open DB Session
-        db = SessionLocal()
-        parsed_results = []
-        
-        # Determine the maximum mark in the file for normalization
-        max_total_in_file = extracted_data[marks_col].max()
-        if max_total_in_file == 0 or pd.isna(max_total_in_file):
-            max_total_in_file = 100 # Fallback to prevent divide-by-zero
-
-        for index, row in extracted_data.iterrows():
-            try:
-                roll = str(row[roll_col])
-                student_name = str(row[name_col])
-                marks = float(row[marks_col])
-
-                # Exclude invalid parsed rows (e.g headers caught as data)
-                if pd.isna(marks) or not roll.strip():
-                    continue
-
-                # 1. Normalize the score
-                normalized_score = (marks / max_total_in_file) * 100
-
-                # 2. Look up existing Assessment Scores for this Subject
-                # We need to find tests for this subject that the student has taken
-                taken_tests = db.query(StudentTestResult, Test).join(
-                    Test, StudentTestResult.test_id == Test.id
-                ).filter(
-                    StudentTestResult.student_roll == roll,
-                    Test.subject == subject
-                ).all()
-
-                assessment_score = 0
-                if taken_tests:
-                    # Calculate average percentage across all AI tests taken for this subject
-                    total_test_pct = 0
-                    for tr, t in taken_tests:
-                        pct = (tr.score / tr.total_questions) * 100 if tr.total_questions > 0 else 0
-                        total_test_pct += pct
-                    assessment_score = total_test_pct / len(taken_tests)
-                
-                # 3. Calculate Final Combined
-                # If they haven't taken a test, we can just use the normalized score, or treat assessment as 0. Let's average if they have tests, else just normalized
-                if taken_tests:
-                    final_combined_score = (normalized_score + assessment_score) / 2
-                else:
-                    final_combined_score = normalized_score
-
-                # 4. Determine Performance Category
-                if final_combined_score >= 85:
-                    performance_category = "Excellent"
-                elif final_combined_score >= 70:
-                    performance_category = "Good"
-                elif final_combined_score >= 50:
-                    performance_category = "Average"
-                else:
-                    performance_category = "Needs Improvement"
-
-                student_record = StudentPerformance(
-                    rollNumber=roll,
-                    name=student_name,
-                    totalMarks=marks,
-                    subject=subject,
-                    year=year,
-                    branch=branch,
-                    section=section,
-                    uploadedBy=uploadedBy,
-                    normalized_score=normalized_score,
-                    assessment_score=assessment_score,
-                    final_combined_score=final_combined_score,
-                    performance_category=performance_category
-                )
-                db.add(student_record)
-
-                parsed_results.append({
-                    "rollNumber": roll,
-                    "name": student_name,
-                    "marks": marks,
-                    "normalized": round(normalized_score, 2),
-                    "assessment": round(assessment_score, 2),
-                    "finalScore": round(final_combined_score, 2),
-                    "category": performance_category
-                })
-            except Exception as row_error:
-                print(f"Error parsing row {index}: {row_error}")
-                continue
+    except HTTPException:
+        # Re-raise known exceptions cleanly
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Error processing the file: {str(e)}"
+        ) from e
 
-        db.commit()
-        db.close()
 
-        # Calculate brief stats to return
-        if not parsed_results:
-            raise HTTPException(status_code=400, detail="No valid data could be extracted.")
+@app.post("/api/upload-marks/stream")
+async def upload_marks_stream(
+    file: UploadFile = File(...),
+    year: str = Form(...),
+    branch: str = Form(...),
+    section: str = Form(...),
+    subject: str = Form(...),
+    uploadedBy: str = Form(...),
+    batch: Optional[str] = Form(None)
+):
+    """
+    Streaming variant of /api/upload-marks for very large .xlsx/.csv sheets.
+    The upload is spooled to disk and processed in fixed-size batches, so peak memory
+    does not grow with the file. Rows are upserted into an upload batch as in
+    /api/upload-marks. Returns summary stats instead of every parsed row.
+    """
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    if suffix not in ingestion.STREAMABLE_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid file type. Only .xlsx, .xls and .csv are supported."
+        )
+
+    path = await run_in_threadpool(ingestion.spool_upload, file.file, suffix)
+    try:
+        stats = await run_in_threadpool(
+            process_marks_file, path, year, branch, section, subject, uploadedBy, batch, file.filename
+        )
 
         return {
-            "message": f"Successfully parsed and categorized {len(parsed_results)} records.",
-            "data": parsed_results
+            "message": f"Successfully parsed and categorized {stats['rows']} records "
+                       f"({describe_diff(stats['diff'])}).",
+            "stats": stats
         }
 
     except HTTPException:
-        # Re-raise known exceptions cleanly
         raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error processing the file: {str(e)}"
         ) from e
+    finally:
+        os.remove(path)
 
 
-@app.post("/api/jobs")
-async def create_job(request: JobCreateRequest):
+@app.post("/api/upload-jobs", status_code=202)
+async def create_upload_job(
+    file: UploadFile = File(...),
+    year: str = Form(...),
+    branch: str = Form(...),
+    section: str = Form(...),
+    subject: str = Form(...),
+    uploadedBy: str = Form(...),
+    batch: Optional[str] = Form(None)
+):
     """
-    Creates a new job posting for a specific class.
+    Queues a marks sheet for background processing and returns a job id immediately.
+    Poll /api/upload-jobs/{job_id} for progress, row errors and the final stats.
+    """
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    if suffix not in ingestion.STREAMABLE_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid file type. Only .xlsx, .xls and .csv are supported."
+        )
+
+    path = await run_in_threadpool(ingestion.spool_upload, file.file, suffix, UPLOAD_SPOOL_DIR)
+    job_id = await run_in_threadpool(upload_job_queue.submit, {
+        "path": path,
+        "filename": file.filename,
+        "year": year,
+        "branch": branch,
+        "section": section,
+        "subject": subject,
+        "uploadedBy": uploadedBy,
+        "batch": batch
+    })
+    return {"message": "Upload queued for processing", "job_id": job_id, "status": "queued"}
+
+
+def serialize_upload_job(job: dict) -> dict:
+    params = job["params"]
+    total = job["total_rows"]
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "filename": params.get("filename"),
+        "subject": params.get("subject"),
+        "year": params.get("year"),
+        "branch": params.get("branch"),
+        "section": params.get("section"),
+        "uploadedBy": params.get("uploadedBy"),
+        "batch": params.get("batch"),
+        "rowsProcessed": job["rows_processed"],
+        "totalRows": total,
+        "progress": round(job["rows_processed"] / total * 100, 1) if total else None,
+        "errorCount": job["error_count"],
+        "errors": job["errors"],
+        "stats": job["stats"],
+        "message": job["message"],
+        "createdAt": job["created_at"],
+        "startedAt": job["started_at"],
+        "finishedAt": job["finished_at"]
+    }
+
+
+@app.get("/api/upload-jobs/{job_id}")
+async def get_upload_job(job_id: str):
+    """Reports the status, progress, row errors and final stats of an upload job."""
+    job = await run_in_threadpool(upload_job_queue.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return serialize_upload_job(job)
+
+
+@app.get("/api/upload-jobs")
+async def list_upload_jobs(uploadedBy: Optional[str] = None, limit: int = 50):
+    """Lists the most recent upload jobs, optionally only those submitted by one user."""
+    jobs = await run_in_threadpool(upload_job_queue.recent, uploadedBy, limit)
+    return [serialize_upload_job(job) for job in jobs]
+
+
+def refresh_class_subject_uploads(db: Session, year: str, branch: str, section: str, subject: str):
+    """
+    Recomputes one class and subject's upload-backed aggregates after its uploaded rows
+    were removed or restored in bulk: class_performance takes each student's latest
+    remaining upload (falling back to their test average, or dropping the row, when
+    none is left) and the "upload" rows of both rollup tables are rebuilt from the
+    class's uploads. The caller commits.
+    """
+    performance = StudentPerformance
+    in_class = [performance.year == year, performance.branch == branch, performance.section == section,
+                performance.subject == subject]
+    # Same upsert as refresh_class_performance_uploads, fed by INSERT ... SELECT so a
+    # whole class never round-trips through Python
+    latest_ids = select(func.max(performance.id)).where(*in_class).group_by(performance.rollNumber)
+    upsert = dialect_insert(db, ClassPerformance).from_select(
+        CLASS_PERFORMANCE_KEY + ["name", "marks", "assessment_score", "final_score", "has_upload",
+                                 "test_count", "test_score_sum", "updated_at"],
+        select(*(getattr(performance, column) for column in CLASS_PERFORMANCE_KEY), performance.name,
+               performance.totalMarks, func.coalesce(performance.assessment_score, 0),
+               func.coalesce(performance.final_combined_score, performance.totalMarks), literal(True),
+               literal(0), literal(0.0), literal(datetime.utcnow()))
+        .where(performance.id.in_(latest_ids))
+    )
+    db.execute(upsert.on_conflict_do_update(
+        index_elements=CLASS_PERFORMANCE_KEY,
+        set_={
+            "name": upsert.excluded.name,
+            "marks": upsert.excluded.marks,
+            "assessment_score": upsert.excluded.assessment_score,
+            "final_score": upsert.excluded.final_score,
+            "has_upload": True,
+            "updated_at": upsert.excluded.updated_at
+        }
+    ))
+    orphaned = [
+        ClassPerformance.year == year, ClassPerformance.branch == branch, ClassPerformance.section == section,
+        ClassPerformance.subject == subject, ClassPerformance.has_upload.is_(True),
+        ~exists().where(*(getattr(performance, column) == getattr(ClassPerformance, column)
+                          for column in CLASS_PERFORMANCE_KEY))
+    ]
+    test_average = ClassPerformance.test_score_sum / ClassPerformance.test_count
+    db.execute(
+        update(ClassPerformance).where(*orphaned, ClassPerformance.test_count > 0)
+        .values(has_upload=False, marks=0, assessment_score=test_average, final_score=test_average)
+        .execution_options(synchronize_session=False)
+    )
+    db.execute(delete(ClassPerformance).where(*orphaned).execution_options(synchronize_session=False))
+
+    for model in (DailyScoreRollup, ClassDailyRollup):
+        db.execute(delete(model).where(
+            model.year == year, model.branch == branch, model.section == section, model.subject == subject,
+            model.source == "upload"
+        ))
+    upload_day = func.date(performance.uploadedAt)
+    db.execute(insert(DailyScoreRollup).from_select(
+        DAILY_ROLLUP_KEY + ["score_sum", "score_count"],
+        select(performance.year, performance.branch, performance.section, performance.subject,
+               performance.rollNumber, literal("upload"), upload_day,
+               func.sum(func.coalesce(performance.normalized_score, performance.totalMarks)),
+               func.count(performance.id))
+        .where(*in_class)
+        .group_by(performance.year, performance.branch, performance.section, performance.subject,
+                  performance.rollNumber, upload_day)
+    ))
+    class_key = [getattr(DailyScoreRollup, column) for column in CLASS_DAILY_ROLLUP_KEY]
+    db.execute(insert(ClassDailyRollup).from_select(
+        CLASS_DAILY_ROLLUP_KEY + ["score_sum", "score_count"],
+        select(*class_key, func.sum(DailyScoreRollup.score_sum), func.sum(DailyScoreRollup.score_count))
+        .where(DailyScoreRollup.year == year, DailyScoreRollup.branch == branch,
+               DailyScoreRollup.section == section, DailyScoreRollup.subject == subject,
+               DailyScoreRollup.source == "upload")
+        .group_by(*class_key)
+    ))
+    mark_class_subjects_changed(db, {(year, branch, section, subject)})
+
+
+def find_upload_batch(db: Session, batch_id: int) -> UploadBatch:
+    batch_record = db.get(UploadBatch, batch_id)
+    if batch_record is None:
+        raise HTTPException(status_code=404, detail="Upload batch not found")
+    return batch_record
+
+
+def same_upload_batch(batch_record: UploadBatch) -> list:
+    """Filters upload_batches to the uploads into the same batch, class and subject as batch_record."""
+    return [UploadBatch.upload_batch == batch_record.upload_batch, UploadBatch.subject == batch_record.subject,
+            UploadBatch.year == batch_record.year, UploadBatch.branch == batch_record.branch,
+            UploadBatch.section == batch_record.section]
+
+
+def wrote_rows() -> list:
+    """Filters upload_batches to uploads that tagged or replaced at least one row; others changed nothing."""
+    return [or_(
+        exists().where(StudentPerformance.batch_id == UploadBatch.id),
+        exists().where(StudentPerformanceVersion.superseded_by == UploadBatch.id)
+    )]
+
+
+def rollback_upload_batch(batch_id: int) -> dict:
+    """
+    Undoes an upload: its rows move from student_performance to
+    student_performance_versions and the versions it replaced move back, each a
+    statement over an indexed batch id. Only the latest active upload into a batch can
+    be rolled back, so a batch's uploads are undone newest first; later uploads that
+    changed no rows do not count. Runs in a worker thread.
     """
     db = SessionLocal()
     try:
-        new_job = Job(
-            title=request.title,
-            description=request.description,
-            company=request.company,
-            year=request.year,
-            branch=request.branch,
-            section=request.section,
-            posted_by=request.posted_by
-        )
-        db.add(new_job)
+        batch_record = find_upload_batch(db, batch_id)
+        if batch_record.status != "active":
+            raise HTTPException(status_code=409, detail=f"Upload batch is {batch_record.status}, not active")
+        latest = db.scalar(select(func.max(UploadBatch.id)).where(
+            *same_upload_batch(batch_record), UploadBatch.status == "active", UploadBatch.id > batch_id,
+            *wrote_rows()
+        ))
+        if latest is not None:
+            raise HTTPException(status_code=409, detail=f"Upload batch {latest} changed these rows later; roll it back first")
+
+        performance = StudentPerformance.__table__
+        versions = StudentPerformanceVersion
+        archive_performance_rows(db, [performance.c.batch_id == batch_id])
+        removed = db.execute(delete(performance).where(performance.c.batch_id == batch_id)).rowcount
+        restored = restore_performance_versions(db, [versions.superseded_by == batch_id])
+        rolls = db.scalars(select(versions.rollNumber).where(
+            versions.batch_id == batch_id, versions.superseded_by.is_(None)
+        )).all()
+        batch_record.status = "rolled_back"
+        batch_record.rolled_back_at = datetime.utcnow()
+        refresh_class_subject_uploads(db, batch_record.year, batch_record.branch, batch_record.section,
+                                      batch_record.subject)
+        mark_students_changed(db, rolls)
         db.commit()
-        return {"message": "Job posted successfully", "id": new_job.id}
+        return {**serialize_upload_batch(batch_record), "rowsRemoved": removed, "rowsRestored": restored}
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
-@app.get("/api/jobs")
-async def get_all_jobs():
+
+def restore_upload_batch(batch_id: int) -> dict:
     """
-    Fetches all jobs regardless of demographic (useful for TPO).
+    Re-applies a rolled back upload: the rows it had replaced go back to
+    student_performance_versions and its own rows return. Only possible while no later
+    upload into the same batch that changed rows is active. Runs in a worker thread.
     """
     db = SessionLocal()
     try:
-        jobs = db.query(Job).order_by(Job.posted_at.desc()).all()
-        return jobs
+        batch_record = find_upload_batch(db, batch_id)
+        if batch_record.status != "rolled_back":
+            raise HTTPException(status_code=409, detail=f"Upload batch is {batch_record.status}, not rolled back")
+        later = db.scalar(select(func.max(UploadBatch.id)).where(
+            *same_upload_batch(batch_record), UploadBatch.status == "active", UploadBatch.id > batch_id,
+            *wrote_rows()
+        ))
+        if later is not None:
+            raise HTTPException(status_code=409, detail=f"Upload batch {later} changed these rows later; roll it back first")
+
+        performance = StudentPerformance.__table__
+        versions = StudentPerformanceVersion
+        own = [versions.batch_id == batch_id, versions.superseded_by.is_(None)]
+        rolls = db.scalars(select(versions.rollNumber).where(*own)).all()
+        # The batch's current rows for those students are the versions the upload had replaced
+        replaced = [performance.c.upload_batch == batch_record.upload_batch,
+                    performance.c.subject == batch_record.subject, performance.c.year == batch_record.year,
+                    performance.c.branch == batch_record.branch, performance.c.section == batch_record.section,
+                    performance.c.rollNumber.in_(select(versions.rollNumber).where(*own))]
+        removed = archive_performance_rows(db, replaced, superseded_by=batch_id)
+        db.execute(delete(performance).where(*replaced))
+        restored = restore_performance_versions(db, own)
+        batch_record.status = "active"
+        batch_record.rolled_back_at = None
+        refresh_class_subject_uploads(db, batch_record.year, batch_record.branch, batch_record.section,
+                                      batch_record.subject)
+        mark_students_changed(db, rolls)
+        db.commit()
+        return {**serialize_upload_batch(batch_record), "rowsRemoved": removed, "rowsRestored": restored}
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
-@app.get("/api/student/{rollNumber}/jobs")
-async def get_student_jobs(rollNumber: str):
+
+def serialize_upload_batch(batch_record: UploadBatch) -> dict:
+    seconds = batch_record.seconds
+    return {
+        "id": batch_record.id,
+        "uploadBatch": batch_record.upload_batch,
+        "fileHash": batch_record.file_hash,
+        "filename": batch_record.filename,
+        "year": batch_record.year,
+        "branch": batch_record.branch,
+        "section": batch_record.section,
+        "subject": batch_record.subject,
+        "uploadedBy": batch_record.uploaded_by,
+        "source": batch_record.source,
+        "status": batch_record.status,
+        "rowCount": batch_record.row_count,
+        "inserted": batch_record.inserted,
+        "updated": batch_record.updated,
+        "unchanged": batch_record.unchanged,
+        "errorCount": batch_record.error_count,
+        "errors": json.loads(batch_record.errors) if batch_record.errors else [],
+        "error": batch_record.error,
+        "startedAt": batch_record.started_at,
+        "finishedAt": batch_record.finished_at,
+        "readSeconds": batch_record.read_seconds,
+        "writeSeconds": batch_record.write_seconds,
+        "seconds": seconds,
+        "rowsPerSecond": round(batch_record.row_count / seconds, 1) if seconds and batch_record.row_count else None,
+        "rolledBackAt": batch_record.rolled_back_at
+    }
+
+
+UPLOAD_BATCH_FIELDS = {
+    "id": UploadBatch.id,
+    "uploadBatch": UploadBatch.upload_batch,
+    "fileHash": UploadBatch.file_hash,
+    "filename": UploadBatch.filename,
+    "year": UploadBatch.year,
+    "branch": UploadBatch.branch,
+    "section": UploadBatch.section,
+    "subject": UploadBatch.subject,
+    "uploadedBy": UploadBatch.uploaded_by,
+    "source": UploadBatch.source,
+    "status": UploadBatch.status,
+    "rowCount": UploadBatch.row_count,
+    "inserted": UploadBatch.inserted,
+    "updated": UploadBatch.updated,
+    "unchanged": UploadBatch.unchanged,
+    "errorCount": UploadBatch.error_count,
+    "error": UploadBatch.error,
+    "startedAt": UploadBatch.started_at,
+    "finishedAt": UploadBatch.finished_at,
+    "readSeconds": UploadBatch.read_seconds,
+    "writeSeconds": UploadBatch.write_seconds,
+    "seconds": UploadBatch.seconds,
+    "rolledBackAt": UploadBatch.rolled_back_at
+}
+UPLOAD_BATCH_DEFAULT_FIELDS = [field for field in UPLOAD_BATCH_FIELDS if field not in ("fileHash", "error")]
+
+
+@app.get("/api/upload-batches", response_model=Page[UploadBatchResponse])
+async def get_upload_batches(year: Optional[str] = None, branch: Optional[str] = None,
+                             section: Optional[str] = None, subject: Optional[str] = None,
+                             uploadedBy: Optional[str] = None, status: Optional[str] = None,
+                             sort: str = "recent", fields: Optional[str] = None,
+                             limit: int = pagination.DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                             count: str = "estimate", db: AsyncSession = Depends(get_db)):
+    """
+    Keyset-paginated uploads, newest first, or slowest first with ?sort=slowest to
+    spot slow imports. Per-row parse errors are returned by /api/upload-batches/{batch_id}.
+    """
+    if sort not in ("recent", "slowest"):
+        raise HTTPException(status_code=400, detail="sort must be one of recent, slowest")
+    where = []
+    for column, value in ((UploadBatch.year, year), (UploadBatch.branch, branch), (UploadBatch.section, section),
+                          (UploadBatch.subject, subject), (UploadBatch.uploaded_by, uploadedBy),
+                          (UploadBatch.status, status)):
+        if value:
+            where.append(column == value)
+    if sort == "slowest":
+        # Failed uploads can finish without a duration
+        where.append(UploadBatch.seconds.is_not(None))
+        key = (UploadBatch.seconds, UploadBatch.id)
+    else:
+        key = (UploadBatch.id,)
+    return FastJSONResponse(await pagination.keyset_page(
+        db, UploadBatch, UPLOAD_BATCH_FIELDS, key,
+        pagination.parse_fields(fields, UPLOAD_BATCH_FIELDS, UPLOAD_BATCH_DEFAULT_FIELDS),
+        where=where, limit=limit, cursor=cursor, descending=True, count=count
+    ))
+
+
+@app.get("/api/upload-batches/{batch_id}", response_model=UploadBatchResponse)
+async def get_upload_batch(batch_id: int, db: AsyncSession = Depends(get_db)):
+    """One upload with its timings and the first MAX_BATCH_ERRORS row errors."""
+    batch_record = await db.get(UploadBatch, batch_id)
+    if batch_record is None:
+        raise HTTPException(status_code=404, detail="Upload batch not found")
+    return FastJSONResponse(serialize_upload_batch(batch_record))
+
+
+@app.post("/api/upload-batches/{batch_id}/rollback")
+async def rollback_upload(batch_id: int):
+    """
+    Rolls back an upload, restoring the rows it replaced. To replace an upload instead,
+    upload the corrected sheet with the same batch name; it rewrites only changed rows.
+    """
+    return FastJSONResponse(await run_in_threadpool(rollback_upload_batch, batch_id))
+
+
+@app.post("/api/upload-batches/{batch_id}/restore")
+async def restore_upload(batch_id: int):
+    """Re-applies a rolled back upload."""
+    return FastJSONResponse(await run_in_threadpool(restore_upload_batch, batch_id))
+
+
+@app.post("/api/jobs")
+async def create_job(request: JobCreateRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Creates a new job posting for a specific class.
+    """
+    new_job = Job(
+        title=request.title,
+        description=request.description,
+        company=request.company,
+        year=request.year,
+        branch=request.branch,
+        section=request.section,
+        posted_by=request.posted_by
+    )
+    db.add(new_job)
+    await db.commit()
+    return {"message": "Job posted successfully", "id": new_job.id}
+
+JOB_FIELDS = {
+    "id": Job.id,
+    "title": Job.title,
+    "description": Job.description,
+    "company": Job.company,
+    "year": Job.year,
+    "branch": Job.branch,
+    "section": Job.section,
+    "posted_by": Job.posted_by,
+    "posted_at": Job.posted_at
+}
+# Descriptions can be long; paginated list views ask for them explicitly with ?fields=
+JOB_DEFAULT_FIELDS = [field for field in JOB_FIELDS if field != "description"]
+
+@app.get("/api/jobs", response_model=List[JobResponse])
+async def get_all_jobs(db: AsyncSession = Depends(get_db)):
+    """
+    Fetches all jobs regardless of demographic (useful for TPO).
+    """
+    rows = (await db.execute(select(*JOB_FIELDS.values()).order_by(Job.posted_at.desc()))).all()
+    return rows_response(JOB_FIELDS, rows)
+
+@app.get("/api/jobs/page", response_model=Page[JobResponse])
+async def get_jobs_page(year: Optional[str] = None, branch: Optional[str] = None, section: Optional[str] = None,
+                        company: Optional[str] = None, posted_by: Optional[str] = None,
+                        since: Optional[datetime] = None, fields: Optional[str] = None,
+                        limit: int = pagination.DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                        count: str = "estimate", db: AsyncSession = Depends(get_db)):
+    """
+    Keyset-paginated /api/jobs, newest first. Descriptions are left out unless requested
+    with ?fields=; since= keeps jobs posted at or after a timestamp.
+    """
+    where = []
+    for column, value in ((Job.year, year), (Job.branch, branch), (Job.section, section),
+                          (Job.company, company), (Job.posted_by, posted_by)):
+        if value:
+            where.append(column == value)
+    if since:
+        where.append(Job.posted_at >= since)
+    return FastJSONResponse(await pagination.keyset_page(
+        db, Job, JOB_FIELDS, (Job.posted_at, Job.id),
+        pagination.parse_fields(fields, JOB_FIELDS, JOB_DEFAULT_FIELDS),
+        where=where, limit=limit, cursor=cursor, descending=True, count=count
+    ))
+
+@app.get("/api/student/{rollNumber}/jobs", response_model=List[JobResponse])
+async def get_student_jobs(rollNumber: str, db: AsyncSession = Depends(get_db)):
     """
     Fetches jobs specifically designated for the student's year, branch, and section.
     """
-    db = SessionLocal()
-    try:
-        student = db.query(Student).filter(Student.rollNumber == rollNumber).first()
-        if not student:
-            raise HTTPException(status_code=404, detail="Student not found")
-
-        jobs = db.query(Job).filter(
-            Job.year == student.year
-        ).order_by(Job.posted_at.desc()).all()
-        
-        return jobs
-    finally:
-        db.close()
+    student = (await db.execute(select(Student.year).where(Student.rollNumber == rollNumber))).first()
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    rows = (await db.execute(select(*JOB_FIELDS.values()).where(
+        Job.year == student.year
+    ).order_by(Job.posted_at.desc()))).all()
+
+    return rows_response(JOB_FIELDS, rows)
 
 class UpdateTpoPasswordRequest(BaseModel):
     newPassword: str
 
 @app.put("/api/admin/tpo/password")
-async def update_tpo_password(request: UpdateTpoPasswordRequest):
+async def update_tpo_password(request: UpdateTpoPasswordRequest, db: AsyncSession = Depends(get_db)):
     """
     Allows the super admin to forcefully overwrite the TPO account's password.
     """
+    tpo_user = await db.scalar(select(Teacher).where(Teacher.role == "tpo").limit(1))
+    if not tpo_user:
+        raise HTTPException(status_code=404, detail="TPO account not initialized.")
+    
+    tpo_user.password = request.newPassword # Depending on architecture this might need hash_password() but Faculty passwords are cleartext in this local schema
+    await db.commit()
+    return {"message": "TPO password updated successfully"}
+
+
+# Batch scoring: recomputes the upload-time scores against every AI test taken since,
+# then flags students whose scores are falling in several subjects. Submissions keep the
+# scores current on their own (refresh_assessment_scores); re-deriving them here from
+# the raw results reconciles anything written around that path. Runs every
+# SCORING_JOB_INTERVAL seconds (0 = only on demand through POST /api/scoring/run).
+SCORING_JOB_INTERVAL = float(os.environ.get("SCORING_JOB_INTERVAL", "3600"))
+# Trend flags fit each subject's daily scores over the last FLAG_LOOKBACK_DAYS days. A
+# subject with at least FLAG_MIN_POINTS daily scores declines when it loses
+# FLAG_SLOPE_THRESHOLD or more points per 30 days, and a student is flagged with at
+# least FLAG_MIN_SUBJECTS declining subjects
+FLAG_LOOKBACK_DAYS = int(os.environ.get("FLAG_LOOKBACK_DAYS", "120"))
+FLAG_MIN_POINTS = int(os.environ.get("FLAG_MIN_POINTS", "3"))
+FLAG_SLOPE_THRESHOLD = float(os.environ.get("FLAG_SLOPE_THRESHOLD", "5"))
+FLAG_MIN_SUBJECTS = int(os.environ.get("FLAG_MIN_SUBJECTS", "2"))
+
+class FlagCandidates:
+    """
+    Students whose marks or tests changed since the last flag pass, collected from every
+    commit made in this process, and the day of the process's last full flag pass. Writes
+    from other processes are picked up by the next full pass, at the latest the next day.
+    """
+
+    def __init__(self):
+        self.full_pass_day = None
+        self._rolls = set()
+        self._lock = threading.Lock()
+
+    def add(self, rolls):
+        with self._lock:
+            self._rolls.update(rolls)
+
+    def take(self) -> set:
+        with self._lock:
+            rolls, self._rolls = self._rolls, set()
+        return rolls
+
+flag_candidates = FlagCandidates()
+
+def days_since(db: Session, column, start):
+    """Days from the date start to a Date column, as a SQL expression for the session's database."""
+    if db.get_bind().dialect.name == "postgresql":
+        return column - start
+    # Inlined rather than bound, so SQLite evaluates julianday() of the constant only once
+    return func.julianday(column) - func.julianday(literal(start.isoformat(), literal_execute=True))
+
+def rescore_uploads(db: Session, after_id: Optional[int]) -> int:
+    """
+    Recomputes assessment_score, final_combined_score and performance_category of the
+    uploaded marks of every (student, subject) with AI test results after after_id
+    (every pair with results when None) in one UPDATE ... FROM, then copies the new
+    scores of the latest uploads into class_performance. Returns the number of rows
+    whose scores changed. The caller commits.
+    """
+    test_pct = case(
+        (StudentTestResult.total_questions > 0,
+         StudentTestResult.score * 100.0 / StudentTestResult.total_questions),
+        else_=0.0
+    )
+    averages = select(
+        StudentTestResult.student_roll.label("roll"), Test.subject.label("subject"),
+        func.avg(test_pct).label("assessment")
+    ).join(Test, StudentTestResult.test_id == Test.id)
+    latest_ids = select(func.max(StudentPerformance.id)).group_by(
+        StudentPerformance.year, StudentPerformance.branch, StudentPerformance.section,
+        StudentPerformance.rollNumber, StudentPerformance.subject
+    )
+    if after_id is not None:
+        affected = select(StudentTestResult.student_roll, Test.subject).join(
+            Test, StudentTestResult.test_id == Test.id
+        ).where(StudentTestResult.id > after_id).distinct().subquery()
+        rolls = db.scalars(select(affected.c.student_roll).distinct()).all()
+        if not rolls:
+            return 0
+        averages = averages.join(affected, (affected.c.student_roll == StudentTestResult.student_roll)
+                                 & (affected.c.subject == Test.subject))
+        latest_ids = latest_ids.join(affected, (affected.c.student_roll == StudentPerformance.rollNumber)
+                                     & (affected.c.subject == StudentPerformance.subject))
+        mark_students_changed(db, rolls)
+    averages = averages.group_by(StudentTestResult.student_roll, Test.subject).subquery()
+
+    final = (func.coalesce(StudentPerformance.normalized_score, StudentPerformance.totalMarks)
+             + averages.c.assessment) / 2
+    rescored = db.execute(
+        update(StudentPerformance)
+        .where(StudentPerformance.rollNumber == averages.c.roll, StudentPerformance.subject == averages.c.subject,
+               # Rows already scored against the same average are left unwritten
+               or_(StudentPerformance.assessment_score.is_distinct_from(averages.c.assessment),
+                   StudentPerformance.final_combined_score.is_distinct_from(final)))
+        .values(assessment_score=averages.c.assessment, final_combined_score=final,
+                performance_category=category_case(final))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not rescored:
+        return 0
+
+    latest = select(
+        StudentPerformance.year, StudentPerformance.branch, StudentPerformance.section,
+        StudentPerformance.rollNumber, StudentPerformance.subject,
+        StudentPerformance.assessment_score, StudentPerformance.final_combined_score
+    ).where(StudentPerformance.id.in_(latest_ids)).subquery()
+    db.execute(
+        update(ClassPerformance)
+        .where(*(getattr(ClassPerformance, column) == latest.c[column] for column in CLASS_PERFORMANCE_KEY),
+               ClassPerformance.has_upload.is_(True),
+               ClassPerformance.final_score.is_distinct_from(latest.c.final_combined_score))
+        .values(assessment_score=latest.c.assessment_score, final_score=latest.c.final_combined_score,
+                updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    return rescored
+
+def flag_declining_students(db: Session, run_id: int, today, rolls=None) -> int:
+    """
+    Replaces student_flags with the students declining in FLAG_MIN_SUBJECTS or more
+    subjects over the last FLAG_LOOKBACK_DAYS days, or only the flags of the students in
+    rolls when given. Each subject's count-weighted least-squares slope is computed from
+    daily_score_rollups in one grouped query, and only the declining subjects reach
+    pandas. Returns the number of students flagged. The caller commits.
+    """
+    start = today - timedelta(days=FLAG_LOOKBACK_DAYS)
+    x = days_since(db, DailyScoreRollup.day, start)
+    w = func.sum(DailyScoreRollup.score_count)
+    wx = func.sum(DailyScoreRollup.score_count * x)
+    wy = func.sum(DailyScoreRollup.score_sum)  # A day's score_sum is its count times its average
+    wxx = func.sum(DailyScoreRollup.score_count * x * x)
+    wxy = func.sum(DailyScoreRollup.score_sum * x)
+    slope = (w * wxy - wx * wy) / func.nullif(w * wxx - wx * wx, 0) * trends.SLOPE_DAYS
+    # Grouped in ix_daily_score_rollups_key order, so the full scan needs no sort
+    student_subject = (DailyScoreRollup.year, DailyScoreRollup.branch, DailyScoreRollup.section,
+                       DailyScoreRollup.subject, DailyScoreRollup.rollNumber)
+    slopes = (
+        select(*student_subject, slope)
+        .where(DailyScoreRollup.day >= start)
+        .group_by(*student_subject)
+        .having(func.count() >= FLAG_MIN_POINTS, slope <= -FLAG_SLOPE_THRESHOLD)
+    )
+    if rolls is None:
+        rows = db.execute(slopes).all()
+        db.execute(delete(StudentFlag))
+    else:
+        # Looked up through ix_daily_score_rollups_student, a chunk of students at a time
+        rolls = list(rolls)
+        rows = []
+        for offset in range(0, len(rolls), UPSERT_LOOKUP_CHUNK):
+            chunk = rolls[offset:offset + UPSERT_LOOKUP_CHUNK]
+            rows.extend(db.execute(slopes.where(DailyScoreRollup.rollNumber.in_(chunk))).all())
+            db.execute(delete(StudentFlag).where(StudentFlag.rollNumber.in_(chunk)))
+    flagged = trends.declining_students(
+        pd.DataFrame.from_records(rows, columns=["year", "branch", "section", "subject", "rollNumber", "slope"]),
+        FLAG_MIN_SUBJECTS
+    )
+
+    if not flagged.empty:
+        flagged_at = datetime.utcnow()
+        db.execute(insert(StudentFlag), [
+            {"year": year, "branch": branch, "section": section, "rollNumber": roll,
+             "declining_subjects": declining, "slope": slope, "worst_subject": worst_subject,
+             "worst_slope": worst_slope, "run_id": run_id, "flagged_at": flagged_at}
+            for year, branch, section, roll, declining, slope, worst_subject, worst_slope
+            in flagged.itertuples(index=False, name=None)
+        ])
+    if rolls is None:
+        return len(flagged)
+    return db.scalar(select(func.count(StudentFlag.id)))
+
+def run_scoring_job(full: bool = False) -> dict:
+    """
+    One scoring run: rescores uploads with AI test results submitted since the last
+    successful run (all of them on the first run or when full) and refreshes the trend
+    flags, recording the run in scoring_runs. Flags are refitted for every student on
+    full runs and on the process's first run of each day, since the lookback window
+    moves with the date, and otherwise only for the students changed since the last run.
+    Runs in a worker thread.
+    """
     db = SessionLocal()
+    start = time.perf_counter()
+    run = ScoringRun(started_at=datetime.utcnow(), status="running", full=full)
+    db.add(run)
+    db.commit()
+    # Taken before the run reads anything, so every write it misses stays queued
+    rolls = flag_candidates.take()
+    today = run.started_at.date()
     try:
-        tpo_user = db.query(Teacher).filter(Teacher.role == "tpo").first()
-        if not tpo_user:
-            raise HTTPException(status_code=404, detail="TPO account not initialized.")
-        
-        tpo_user.password = request.newPassword # Depending on architecture this might need hash_password() but Faculty passwords are cleartext in this local schema
+        watermark = db.scalar(select(func.max(ScoringRun.last_result_id)).where(ScoringRun.status == "done"))
+        run.full = full = full or watermark is None
+        # Results submitted while the run is in progress are picked up by the next one
+        run.last_result_id = db.scalar(select(func.max(StudentTestResult.id))) or 0
+        run.rows_rescored = rescore_uploads(db, None if full else watermark)
+        full_flags = full or flag_candidates.full_pass_day != today
+        run.students_flagged = flag_declining_students(db, run.id, today, None if full_flags else rolls)
+        run.status = "done"
+        run.finished_at = datetime.utcnow()
+        run.seconds = round(time.perf_counter() - start, 3)
+        db.commit()
+        if full_flags:
+            flag_candidates.full_pass_day = today
+    except Exception as e:
+        db.rollback()
+        flag_candidates.add(rolls)
+        run.status = "failed"
+        run.error = str(e)
+        run.finished_at = datetime.utcnow()
+        run.seconds = round(time.perf_counter() - start, 3)
         db.commit()
-        return {"message": "TPO password updated successfully"}
+        raise
     finally:
+        summary = serialize_scoring_run(run)
         db.close()
+    if run.rows_rescored:
+        # Categories feed every cached class summary
+        class_statistics_cache.clear()
+        if full:
+            student_analytics_cache.clear()
+    return summary
+
+def serialize_scoring_run(run: ScoringRun) -> dict:
+    return {
+        "id": run.id,
+        "startedAt": run.started_at,
+        "finishedAt": run.finished_at,
+        "status": run.status,
+        "full": run.full,
+        "lastResultId": run.last_result_id,
+        "rowsRescored": run.rows_rescored,
+        "studentsFlagged": run.students_flagged,
+        "seconds": run.seconds,
+        "error": run.error
+    }
+
+scoring_job = PeriodicJob("scoring", run_scoring_job, SCORING_JOB_INTERVAL)
+
+
+@app.on_event("startup")
+def start_scoring_job():
+    scoring_job.start()
+
+
+@app.on_event("shutdown")
+async def stop_scoring_job():
+    await scoring_job.stop()
+
+
+@app.post("/api/scoring/run", response_model=ScoringRunResponse)
+async def run_scoring(full: bool = False):
+    """
+    Runs the scoring job now, after any run already in progress, and returns its
+    summary. ?full=true rescores every upload instead of only those with new test results.
+    """
+    try:
+        return FastJSONResponse(await scoring_job.run_now(full=full))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Scoring run failed: {e}")
+
+@app.get("/api/scoring/runs", response_model=List[ScoringRunResponse])
+async def get_scoring_runs(limit: int = 20, db: AsyncSession = Depends(get_db)):
+    """The most recent scoring runs, newest first."""
+    runs = (await db.scalars(select(ScoringRun).order_by(ScoringRun.id.desc()).limit(limit))).all()
+    return FastJSONResponse([serialize_scoring_run(run) for run in runs])
+
+STUDENT_FLAG_FIELDS = {
+    "rollNumber": StudentFlag.rollNumber,
+    "year": StudentFlag.year,
+    "branch": StudentFlag.branch,
+    "section": StudentFlag.section,
+    "decliningSubjects": StudentFlag.declining_subjects,
+    "slope": StudentFlag.slope,
+    "worstSubject": StudentFlag.worst_subject,
+    "worstSlope": StudentFlag.worst_slope,
+    "flaggedAt": StudentFlag.flagged_at
+}
+
+@app.get("/api/students/flagged", response_model=Page[StudentFlagResponse])
+async def get_flagged_students(year: Optional[str] = None, branch: Optional[str] = None,
+                               section: Optional[str] = None, fields: Optional[str] = None,
+                               limit: int = pagination.DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                               count: str = "estimate", db: AsyncSession = Depends(get_db)):
+    """
+    Keyset-paginated students flagged by the latest scoring run as trending down in
+    several subjects, steepest decline first. Filtering by class walks
+    ix_student_flags_class_slope; without filters, ix_student_flags_slope.
+    """
+    where = []
+    for column, value in ((StudentFlag.year, year), (StudentFlag.branch, branch), (StudentFlag.section, section)):
+        if value:
+            where.append(column == value)
+    return FastJSONResponse(await pagination.keyset_page(
+        db, StudentFlag, STUDENT_FLAG_FIELDS, (StudentFlag.slope, StudentFlag.id),
+        pagination.parse_fields(fields, STUDENT_FLAG_FIELDS, STUDENT_FLAG_FIELDS),
+        where=where, limit=limit, cursor=cursor, count=count
+    ))
+
+
+# In-process caches reported by the metrics endpoint, by name
+CACHES = {cache.name: cache for cache in (student_analytics_cache, question_set_cache, class_statistics_cache,
+                                         response_cache.bodies, response_compressor.variants)}
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Hit/miss counters for the in-process and HTTP response caches, response compression, question bank and generator backends, batching stats for the write coalescers, the scoring job and upload timings."""
+    return {
+        "caches": [cache.stats() for cache in CACHES.values()],
+        "responseCache": response_cache.stats(),
+        "compression": response_compressor.stats(),
+        "questionBank": question_bank_stats.stats(),
+        "generators": [generator.stats() for generator in question_generation.GENERATORS.values()],
+        "writers": [submission_writer.stats()],
+        "scoringJob": scoring_job.stats(),
+        "uploadBatches": upload_batch_stats.stats()
+    }
+
+@app.post("/api/metrics/caches/{name}/clear")
+async def clear_cache(name: str):
+    """Drops every entry of one in-process cache, e.g. after editing questions directly in the database."""
+    cache = CACHES.get(name)
+    if cache is None:
+        raise HTTPException(status_code=404, detail="Cache not found")
+    cache.clear()
+    return cache.stats()
 
 
 if __name__ == "__main__":
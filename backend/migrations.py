@@ -0,0 +1,172 @@
+"""
+Versioned schema migrations for the Performance Analyzer database.
+Applied migrations are recorded in the schema_migrations table, so every migration
+runs exactly once per database. main.py applies pending migrations on startup; they
+can also be run by hand:
+
+    python migrations.py             # apply pending migrations
+    python migrations.py --status    # list applied / pending migrations
+"""
+
+import argparse
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import create_engine, inspect, text
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Registers a migration function taking a SQLAlchemy Connection."""
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+
+def _has_table(conn, table):
+    # Tables are created by Base.metadata.create_all(); a migration has nothing to do
+    # on a database where its table does not exist yet
+    return inspect(conn).has_table(table)
+
+
+def _add_column_if_missing(conn, table, column, ddl_type):
+    if not _has_table(conn, table):
+        return
+    existing = {c["name"] for c in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+@migration(1, "add student_performance analytics columns")
+def add_analytics_columns(conn):
+    for column, ddl_type in (
+        ("normalized_score", "FLOAT"),
+        ("assessment_score", "FLOAT"),
+        ("final_combined_score", "FLOAT"),
+        ("performance_category", "VARCHAR"),
+    ):
+        _add_column_if_missing(conn, "student_performance", column, ddl_type)
+
+
+@migration(2, "normalize legacy year and branch labels")
+def normalize_year_branch_labels(conn):
+    if not _has_table(conn, "student_performance"):
+        return
+    for column, old, new in (
+        ("year", "1", "First Year"),
+        ("year", "2", "Second Year"),
+        ("year", "3", "Third Year"),
+        ("year", "4", "Fourth Year"),
+        ("branch", "MEC", "MECH"),
+        ("branch", "CSC", "CSM"),
+    ):
+        conn.execute(
+            text(f"UPDATE student_performance SET {column} = :new WHERE {column} = :old"),
+            {"old": old, "new": new}
+        )
+
+
+# Composite indexes matching the hot read paths; mirrored in the models' __table_args__
+DEMOGRAPHIC_INDEXES = (
+    ("ix_tests_demographics", "tests", ("year", "branch", "section")),
+    ("ix_tests_created_by", "tests", ("createdBy",)),
+    ("ix_tests_subject", "tests", ("subject",)),
+    ("ix_student_performance_demographics", "student_performance", ("year", "branch", "section")),
+    ("ix_jobs_demographics", "jobs", ("year", "branch", "section")),
+    ("ix_jobs_posted_at", "jobs", ("posted_at",)),
+    ("ix_student_test_results_roll_test", "student_test_results", ("student_roll", "test_id")),
+    ("ix_student_answers_roll_test", "student_answers", ("student_roll", "test_id")),
+    ("ix_student_assigned_questions_roll_test", "student_assigned_questions", ("student_roll", "test_id")),
+)
+
+
+def _create_index(conn, index_name, table, columns, unique=False):
+    if not _has_table(conn, table):
+        return
+    quoted = ", ".join(f'"{c}"' for c in columns)
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    conn.execute(text(f"CREATE {kind} IF NOT EXISTS {index_name} ON {table} ({quoted})"))
+
+
+@migration(3, "add composite indexes for demographic filters")
+def add_demographic_indexes(conn):
+    for index_name, table, columns in DEMOGRAPHIC_INDEXES:
+        _create_index(conn, index_name, table, columns)
+
+
+@migration(4, "index students by class for bulk question assignment")
+def add_student_demographics_index(conn):
+    _create_index(conn, "ix_students_demographics", "students", ("year", "branch", "section"))
+
+
+@migration(5, "index jobs by year and posting time for paginated job lists")
+def add_jobs_year_posted_at_index(conn):
+    _create_index(conn, "ix_jobs_year_posted_at", "jobs", ("year", "posted_at"))
+
+
+@migration(6, "index student_performance by student and subject for incremental rescoring")
+def add_student_performance_roll_subject_index(conn):
+    _create_index(conn, "ix_student_performance_roll_subject", "student_performance",
+                  ("rollNumber", "subject", "year", "branch", "section"))
+
+
+@migration(7, "add upload batches to student_performance with a unique key per batch and student")
+def add_student_performance_upload_batch(conn):
+    # Existing rows keep a NULL batch, which never conflicts with another row
+    _add_column_if_missing(conn, "student_performance", "upload_batch", "VARCHAR")
+    _create_index(conn, "ix_student_performance_upload_key", "student_performance",
+                  ("upload_batch", "subject", "year", "branch", "section", "rollNumber"), unique=True)
+
+
+@migration(8, "tag student_performance rows with the upload that wrote them")
+def add_student_performance_batch_id(conn):
+    _add_column_if_missing(conn, "student_performance", "batch_id", "INTEGER")
+    _create_index(conn, "ix_student_performance_batch", "student_performance", ("batch_id",))
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at VARCHAR NOT NULL)"
+    ))
+
+
+def applied_versions(engine):
+    with engine.begin() as conn:
+        _ensure_version_table(conn)
+        return {row[0] for row in conn.execute(text("SELECT version FROM schema_migrations"))}
+
+
+def upgrade(engine):
+    """Applies every pending migration in version order, each in its own transaction."""
+    done = applied_versions(engine)
+    for version, name, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in done:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.utcnow().isoformat()}
+            )
+        logger.info(f"Applied migration {version}: {name}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Apply database schema migrations.")
+    parser.add_argument("--status", action="store_true", help="List migrations without applying them")
+    args = parser.parse_args()
+
+    db_engine = create_engine(os.environ.get("DATABASE_URL", "sqlite:///./database.sqlite"))
+    if args.status:
+        done = applied_versions(db_engine)
+        for version, name, _ in sorted(MIGRATIONS, key=lambda m: m[0]):
+            print(f"{version:>4}  {'applied' if version in done else 'pending':<8} {name}")
+    else:
+        upgrade(db_engine)
@@ -0,0 +1,120 @@
+"""
+Keyset pagination for list endpoints.
+Pages are ordered by a unique key (id, or e.g. (posted_at, id)) and the cursor carries
+the key of the last row served, so every page is an index range scan of `limit` rows:
+page 2,000 costs the same as page 1, unlike OFFSET, which reads and discards all the
+rows before it. Endpoints also pick which fields to return and how the total is counted.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import DateTime, func, literal, select, text, tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+# Estimated totals on SQLite count at most this many rows, then report a lower bound
+COUNT_ESTIMATE_CAP = 100_000
+COUNT_MODES = ("estimate", "exact", "none")
+
+
+def parse_fields(fields, available, default):
+    """Resolves a comma-separated ?fields= projection against the fields an endpoint offers."""
+    if not fields:
+        return list(default)
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in available]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown field(s) {', '.join(unknown)}; available: {', '.join(available)}"
+        )
+    return list(dict.fromkeys(requested))
+
+
+def encode_cursor(values):
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, key):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(key):
+            raise ValueError
+        return [
+            datetime.fromisoformat(value) if isinstance(column.type, DateTime) else value
+            for column, value in zip(key, values)
+        ]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def count_rows(db, table, where, mode):
+    """
+    Returns (total, exact) for the rows of table matching where. "estimate" uses the
+    PostgreSQL planner's row estimate; SQLite has none, so it counts up to
+    COUNT_ESTIMATE_CAP rows and reports the cap as a lower bound beyond that.
+    """
+    if mode == "exact":
+        return await db.scalar(select(func.count()).select_from(table).where(*where)), True
+
+    bind = db.get_bind()
+    if bind.dialect.name == "postgresql":
+        stmt = select(literal(1)).select_from(table).where(*where)
+        sql = stmt.compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True})
+        plan = await db.scalar(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        return int(plan[0]["Plan"]["Plan Rows"]), False
+
+    capped = select(literal(1)).select_from(table).where(*where).limit(COUNT_ESTIMATE_CAP).subquery()
+    total = await db.scalar(select(func.count()).select_from(capped))
+    return total, total < COUNT_ESTIMATE_CAP
+
+
+async def keyset_page(db, table, columns, key, fields, where=(), limit=DEFAULT_PAGE_SIZE, cursor=None,
+                      descending=False, count="estimate"):
+    """
+    Fetches one page of table.
+
+    columns maps output field names to column expressions and fields picks the ones to
+    return; key is the tuple of columns that orders the rows uniquely (ending in the
+    primary key), walked in descending order if requested. Returns the page envelope:
+    items, nextCursor (None on the last page), total and totalExact.
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    if count not in COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"count must be one of {', '.join(COUNT_MODES)}")
+
+    where = list(where)
+    filters = list(where)
+    if cursor:
+        values = decode_cursor(cursor, key)
+        if len(key) == 1:
+            where.append(key[0] < values[0] if descending else key[0] > values[0])
+        else:
+            where.append(tuple_(*key) < tuple_(*values) if descending else tuple_(*key) > tuple_(*values))
+
+    stmt = (
+        select(*(columns[name].label(name) for name in fields), *key)
+        .select_from(table)
+        .where(*where)
+        .order_by(*(column.desc() if descending else column.asc() for column in key))
+        .limit(limit + 1)
+    )
+    rows = (await db.execute(stmt)).all()
+    width = len(fields)
+    next_cursor = encode_cursor(rows[limit - 1][width:]) if len(rows) > limit else None
+    items = [dict(zip(fields, row)) for row in rows[:limit]]
+
+    if count == "none":
+        total, exact = None, False
+    elif not cursor and next_cursor is None:
+        # A first page that is also the last one has counted everything already
+        total, exact = len(items), True
+    else:
+        total, exact = await count_rows(db, table, filters, count)
+    return {"items": items, "nextCursor": next_cursor, "total": total, "totalExact": exact}
@@ -0,0 +1,431 @@
+"""
+Question generation pipeline for AI tests.
+Backends implement QuestionGenerator and are registered in GENERATORS: Gemini, and an
+offline template engine for air-gapped or load-testing deployments.
+Large tests are split into chunks that are generated concurrently (bounded by a
+semaphore), each with its own timeout and retries. Every chunk is handed to a callback
+as soon as it arrives, so questions can be stored and progress reported before the
+whole test is done.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+from collections import deque
+
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = "gemini-2.5-flash"
+
+# Defaults for generate_questions(); main.py overrides them from the environment
+CHUNK_SIZE = 10
+CONCURRENCY = 4
+TIMEOUT = 60.0
+RETRIES = 2
+RETRY_BACKOFF = 0.5
+
+
+class GenerationError(Exception):
+    """Raised when some chunks still fail after their retries; generated counts what was delivered."""
+
+    def __init__(self, message, generated=0):
+        super().__init__(message)
+        self.generated = generated
+
+
+DEFAULT_DIFFICULTY = "medium"
+
+OPTION_FIELDS = ("option_a", "option_b", "option_c", "option_d")
+QUESTION_FIELDS = ("question",) + OPTION_FIELDS + ("correct_answer",)
+
+
+def normalize(text):
+    """Case- and whitespace-insensitive form of a prompt field."""
+    return " ".join(str(text).lower().split())
+
+
+def bank_key(subject, difficulty):
+    """Content address of a question-bank pool: a hash of the normalized prompt fields."""
+    return hashlib.sha256(f"{normalize(subject)}|{normalize(difficulty)}".encode()).hexdigest()
+
+
+def question_hash(question):
+    """Content address of a single question, used to keep a pool free of duplicates."""
+    fields = [question.get(k, "") for k in QUESTION_FIELDS[:-1]]
+    return hashlib.sha256("|".join(normalize(f) for f in fields).encode()).hexdigest()
+
+
+class BankStats:
+    """Lookup counters for the question bank; a hit means no generation was needed."""
+
+    def __init__(self):
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.reused = 0
+        self.generated = 0
+
+    def record(self, requested, reused):
+        if reused >= requested:
+            self.hits += 1
+        elif reused:
+            self.partial_hits += 1
+        else:
+            self.misses += 1
+        self.reused += reused
+
+    def stats(self):
+        lookups = self.hits + self.partial_hits + self.misses
+        questions = self.reused + self.generated
+        return {
+            "lookups": lookups,
+            "hits": self.hits,
+            "partialHits": self.partial_hits,
+            "misses": self.misses,
+            "questionsReused": self.reused,
+            "questionsGenerated": self.generated,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else None,
+            "reuseRatio": round(self.reused / questions, 4) if questions else None
+        }
+
+
+class QuestionGenerator:
+    """
+    A question-generation backend. Subclasses implement _generate(); callers use
+    generate(), which records per-backend call latency and question throughput.
+
+    part/parts identify a chunk within one test, seed identifies the test and start is
+    the position of the first requested question within the chunk, so a deterministic
+    backend can produce distinct chunks and re-request just the missing tail of one.
+    """
+
+    name = None
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.questions = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+        self._latencies = deque(maxlen=1024)
+
+    async def _generate(self, subject, difficulty, count, part, parts, seed, start, emit):
+        """Produces up to count raw question items, calling emit(item) as each one is parsed."""
+        raise NotImplementedError
+
+    async def generate(self, subject, difficulty, count, part=0, parts=1, seed=0, start=0, emit=None):
+        """
+        Requests count questions and returns the valid ones. Each item is validated as soon
+        as the backend parses it and, if valid, handed to emit(question) straight away, so
+        a caller keeps the questions that arrived before a failure or timeout.
+        """
+        questions = []
+
+        def accept(item):
+            question = validate_question(item)
+            if question is None:
+                self.rejected += 1
+                return
+            questions.append(question)
+            if emit:
+                emit(question)
+
+        started = time.perf_counter()
+        ok = False
+        try:
+            await self._generate(subject, difficulty, count, part, parts, seed, start, accept)
+            ok = True
+            return questions
+        finally:
+            # Cancellation by a chunk timeout lands here too and counts as a failure
+            elapsed = time.perf_counter() - started
+            self.calls += 1
+            self.busy_seconds += elapsed
+            self._latencies.append(elapsed)
+            self.questions += len(questions)
+            if not ok:
+                self.failures += 1
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 4) if latencies else None
+
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "failures": self.failures,
+            "questions": self.questions,
+            "rejected": self.rejected,
+            "avgLatency": round(self.busy_seconds / self.calls, 4) if self.calls else None,
+            "p50Latency": percentile(0.50),
+            "p95Latency": percentile(0.95),
+            # Per in-flight call; concurrent chunks multiply the wall-clock rate
+            "questionsPerSecond": round(self.questions / self.busy_seconds, 2) if self.busy_seconds else None
+        }
+
+
+def build_prompt(subject, difficulty, count, part=0, parts=1):
+    prompt = f"""
+        Generate exactly {count} {difficulty}-difficulty multiple choice questions for the subject "{subject}".
+        Return the result ONLY as a raw JSON array of objects. Do not use markdown blocks like ```json.
+        Each object must use these exact keys:
+        "question", "option_a", "option_b", "option_c", "option_d", "correct_answer".
+        Make sure "correct_answer" exactly matches the text of one of the options (A, B, C, or D).
+        """
+    if parts > 1:
+        # Parallel chunks are requested independently; steer them apart to limit duplicates
+        prompt += f"""This is set {part + 1} of {parts} for the same test, so cover different
+        topics than the other sets would.
+        """
+    return prompt
+
+
+_SIGNIFICANT = re.compile(r'[{}"\\]')
+
+
+class QuestionStreamParser:
+    """
+    Incremental parser for a JSON array of objects that arrives in pieces, e.g. a streamed
+    model response. feed() returns the top-level objects completed by each new piece, so
+    items can be used before the response ends. Anything between objects (markdown
+    fences, brackets, commas, prose) is skipped, an object that fails to decode is counted
+    in `malformed` and dropped, and a truncated tail simply never completes.
+    """
+
+    def __init__(self):
+        self.malformed = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = -1
+        self._offset = 0
+        self._parts = []
+
+    def feed(self, text):
+        items = []
+        obj_start = 0
+        # Only braces, quotes and backslashes change state, so jump between those
+        for match in _SIGNIFICANT.finditer(text):
+            pos = match.start()
+            char = text[pos]
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    obj_start = pos
+                continue
+            if self._in_string:
+                if self._offset + pos == self._escaped:
+                    continue
+                if char == "\\":
+                    self._escaped = self._offset + pos + 1
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[obj_start:pos + 1])
+                    try:
+                        items.append(json.loads("".join(self._parts)))
+                    except ValueError:
+                        self.malformed += 1
+                    self._parts = []
+        if self._depth:
+            self._parts.append(text[obj_start:])
+        self._offset += len(text)
+        return items
+
+
+def parse_questions(raw_text):
+    """Parses the question objects out of a complete (possibly fenced or truncated) response."""
+    return QuestionStreamParser().feed(raw_text)
+
+
+def validate_question(item):
+    """
+    Checks a parsed item against the Question schema: a question and four distinct
+    options, all non-empty text, and a correct answer matching one of the options.
+    Answers are graded by comparing option text, so an answer given as a letter
+    ("B", "Option B") or differing only in case/spacing is resolved to the option's
+    exact text. Returns the cleaned question, or None if the item is unusable.
+    """
+    if not isinstance(item, dict):
+        return None
+    question = {}
+    for field in QUESTION_FIELDS:
+        value = item.get(field)
+        if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            return None
+        value = str(value).strip()
+        if not value:
+            return None
+        question[field] = value
+
+    options = [question[field] for field in OPTION_FIELDS]
+    if len({normalize(option) for option in options}) < len(options):
+        return None
+    answer = question["correct_answer"]
+    if answer not in options:
+        matches = [option for option in options if normalize(option) == normalize(answer)]
+        letter = re.fullmatch(r"(?:option[\s_]*)?\(?([a-d])\)?[.:)]?", answer.strip().lower())
+        if matches:
+            answer = matches[0]
+        elif letter:
+            answer = options["abcd".index(letter.group(1))]
+        else:
+            return None
+    question["correct_answer"] = answer
+    return question
+
+
+class GeminiGenerator(QuestionGenerator):
+    name = "gemini"
+
+    def __init__(self, model=GEMINI_MODEL):
+        super().__init__()
+        self.model = model
+
+    async def _generate(self, subject, difficulty, count, part, parts, seed, start, emit):
+        # Streamed, so questions are validated while later ones are still being written and
+        # a truncated or broken response keeps every object that completed before the cut
+        model = genai.GenerativeModel(self.model)
+        response = await model.generate_content_async(build_prompt(subject, difficulty, count, part, parts), stream=True)
+        parser = QuestionStreamParser()
+        async for piece in response:
+            for item in parser.feed(piece.text):
+                emit(item)
+        if parser.malformed:
+            logger.warning(f"Dropped {parser.malformed} malformed question object(s) from a {self.model} response")
+
+
+OFFLINE_TEMPLATES = (
+    "Which statement about {topic} in {subject} is correct?",
+    "What is the main purpose of {topic} in {subject}?",
+    "Which of the following best describes {topic}?",
+    "When is {topic} the preferred approach in {subject}?",
+    "Which property distinguishes {topic} from related {subject} concepts?",
+)
+
+
+class OfflineGenerator(QuestionGenerator):
+    """
+    Local template-based backend for air-gapped and load-testing runs. Output is a pure
+    function of (subject, difficulty, seed, part, index): the same test always gets the
+    same questions, different tests and chunks get different ones, and the correct
+    option's position varies. `latency` (seconds per question) simulates the
+    output-bound latency of a real model.
+    """
+
+    name = "offline"
+
+    def __init__(self, latency=0.0):
+        super().__init__()
+        self.latency = latency
+
+    async def _generate(self, subject, difficulty, count, part, parts, seed, start, emit):
+        if self.latency:
+            await asyncio.sleep(self.latency * count)
+        for i in range(start, start + count):
+            label = f"{seed}.{part + 1}.{i + 1}"
+            rng = random.Random(f"{normalize(subject)}|{normalize(difficulty)}|{label}")
+            options = [f"Correct answer {label}"] + [f"Distractor {label}-{n}" for n in (1, 2, 3)]
+            rng.shuffle(options)
+            template = rng.choice(OFFLINE_TEMPLATES)
+            emit({
+                "question": template.format(topic=f"concept {label}", subject=subject) + f" ({difficulty})",
+                "option_a": options[0],
+                "option_b": options[1],
+                "option_c": options[2],
+                "option_d": options[3],
+                "correct_answer": f"Correct answer {label}",
+            })
+
+
+GENERATORS = {
+    "gemini": GeminiGenerator(),
+    "offline": OfflineGenerator(),
+}
+
+
+def chunk_sizes(count, chunk_size=CHUNK_SIZE):
+    """Splits a question count into chunk_size pieces plus a remainder."""
+    sizes = [chunk_size] * (count // chunk_size)
+    if count % chunk_size:
+        sizes.append(count % chunk_size)
+    return sizes
+
+
+async def generate_questions(generator, subject, difficulty, count, on_chunk, seed=0, chunk_size=CHUNK_SIZE,
+                             concurrency=CONCURRENCY, retries=RETRIES, timeout=TIMEOUT, semaphore=None):
+    """
+    Generates count questions from a QuestionGenerator as concurrent chunks and awaits
+    on_chunk(questions) for each chunk in completion order. Returns the number of
+    questions delivered. Pass a shared semaphore to bound chunks across several calls.
+
+    Each chunk gets `timeout` seconds per attempt. Valid questions are kept as they are
+    parsed, even from an attempt that then fails, times out or comes back short, and the
+    next of the `retries` further attempts (with exponential backoff) only re-requests
+    the questions still missing. A chunk still short after its retries delivers what it
+    has and does not stop the others; once every chunk has finished, a GenerationError
+    reports the shortfalls. If on_chunk raises, the remaining chunks are cancelled.
+    """
+    sizes = chunk_sizes(count, chunk_size)
+    semaphore = semaphore or asyncio.Semaphore(concurrency)
+
+    async def run_chunk(part, size):
+        collected = []
+        seen = set()
+
+        def keep(question):
+            key = question_hash(question)
+            if len(collected) < size and key not in seen:
+                seen.add(key)
+                collected.append(question)
+
+        async with semaphore:
+            for attempt in range(retries + 1):
+                missing = size - len(collected)
+                try:
+                    await asyncio.wait_for(
+                        generator.generate(subject, difficulty, missing, part, len(sizes), seed, len(collected), keep),
+                        timeout
+                    )
+                    error = f"{size - len(collected)} of {size} questions missing or invalid"
+                except Exception as e:
+                    error = "timed out" if isinstance(e, asyncio.TimeoutError) else str(e)
+                if len(collected) >= size:
+                    return collected, None
+                if attempt < retries:
+                    logger.warning(f"Chunk {part + 1}/{len(sizes)} attempt {attempt + 1}: {error}; "
+                                   f"re-requesting {size - len(collected)} question(s)")
+                    await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+        return collected, f"Chunk {part + 1}/{len(sizes)} failed after {retries + 1} attempt(s): {error}"
+
+    tasks = [asyncio.ensure_future(run_chunk(part, size)) for part, size in enumerate(sizes)]
+    generated = 0
+    errors = []
+    try:
+        for next_chunk in asyncio.as_completed(tasks):
+            questions, error = await next_chunk
+            if error:
+                errors.append(error)
+            if questions:
+                await on_chunk(questions)
+                generated += len(questions)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if errors:
+        raise GenerationError("; ".join(errors), generated=generated)
+    return generated
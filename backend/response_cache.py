@@ -0,0 +1,153 @@
+"""
+HTTP response caching for read-heavy GET endpoints.
+Each cached route declares the tables it reads. Writes bump per-table version counters
+once their transaction commits, and a response's ETag is derived from its URL and the
+versions of those tables, so an If-None-Match revalidation is answered with a 304
+without running the endpoint at all. Serialized 200 bodies are kept in an LRU keyed by
+ETag and bounded by total bytes. A per-route TTL also rolls ETags over periodically,
+bounding staleness for changes the counters cannot see (other worker processes,
+manual database edits).
+"""
+
+import hashlib
+import re
+import threading
+import time
+import uuid
+from typing import NamedTuple
+
+from cache import LRUCache
+
+
+class TableVersions:
+    """Per-table write counters, bumped after each commit that touched the table."""
+
+    def __init__(self):
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def bump(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def snapshot(self, tables):
+        return tuple(self._versions.get(table, 0) for table in tables)
+
+    def stats(self):
+        return dict(self._versions)
+
+
+class CacheRule(NamedTuple):
+    """The tables a route reads and how many seconds one of its ETags may stay valid (0 = no limit)."""
+    tables: tuple
+    ttl: float = 60.0
+
+
+def _route_pattern(template):
+    # "/api/student/{rollNumber}/jobs" -> one path segment per parameter
+    return re.compile("^" + re.sub(r"\\\{\w+\\\}", "[^/]+", re.escape(template)) + "$")
+
+
+class ResponseCache:
+    """
+    Route rules, the version counters and the body LRU, plus per-route counters. Held
+    outside the middleware so main.py can report and clear it.
+    """
+
+    def __init__(self, rules, versions, maxsize=512, max_bytes=64 * 1024 * 1024):
+        self.rules = [(template, _route_pattern(template), rule) for template, rule in rules.items()]
+        self.versions = versions
+        # Bounded by entry count and by total body bytes
+        self.bodies = LRUCache("responses", maxsize=maxsize, weigh=lambda entry: len(entry[1]), max_weight=max_bytes)
+        # Versions restart at zero with the process; keep ETags from before a restart from matching
+        self._boot = uuid.uuid4().hex
+        self.routes = {template: {"hits": 0, "misses": 0, "notModified": 0} for template in rules}
+
+    def match(self, path):
+        for template, pattern, rule in self.rules:
+            if pattern.match(path):
+                return template, rule
+        return None
+
+    def etag(self, rule, path, query_string):
+        epoch = int(time.time() // rule.ttl) if rule.ttl else 0
+        # Clearing the body cache bumps its generation, which also retires outstanding ETags
+        key = f"{self._boot}|{self.bodies.generation}|{path}?{query_string}|{self.versions.snapshot(rule.tables)}|{epoch}"
+        return '"' + hashlib.blake2b(key.encode(), digest_size=12).hexdigest() + '"'
+
+    def stats(self):
+        requests = sum(sum(counters.values()) for counters in self.routes.values())
+        served = sum(counters["hits"] + counters["notModified"] for counters in self.routes.values())
+        return {
+            "requests": requests,
+            # Requests answered without running the endpoint: cached bodies plus 304s
+            "hitRatio": round(served / requests, 4) if requests else None,
+            "routes": {template: dict(counters) for template, counters in self.routes.items()},
+            "tableVersions": self.versions.stats(),
+            "bodies": self.bodies.stats()
+        }
+
+
+def _etag_matches(header, etag):
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+class ResponseCacheMiddleware:
+    """ASGI middleware serving GET requests for the routes in a ResponseCache."""
+
+    def __init__(self, app, cache):
+        self.app = app
+        self.cache = cache
+
+    async def __call__(self, scope, receive, send):
+        matched = self.cache.match(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+        if matched is None:
+            await self.app(scope, receive, send)
+            return
+
+        template, rule = matched
+        counters = self.cache.routes[template]
+        etag = self.cache.etag(rule, scope["path"], scope["query_string"].decode("latin-1"))
+        validators = [(b"etag", etag.encode()), (b"cache-control", b"no-cache")]
+
+        if_none_match = next((value for name, value in scope["headers"] if name == b"if-none-match"), None)
+        if if_none_match is not None and _etag_matches(if_none_match.decode("latin-1"), etag):
+            counters["notModified"] += 1
+            await send({"type": "http.response.start", "status": 304, "headers": validators})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        cached = self.cache.bodies.get(etag)
+        if cached is not None:
+            counters["hits"] += 1
+            headers, body = cached
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        counters["misses"] += 1
+        generation = self.cache.bodies.generation
+        response = {"headers": None, "chunks": [], "size": 0}
+
+        async def capture(message):
+            if message["type"] == "http.response.start":
+                if message["status"] == 200:
+                    headers = [(name, value) for name, value in message.get("headers", [])
+                               if name not in (b"etag", b"cache-control")] + validators
+                    message = {**message, "headers": headers}
+                    response["headers"] = headers
+            elif message["type"] == "http.response.body" and response["headers"] is not None:
+                body = message.get("body", b"")
+                response["size"] += len(body)
+                if response["size"] > self.cache.bodies.max_weight:
+                    response["headers"] = None
+                else:
+                    response["chunks"].append(body)
+                    if not message.get("more_body", False):
+                        self.cache.bodies.set(etag, (response["headers"], b"".join(response["chunks"])), generation)
+            await send(message)
+
+        await self.app(scope, receive, capture)
@@ -0,0 +1,94 @@
+"""
+In-process scheduling for periodic batch jobs.
+A PeriodicJob runs a blocking function in the threadpool every `interval` seconds from
+a task on the application's event loop. Runs never overlap: a run requested while
+another is in progress waits for it to finish first.
+"""
+
+import asyncio
+import logging
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """
+    Runs fn(**kwargs) every interval seconds once started (interval <= 0 only allows
+    manual runs through run_now). fn returns a JSON-serializable summary of the run.
+    """
+
+    def __init__(self, name, fn, interval):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.runs = 0
+        self.failures = 0
+        self.last_started = None
+        self.last_seconds = None
+        self.last_result = None
+        self.last_error = None
+        self._lock = None
+        self._loop = None
+        self._task = None
+
+    def start(self):
+        """Schedules the periodic runs on the running event loop."""
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run_periodically())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_now()
+            except Exception as e:
+                logger.error(f"{self.name}: scheduled run failed: {e}")
+
+    async def run_now(self, **kwargs):
+        """Runs the job once, after any run already in progress, and returns its result."""
+        # The lock is bound to the event loop it is first awaited on
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self.last_started = time.time()
+            start = time.perf_counter()
+            try:
+                result = await run_in_threadpool(self.fn, **kwargs)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                raise
+            finally:
+                self.runs += 1
+                self.last_seconds = round(time.perf_counter() - start, 3)
+            self.last_result = result
+            self.last_error = None
+            return result
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "scheduled": self._task is not None and not self._task.done(),
+            "running": self._lock is not None and self._lock.locked(),
+            "runs": self.runs,
+            "failures": self.failures,
+            "lastStarted": self.last_started,
+            "lastSeconds": self.last_seconds,
+            "lastResult": self.last_result,
+            "lastError": self.last_error
+        }
@@ -0,0 +1,132 @@
+"""
+Vectorized score trends over daily rollups.
+Input is one row per (subject, day) with the sum and count of the scores recorded that
+day. Days are bucketed into periods, and every subject's rolling average, least-squares
+slope and first-to-latest deltas come from grouped pandas operations. Cost depends on
+the number of distinct days, not on the number of uploads and tests behind them.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Bucket sizes offered to clients, as pandas period aliases
+PERIODS = {"day": "D", "week": "W", "month": "M", "quarter": "Q"}
+DEFAULT_WINDOW_DAYS = 30
+MAX_WINDOW_DAYS = 3650
+# Slopes are reported in score points per this many days
+SLOPE_DAYS = 30
+
+
+def _round(value, digits=2):
+    return None if value is None or pd.isna(value) else round(float(value), digits)
+
+
+def bucket(frame, period="day"):
+    """
+    Sums a frame of subject, day, score_sum and score_count rows into one row per
+    subject and period start, with the period's average score.
+    """
+    start = pd.to_datetime(frame["day"])
+    if period != "day":
+        start = start.dt.to_period(PERIODS[period]).dt.start_time
+    grouped = frame.assign(date=start).groupby(["subject", "date"], sort=True)[["score_sum", "score_count"]].sum()
+    grouped = grouped.reset_index()
+    grouped["average"] = grouped["score_sum"] / grouped["score_count"]
+    return grouped
+
+
+def rolling_averages(points, window_days=DEFAULT_WINDOW_DAYS):
+    """
+    Adds rollingAverage: the average of every score in the window_days up to and
+    including each point, weighted by how many scores each point holds. points must be
+    sorted by subject and date, as bucket() returns them.
+    """
+    # One sorted key per point, subjects far apart, so a single searchsorted finds
+    # where every point's window starts without crossing into the previous subject
+    codes = pd.factorize(points["subject"])[0].astype(np.int64)
+    days = (points["date"] - pd.Timestamp(0)).dt.days.to_numpy(dtype=np.int64)
+    key = codes * 10_000_000 + days
+    start = np.searchsorted(key, key - window_days, side="right")
+    sums = np.concatenate(([0.0], np.cumsum(points["score_sum"].to_numpy(dtype=float))))
+    counts = np.concatenate(([0.0], np.cumsum(points["score_count"].to_numpy(dtype=float))))
+    end = np.arange(1, len(points) + 1)
+    return points.assign(rollingAverage=(sums[end] - sums[start]) / (counts[end] - counts[start]))
+
+
+def slopes(points):
+    """
+    Count-weighted least-squares slope of each subject's averages against time, in
+    score points per SLOPE_DAYS days. NaN for subjects with a single point.
+    """
+    x = (points["date"] - points.groupby("subject")["date"].transform("min")).dt.days.astype(float)
+    w = points["score_count"].astype(float)
+    y = points["average"]
+    sums = pd.DataFrame({
+        "subject": points["subject"], "w": w, "wx": w * x, "wy": w * y, "wxx": w * x * x, "wxy": w * x * y
+    }).groupby("subject", sort=False).sum()
+    denominator = sums["w"] * sums["wxx"] - sums["wx"] ** 2
+    slope = (sums["w"] * sums["wxy"] - sums["wx"] * sums["wy"]) / denominator.where(denominator > 0)
+    return slope * SLOPE_DAYS
+
+
+def declining_students(declining, min_subjects):
+    """
+    Groups (year, branch, section, rollNumber, subject, slope) rows of subjects already
+    found to be declining into one row per student with at least min_subjects of them:
+    decliningSubjects, slope (mean over those subjects), worstSubject and worstSlope,
+    steepest decline first.
+    """
+    columns = ["year", "branch", "section", "rollNumber", "decliningSubjects", "slope", "worstSubject", "worstSlope"]
+    student = ["year", "branch", "section", "rollNumber"]
+    counts = declining.groupby(student, sort=False)["subject"].transform("size")
+    declining = declining[counts >= min_subjects]
+    if declining.empty:
+        return pd.DataFrame(columns=columns)
+    grouped = declining.groupby(student, sort=False)
+    worst = declining.loc[grouped["slope"].idxmin()].set_index(student)
+    flagged = pd.DataFrame({
+        "decliningSubjects": grouped.size(),
+        "slope": grouped["slope"].mean(),
+        "worstSubject": worst["subject"],
+        "worstSlope": worst["slope"]
+    }).reset_index()
+    return flagged.sort_values(["slope", "rollNumber"])[columns].reset_index(drop=True)
+
+
+def compute_trends(frame, period="day", window_days=DEFAULT_WINDOW_DAYS):
+    """
+    Returns one trend dict per subject, ordered by subject: its points (date, average,
+    rollingAverage, count), slope, first and latest rolling averages, delta (latest
+    minus first) and recentDelta (latest minus the previous point).
+    """
+    if frame.empty:
+        return []
+    points = rolling_averages(bucket(frame, period), window_days)
+    slope = slopes(points)
+    grouped = points.groupby("subject", sort=True)
+    first = grouped["rollingAverage"].first()
+    latest = grouped["rollingAverage"].last()
+    previous = grouped["rollingAverage"].nth(-2)
+    previous = pd.Series(previous.to_numpy(), index=points.loc[previous.index, "subject"])
+
+    dates = points["date"].dt.strftime("%Y-%m-%d").tolist()
+    averages = np.round(points["average"].to_numpy(), 2).tolist()
+    rolling = np.round(points["rollingAverage"].to_numpy(), 2).tolist()
+    counts = points["score_count"].astype(int).tolist()
+    indices = grouped.indices
+    trends = []
+    for subject in first.index:
+        rows = indices[subject]
+        trends.append({
+            "subject": subject,
+            "points": [
+                {"date": dates[i], "average": averages[i], "rollingAverage": rolling[i], "count": counts[i]}
+                for i in rows
+            ],
+            "slopePer30Days": _round(slope.get(subject)),
+            "first": _round(first[subject]),
+            "latest": _round(latest[subject]),
+            "delta": _round(latest[subject] - first[subject]),
+            "recentDelta": _round(latest[subject] - previous[subject]) if subject in previous.index else None
+        })
+    return trends
@@ -0,0 +1,200 @@
+"""
+Background job queue for marks uploads.
+Jobs are persisted in a local SQLite file so queued or interrupted work survives a
+restart, and a small thread pool runs the parse/score/insert pipeline outside of
+the request that submitted it.
+"""
+
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Only the first MAX_STORED_ERRORS row errors are kept per job; the total is always counted
+MAX_STORED_ERRORS = 200
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class JobProgress:
+    """Progress reporter handed to job handlers; writes through to the queue database."""
+
+    def __init__(self, job_queue, job_id):
+        self._queue = job_queue
+        self.job_id = job_id
+
+    def update(self, rows_processed, errors=None, total_rows=None):
+        self._queue.record_progress(self.job_id, rows_processed, errors, total_rows)
+
+
+class UploadJobQueue:
+    """
+    SQLite-backed FIFO job queue with a fixed pool of worker threads.
+    handler(params, progress) does the actual work and returns a JSON-serializable stats dict.
+    """
+
+    def __init__(self, db_path, handler, workers=2):
+        self.db_path = db_path
+        self.handler = handler
+        self.workers = workers
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        """Yields a connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS upload_jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    rows_processed INTEGER NOT NULL DEFAULT 0,
+                    total_rows INTEGER,
+                    error_count INTEGER NOT NULL DEFAULT 0,
+                    errors TEXT NOT NULL DEFAULT '[]',
+                    stats TEXT,
+                    message TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_upload_jobs_status ON upload_jobs (status, created_at)")
+
+    def start(self):
+        """Requeues jobs interrupted by a restart and starts the worker threads."""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE upload_jobs SET status = ?, rows_processed = 0, error_count = 0, errors = '[]' "
+                "WHERE status = ?",
+                (STATUS_QUEUED, STATUS_RUNNING)
+            )
+            pending = conn.execute(
+                "SELECT id FROM upload_jobs WHERE status = ? ORDER BY created_at", (STATUS_QUEUED,)
+            ).fetchall()
+        for row in pending:
+            self._pending.put(row["id"])
+        if pending:
+            logger.info(f"Recovered {len(pending)} pending upload job(s)")
+
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"upload-job-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Signals the workers to exit once their current job finishes."""
+        for _ in self._threads:
+            self._pending.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def submit(self, params):
+        """Persists a new job and schedules it. Returns the job id."""
+        job_id = uuid.uuid4().hex
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO upload_jobs (id, status, params, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, STATUS_QUEUED, json.dumps(params), datetime.utcnow().isoformat())
+            )
+        self._pending.put(job_id)
+        return job_id
+
+    def record_progress(self, job_id, rows_processed, errors=None, total_rows=None):
+        with self._lock, self._connect() as conn:
+            if errors:
+                row = conn.execute("SELECT errors, error_count FROM upload_jobs WHERE id = ?", (job_id,)).fetchone()
+                stored = json.loads(row["errors"])
+                stored.extend(errors[:max(0, MAX_STORED_ERRORS - len(stored))])
+                conn.execute(
+                    "UPDATE upload_jobs SET errors = ?, error_count = ? WHERE id = ?",
+                    (json.dumps(stored), row["error_count"] + len(errors), job_id)
+                )
+            conn.execute(
+                "UPDATE upload_jobs SET rows_processed = ?, total_rows = COALESCE(?, total_rows) WHERE id = ?",
+                (rows_processed, total_rows, job_id)
+            )
+
+    def get(self, job_id):
+        """Returns a job as a dict, or None if it does not exist."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM upload_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def recent(self, uploadedBy=None, limit=50):
+        """Returns the most recent jobs, optionally only those submitted by one user."""
+        sql = "SELECT * FROM upload_jobs"
+        args = []
+        if uploadedBy:
+            sql += " WHERE json_extract(params, '$.uploadedBy') = ?"
+            args.append(uploadedBy)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        args.append(limit)
+        with self._connect() as conn:
+            rows = conn.execute(sql, args).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row):
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["errors"] = json.loads(job["errors"])
+        job["stats"] = json.loads(job["stats"]) if job["stats"] else None
+        return job
+
+    def _claim(self, job_id):
+        with self._lock, self._connect() as conn:
+            claimed = conn.execute(
+                "UPDATE upload_jobs SET status = ?, started_at = ? WHERE id = ? AND status = ?",
+                (STATUS_RUNNING, datetime.utcnow().isoformat(), job_id, STATUS_QUEUED)
+            ).rowcount
+            if not claimed:
+                return None
+            row = conn.execute("SELECT params FROM upload_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row["params"])
+
+    def _finish(self, job_id, status, stats=None, message=None):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE upload_jobs SET status = ?, stats = ?, message = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(stats) if stats is not None else None, message,
+                 datetime.utcnow().isoformat(), job_id)
+            )
+
+    def _worker(self):
+        while True:
+            job_id = self._pending.get()
+            if job_id is None:
+                return
+            params = self._claim(job_id)
+            if params is None:
+                continue
+            try:
+                stats = self.handler(params, JobProgress(self, job_id))
+                self._finish(job_id, STATUS_DONE, stats=stats)
+            except Exception as e:
+                message = getattr(e, "detail", None) or str(e)
+                logger.error(f"Upload job {job_id} failed: {message}")
+                self._finish(job_id, STATUS_FAILED, message=message)
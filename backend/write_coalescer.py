@@ -0,0 +1,118 @@
+"""
+Write coalescing for bursty request handlers.
+Concurrent requests hand their work items to a WriteCoalescer, and a single writer
+task applies whatever has queued up as one batch, so N simultaneous submissions cost
+one transaction and one commit instead of N commits competing for the writer lock.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteCoalescer:
+    """
+    Groups concurrently submitted items into batches for a single writer task.
+
+    apply_batch(items) is a coroutine returning one outcome per item, in order; an
+    outcome that is an Exception instance is raised to that item's caller only. If
+    apply_batch itself raises, the batch is retried one item at a time so a single
+    bad item cannot fail the requests it happened to be batched with.
+    """
+
+    def __init__(self, name, apply_batch, max_batch=200, max_delay=0.002):
+        self.name = name
+        self.apply_batch = apply_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.items = 0
+        self.largest_batch = 0
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+    def _ensure_running(self):
+        # The writer task is bound to the event loop it was started on
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, item):
+        """Queues an item and waits for its outcome."""
+        self._ensure_running()
+        future = self._loop.create_future()
+        self._queue.put_nowait((item, future))
+        return await future
+
+    async def stop(self):
+        """Applies everything already queued, then stops the writer task."""
+        if self._task is None or self._task.done():
+            return
+        self._queue.put_nowait(_STOP)
+        await self._task
+
+    async def _run(self):
+        while True:
+            first = await self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            stopping = False
+            # Wait briefly for stragglers, then take whatever else is already queued
+            deadline = self._loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    timeout = deadline - self._loop.time()
+                    entry = self._queue.get_nowait() if timeout <= 0 else \
+                        await asyncio.wait_for(self._queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            await self._flush(batch)
+            if stopping:
+                return
+
+    async def _flush(self, batch):
+        items = [item for item, _ in batch]
+        try:
+            outcomes = await self.apply_batch(items)
+        except Exception as e:
+            if len(items) == 1:
+                outcomes = [e]
+            else:
+                logger.warning(f"{self.name}: batch of {len(items)} failed ({e}); retrying items one by one")
+                outcomes = []
+                for item in items:
+                    try:
+                        outcomes.extend(await self.apply_batch([item]))
+                    except Exception as item_error:
+                        outcomes.append(item_error)
+
+        self.batches += 1
+        self.items += len(items)
+        self.largest_batch = max(self.largest_batch, len(items))
+        for (_, future), outcome in zip(batch, outcomes):
+            if future.done():
+                continue  # The caller went away; the write itself has still been applied
+            if isinstance(outcome, Exception):
+                future.set_exception(outcome)
+            else:
+                future.set_result(outcome)
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "batches": self.batches,
+            "items": self.items,
+            "largestBatch": self.largest_batch,
+            "averageBatch": round(self.items / self.batches, 2) if self.batches else None
+        }